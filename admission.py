@@ -0,0 +1,278 @@
+"""
+Admission - Request coalescing and concurrency control for LLM calls.
+
+Every LLM request in the process goes through this layer:
+  - Identical in-flight requests (same model, messages and parameters) are
+    coalesced: one upstream call is made and its stream is fanned out to
+    every waiter, so a burst of members asking the same question after a
+    mailing costs one completion.
+  - At most LLM_MAX_CONCURRENT upstream calls run at once; the rest wait in
+    a first-come, first-served queue and can show their position.
+  - A rate-limit (429) response pauses new admissions for the Retry-After
+    period (or an exponential backoff) and the request is retried.
+  - If a request can't be admitted in time, AdmissionRejected is raised so
+    the caller can serve a degraded answer instead of an error.
+  - Background requests (speculative drafts) never queue: they take a slot
+    only when one is free and nobody is waiting, and are not retried after
+    a 429, so they can't delay a member's turn.
+"""
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+
+from groq import RateLimitError
+
+from llm_client import record_usage
+
+MAX_CONCURRENT = int(os.environ.get("LLM_MAX_CONCURRENT", "8"))
+MAX_QUEUE_WAIT_SECONDS = float(os.environ.get("LLM_MAX_QUEUE_WAIT", "20"))
+RATE_LIMIT_RETRIES = 3
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 16.0
+
+_lock = threading.Lock()
+_inflight = {}
+_stats = {"requests": 0, "coalesced": 0, "upstream": 0, "rate_limited": 0, "rejected": 0, "background_skipped": 0}
+
+
+class AdmissionRejected(Exception):
+    """The request could not be admitted (queue timeout or persistent rate limiting)."""
+
+
+class FairGate:
+    """Counting semaphore that admits waiters strictly in arrival order."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.active = 0
+        self.queue = deque()
+        self.paused_until = 0.0
+        self.cond = threading.Condition()
+
+    def acquire(self, on_position=None, timeout=None):
+        """Wait for a slot. `on_position(n)` is called whenever the queue position changes."""
+        ticket = object()
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        last_position = None
+        with self.cond:
+            self.queue.append(ticket)
+            while True:
+                now = time.monotonic()
+                position = self.queue.index(ticket) + 1
+                if position == 1 and self.active < self.limit and now >= self.paused_until:
+                    self.queue.popleft()
+                    self.active += 1
+                    self.cond.notify_all()
+                    return True
+                if on_position is not None and position != last_position:
+                    on_position(position)
+                    last_position = position
+                if deadline is not None and now >= deadline:
+                    self.queue.remove(ticket)
+                    self.cond.notify_all()
+                    return False
+                wait = None if deadline is None else deadline - now
+                if self.paused_until > now:
+                    pause_left = self.paused_until - now
+                    wait = pause_left if wait is None else min(wait, pause_left)
+                self.cond.wait(wait)
+
+    def try_acquire(self):
+        """Take a slot only if one is free now and nobody is queued for it."""
+        with self.cond:
+            if self.queue or self.active >= self.limit or time.monotonic() < self.paused_until:
+                return False
+            self.active += 1
+            return True
+
+    def release(self):
+        with self.cond:
+            self.active -= 1
+            self.cond.notify_all()
+
+    def pause(self, seconds):
+        """Hold back new admissions (after a rate-limit response)."""
+        with self.cond:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.cond.notify_all()
+
+    def waiting(self):
+        with self.cond:
+            return len(self.queue)
+
+
+_gate = FairGate(MAX_CONCURRENT)
+
+
+class _Flight:
+    """One upstream request and the items it has produced so far."""
+
+    def __init__(self):
+        self.items = []
+        self.position = None
+        self.done = False
+        self.error = None
+        self.usage = None
+        self.cond = threading.Condition()
+
+    def set_position(self, position):
+        with self.cond:
+            self.position = position
+            self.cond.notify_all()
+
+    def push(self, item):
+        with self.cond:
+            self.items.append(item)
+            self.position = None
+            self.cond.notify_all()
+
+    def finish(self, error=None):
+        with self.cond:
+            self.error = error
+            self.done = True
+            self.cond.notify_all()
+
+    def follow(self, on_queue_position=None):
+        """Yield every item from the start, blocking until new ones arrive."""
+        index = 0
+        reported = None
+        while True:
+            with self.cond:
+                while index >= len(self.items) and not self.done and self.position == reported:
+                    self.cond.wait()
+                new_items = self.items[index:]
+                index = len(self.items)
+                position, done, error = self.position, self.done, self.error
+            if position != reported:
+                reported = position
+                if position and on_queue_position is not None:
+                    on_queue_position(position)
+            for item in new_items:
+                yield item
+            if done:
+                if error is not None:
+                    raise error
+                return
+
+
+def _count(name):
+    with _lock:
+        _stats[name] += 1
+
+
+def _request_key(kwargs):
+    payload = json.dumps(kwargs, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _retry_after(error, attempt):
+    """Seconds to wait after a 429: the server's Retry-After, else exponential backoff."""
+    try:
+        return float(error.response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        delay = min(BACKOFF_BASE_SECONDS * (2 ** attempt), BACKOFF_MAX_SECONDS)
+        return delay * (1 + random.random() * 0.25)
+
+
+def _drive(key, flight, client, kwargs, background=False):
+    """Run the upstream call for a flight (in a background thread)."""
+    # Retries are ours (so the gate can pause everyone), not the SDK's
+    client = client.with_options(max_retries=0)
+    try:
+        if background and not _gate.try_acquire():
+            _count("background_skipped")
+            raise AdmissionRejected("Skipped: no free slot for a background request.")
+        if not background and not _gate.acquire(on_position=flight.set_position, timeout=MAX_QUEUE_WAIT_SECONDS):
+            _count("rejected")
+            raise AdmissionRejected("The assistant is very busy right now.")
+        try:
+            for attempt in range(RATE_LIMIT_RETRIES + 1):
+                try:
+                    _count("upstream")
+                    response = client.chat.completions.create(**kwargs)
+                    if kwargs.get("stream"):
+                        for chunk in response:
+                            content = chunk.choices[0].delta.content if chunk.choices else None
+                            if content:
+                                flight.push(content)
+                            # Usage arrives on the final chunk
+                            x_groq = getattr(chunk, "x_groq", None)
+                            usage = getattr(chunk, "usage", None) or getattr(x_groq, "usage", None)
+                            if usage is not None:
+                                flight.usage = usage
+                                record_usage(usage)
+                    else:
+                        flight.usage = getattr(response, "usage", None)
+                        record_usage(flight.usage)
+                        flight.push(response)
+                    break
+                except RateLimitError as e:
+                    _count("rate_limited")
+                    if flight.items or attempt == RATE_LIMIT_RETRIES or background:
+                        _count("rejected")
+                        raise AdmissionRejected("The assistant is rate limited right now.") from e
+                    delay = _retry_after(e, attempt)
+                    print(f"DEBUG: Rate limited, backing off {delay:.1f}s", flush=True)
+                    _gate.pause(delay)
+                    time.sleep(delay)
+        finally:
+            _gate.release()
+        flight.finish()
+    except Exception as e:
+        flight.finish(error=e)
+    finally:
+        with _lock:
+            if _inflight.get(key) is flight:
+                del _inflight[key]
+
+
+def _join_or_start(client, kwargs, background=False):
+    # Background flights are keyed apart, so a member's request never joins one that may be skipped
+    key = _request_key(kwargs) + (":background" if background else "")
+    with _lock:
+        _stats["requests"] += 1
+        flight = _inflight.get(key)
+        if flight is not None:
+            _stats["coalesced"] += 1
+            return flight
+        flight = _Flight()
+        _inflight[key] = flight
+    threading.Thread(target=_drive, args=(key, flight, client, kwargs, background), daemon=True).start()
+    return flight
+
+
+def stream_chat(client, on_queue_position=None, on_usage=None, background=False, **kwargs):
+    """Streamed chat completion through the admission layer; yields content strings.
+
+    `on_queue_position(n)` is called from the caller's thread while waiting.
+    `on_usage(usage)` gets the token usage the backend reported, once the
+    stream has ended (coalesced requests all get the shared call's usage).
+    `background=True` raises AdmissionRejected at once instead of queueing.
+    """
+    kwargs["stream"] = True
+    flight = _join_or_start(client, kwargs, background)
+    yield from flight.follow(on_queue_position)
+    if on_usage is not None and flight.usage is not None:
+        on_usage(flight.usage)
+
+
+def complete_chat(client, **kwargs):
+    """Non-streamed chat completion through the admission layer."""
+    kwargs["stream"] = False
+    flight = _join_or_start(client, kwargs)
+    for response in flight.follow():
+        return response
+    raise AdmissionRejected("No response from the assistant.")
+
+
+def get_admission_stats():
+    with _lock:
+        stats = dict(_stats)
+        stats["inflight"] = len(_inflight)
+    stats["queued"] = _gate.waiting()
+    stats["active"] = _gate.active
+    return stats
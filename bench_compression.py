@@ -0,0 +1,163 @@
+"""
+Benchmark: prompt size, time-to-first-token and answers with sentence-level
+context compression.
+
+Builds the Member shard from scraped_content.json (deduplicated, as
+embedder.py does) into a temp directory, plus its sentence index. Each
+benchmark query is retrieved as the app retrieves it (3x candidates, MMR
+top 3), and the CONTEXT block is built from whole articles and again at
+several CONTEXT_BUDGET_TOKENS. For each setting the benchmark reports:
+
+  ctx tokens    approximate tokens in the CONTEXT block
+  extract ms    time spent in SentenceIndex.compress per query
+  kept          queries whose expected article still has a sentence in the context
+
+With --llm (needs GROQ_API_KEY; LLM_BASE_URL works too), every prompt is
+also sent to the model. The benchmark then reports time to first token and
+how far the answers drift from the whole-article answers (token F1). It
+also counts "I cannot find that information" answers.
+
+Usage:
+    python bench_compression.py [--llm] [budgets...]
+"""
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import compression
+import dedup
+import mmap_index
+from bench_dedup import context_text, embed_items
+from retrieval import EMBEDDING_MODEL, MMR_CANDIDATES, MMR_LAMBDA, get_embedding_function
+
+INPUT_FILE = "data/scraped_content.json"
+BENCHMARK_FILE = "data/benchmark_queries.json"
+CATEGORY = "Member"
+N_RESULTS = 3
+DEFAULT_BUDGETS = (200, 400, 600)
+MODEL_NAME = "llama-3.1-8b-instant"
+NOT_FOUND = "cannot find that information"
+SYSTEM_PROMPT = (
+    "You are a helpful assistant for a pensions Help Center. Answer ONLY from the CONTEXT below. "
+    "Always format links as Markdown. If the answer is not in the context, say "
+    "'I cannot find that information in the help articles provided.'\n\nCONTEXT:\n"
+)
+
+
+def build_index(directory):
+    with open(INPUT_FILE, "r", encoding="utf-8") as f:
+        items = [item for item in json.load(f) if item["category"] == CATEGORY]
+    items, _ = dedup.dedupe_corpus(items)
+    ids, vectors, documents, metadatas = embed_items(items)
+    mmap_index.write_shard(directory, CATEGORY, ids, vectors, documents, metadatas)
+    start = time.perf_counter()
+    sentences = compression.write_sentence_index(directory, CATEGORY, ids, documents, get_embedding_function())
+    print(f"{len(ids)} articles, {sentences} sentences embedded in {time.perf_counter() - start:.1f} s "
+          f"({EMBEDDING_MODEL})")
+    return mmap_index.MmapShard(directory, CATEGORY), compression.SentenceIndex(directory, CATEGORY)
+
+
+def retrieve(shard, vector):
+    candidates = shard.query(vector, N_RESULTS * MMR_CANDIDATES, include_embeddings=True)
+    picked = dedup.mmr(vector, candidates["embeddings"][0], N_RESULTS, MMR_LAMBDA)
+    return {field: [candidates[field][0][i] for i in picked] for field in ("ids", "documents", "metadatas")}
+
+
+def token_f1(a, b):
+    a, b = re.findall(r"\w+", a.lower()), re.findall(r"\w+", b.lower())
+    if not a or not b:
+        return 0.0
+    common = sum(min(a.count(w), b.count(w)) for w in set(a))
+    if not common:
+        return 0.0
+    precision, recall = common / len(a), common / len(b)
+    return 2 * precision * recall / (precision + recall)
+
+
+def ask(client, query, context):
+    """(time to first token in ms, full answer) for one prompt."""
+    start = time.perf_counter()
+    ttft, parts = None, []
+    stream = client.chat.completions.create(
+        model=MODEL_NAME, temperature=0, max_tokens=300, stream=True,
+        messages=[{"role": "system", "content": SYSTEM_PROMPT + context}, {"role": "user", "content": query}],
+    )
+    for chunk in stream:
+        delta = chunk.choices[0].delta.content if chunk.choices else None
+        if delta:
+            if ttft is None:
+                ttft = (time.perf_counter() - start) * 1000
+            parts.append(delta)
+    return ttft or (time.perf_counter() - start) * 1000, "".join(parts)
+
+
+def main(args):
+    use_llm = "--llm" in args
+    budgets = [int(a) for a in args if not a.startswith("--")] or list(DEFAULT_BUDGETS)
+    with open(BENCHMARK_FILE, "r", encoding="utf-8") as f:
+        queries = json.load(f)
+
+    client = None
+    if use_llm:
+        from llm_client import get_llm_client
+
+        client = get_llm_client(os.environ.get("GROQ_API_KEY"))
+
+    directory = tempfile.mkdtemp(prefix="bench_compression_")
+    try:
+        shard, sentence_index = build_index(directory)
+        vectors = np.asarray(get_embedding_function()([q["query"] for q in queries]), dtype=np.float32)
+        retrieved = [retrieve(shard, vector) for vector in vectors]
+
+        print(f"\n{len(queries)} benchmark queries, top {N_RESULTS}")
+        header = f"  {'Budget':<8} {'Ctx tokens':>10} {'Extract ms':>10} {'Kept':>6}"
+        if use_llm:
+            header += f" {'TTFT ms':>8} {'F1 vs whole':>11} {'Not found':>9}"
+        print(header)
+
+        reference_answers = None
+        for budget in [None] + budgets:
+            tokens, extract_ms, kept, ttfts, f1s, not_found, answers = [], [], 0, [], [], 0, []
+            for item, vector, results in zip(queries, vectors, retrieved):
+                documents = results["documents"]
+                if budget is not None:
+                    start = time.perf_counter()
+                    documents = sentence_index.compress(vector, results["ids"], documents, budget) or documents
+                    extract_ms.append((time.perf_counter() - start) * 1000)
+                documents = dedup.drop_repeated_passages(documents)
+                context = context_text(documents, results["metadatas"])
+                tokens.append(dedup.approx_tokens(context))
+                for document, meta in zip(documents, results["metadatas"]):
+                    if meta["url"] == item["expected_url"] and len(document.split("\n\n", 1)[-1]) > 0:
+                        kept += 1
+                if client is not None:
+                    ttft, answer = ask(client, item["query"], context)
+                    ttfts.append(ttft)
+                    answers.append(answer)
+                    not_found += NOT_FOUND in answer.lower()
+                    if reference_answers is not None:
+                        f1s.append(token_f1(answer, reference_answers[len(answers) - 1]))
+            if client is not None and reference_answers is None:
+                reference_answers = answers
+
+            label = "whole" if budget is None else str(budget)
+            line = (f"  {label:<8} {np.mean(tokens):>10.0f} "
+                    f"{(np.mean(extract_ms) if extract_ms else 0.0):>10.2f} {kept:>3}/{len(queries):<2}")
+            if client is not None:
+                f1 = f"{np.mean(f1s):.2f}" if f1s else "-"
+                line += f" {np.median(ttfts):>8.0f} {f1:>11} {not_found:>9}"
+            print(line)
+        if client is None:
+            print("\n(Run with --llm and GROQ_API_KEY set to measure time to first token and answer drift.)")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
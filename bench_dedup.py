@@ -0,0 +1,139 @@
+"""
+Benchmark: index size and prompt tokens with near-duplicate removal.
+
+Embeds scraped_content.json twice, once as scraped and once after
+dedup.dedupe_corpus. Both copies are written in the mmap format to a temp
+directory. The benchmark queries are then run through:
+
+  raw                 as-scraped index, plain top-3
+  dedup               deduplicated index, plain top-3
+  dedup + mmr         deduplicated index, MMR over 3x candidates
+  dedup + mmr + ctx   the above with drop_repeated_passages at prompt time
+                      (what the app does)
+
+For each one it reports context tokens per prompt (the CONTEXT block built
+as in chatbot.build_context) and how many passages in that context repeat
+another one. It also reports the hit rate of the expected article, counting
+URLs recorded as its duplicates, so savings don't cost recall.
+
+Usage:
+    python bench_dedup.py [category]
+"""
+import json
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+
+import dedup
+import mmap_index
+from retrieval import MMR_CANDIDATES, MMR_LAMBDA, get_embedding_function
+
+INPUT_FILE = "data/scraped_content.json"
+BENCHMARK_FILE = "data/benchmark_queries.json"
+N_RESULTS = 3
+
+
+def embed_items(items):
+    texts = [f"Header: {item['header']}\n\n{item['content']}" for item in items]
+    vectors = np.asarray(get_embedding_function()(texts), dtype=np.float32)
+    metadatas = []
+    for item in items:
+        metadata = {"url": item["url"], "category": item["category"], "header": item["header"]}
+        if item.get("duplicate_urls"):
+            metadata["duplicate_urls"] = " ".join(item["duplicate_urls"])
+        metadatas.append(metadata)
+    return [str(i) for i in range(len(items))], vectors, texts, metadatas
+
+
+def context_text(documents, metadatas):
+    """Same layout as chatbot.build_context."""
+    return "\n---\n".join(
+        f"Source ({meta['category']}): {meta['header']}\n{doc}" for doc, meta in zip(documents, metadatas)
+    )
+
+
+def repeated_passages(documents):
+    """Passages (long enough to count) that near-duplicate an earlier one in the same context."""
+    seen, repeats = [], 0
+    for document in documents:
+        for _, text in dedup.split_passages(document):
+            if len(text) < dedup.MIN_PASSAGE_CHARS:
+                continue
+            fingerprint = dedup.simhash(text)
+            if any(dedup.hamming64(fingerprint, s) <= dedup.SIMHASH_MAX_DISTANCE for s in seen):
+                repeats += 1
+            seen.append(fingerprint)
+    return repeats
+
+
+def run_config(shard, queries, query_vectors, diverse, drop_repeats):
+    tokens, repeats, hits = [], [], 0
+    for item, vector in zip(queries, query_vectors):
+        if diverse:
+            candidates = shard.query(vector, N_RESULTS * MMR_CANDIDATES, include_embeddings=True)
+            picked = dedup.mmr(vector, candidates["embeddings"][0], N_RESULTS, MMR_LAMBDA)
+            documents = [candidates["documents"][0][i] for i in picked]
+            metadatas = [candidates["metadatas"][0][i] for i in picked]
+        else:
+            results = shard.query(vector, N_RESULTS)
+            documents, metadatas = results["documents"][0], results["metadatas"][0]
+        if drop_repeats:
+            documents = dedup.drop_repeated_passages(documents)
+        tokens.append(dedup.approx_tokens(context_text(documents, metadatas)))
+        repeats.append(repeated_passages(documents))
+        urls = set()
+        for meta in metadatas:
+            urls.add(meta["url"])
+            urls.update(meta.get("duplicate_urls", "").split())
+        hits += item["expected_url"] in urls
+    return np.mean(tokens), np.mean(repeats), hits / len(queries)
+
+
+def main(category="Member"):
+    with open(INPUT_FILE, "r", encoding="utf-8") as f:
+        items = [item for item in json.load(f) if item["category"] == category]
+    with open(BENCHMARK_FILE, "r", encoding="utf-8") as f:
+        queries = json.load(f)
+    deduped, report = dedup.dedupe_corpus(items)
+
+    print(f"{category} index        {'Articles':>8} {'Chars':>8} {'~Tokens':>8} {'Vector KB':>9}")
+    corpora = {"raw": items, "dedup": deduped}
+    rows = {}
+    for name, corpus in corpora.items():
+        rows[name] = embed_items(corpus)
+        chars = sum(len(text) for text in rows[name][2])
+        tokens = sum(dedup.approx_tokens(text) for text in rows[name][2])
+        print(f"  {name:<18} {len(corpus):>8} {chars:>8} {tokens:>8} {rows[name][1].nbytes / 1024:>9.1f}")
+    print(f"  ({report['documents_dropped']} duplicate articles dropped, {report['boilerplate_groups']} "
+          f"boilerplate groups, {report['passages_factored']} passages factored out)\n")
+
+    query_vectors = np.asarray(get_embedding_function()([q["query"] for q in queries]), dtype=np.float32)
+    directory = tempfile.mkdtemp(prefix="bench_dedup_")
+    try:
+        shards = {}
+        for name, (ids, vectors, texts, metadatas) in rows.items():
+            mmap_index.write_shard(f"{directory}/{name}", category, ids, vectors, texts, metadatas)
+            shards[name] = mmap_index.MmapShard(f"{directory}/{name}", category)
+
+        configs = [
+            ("raw", "raw", False, False),
+            ("dedup", "dedup", False, False),
+            ("dedup + mmr", "dedup", True, False),
+            ("dedup + mmr + ctx", "dedup", True, True),
+        ]
+        print(f"{len(queries)} benchmark queries, top {N_RESULTS} (MMR lambda {MMR_LAMBDA})")
+        print(f"  {'Config':<18} {'Ctx tokens':>10} {'Repeats':>8} {'Hit@3':>6}")
+        baseline = None
+        for name, corpus, diverse, drop_repeats in configs:
+            tokens, repeats, hit_rate = run_config(shards[corpus], queries, query_vectors, diverse, drop_repeats)
+            baseline = baseline or tokens
+            print(f"  {name:<18} {tokens:>10.0f} {repeats:>8.2f} {hit_rate:>6.2f}"
+                  f"   ({100 * (1 - tokens / baseline):+.1f}% tokens saved)")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
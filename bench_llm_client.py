@@ -0,0 +1,129 @@
+"""
+Benchmark: a new Groq() per Streamlit rerun vs the pooled llm_client.
+
+Starts a local mock of the chat completions endpoint that counts accepted
+connections and adds a fixed delay to each new connection (standing in
+for the TCP + TLS handshake to the real API), then replays chat turns:
+one streamed answer plus one follow-up prediction per turn.
+
+Usage:
+    python bench_llm_client.py [turns] [handshake_ms]
+"""
+import json
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from groq import Groq
+
+import llm_client
+
+MODEL_NAME = "llama-3.1-8b-instant"
+STREAM_TOKENS = ["To ", "opt ", "out, ", "log ", "in ", "to ", "your ", "account."]
+
+
+class MockCompletionsHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if body.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for token in STREAM_TOKENS:
+                chunk = {
+                    "id": "mock", "object": "chat.completion.chunk", "created": 0, "model": MODEL_NAME,
+                    "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+                }
+                self._write_chunk(f"data: {json.dumps(chunk)}\n\n")
+            self._write_chunk("data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+        else:
+            payload = json.dumps({
+                "id": "mock", "object": "chat.completion", "created": 0, "model": MODEL_NAME,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "Opting Out"}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 10, "completion_tokens": 2, "total_tokens": 12},
+            }).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+    def _write_chunk(self, text):
+        data = text.encode()
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def log_message(self, *args):
+        pass
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, handshake_ms):
+        super().__init__(("127.0.0.1", 0), MockCompletionsHandler)
+        self.handshake_ms = handshake_ms
+        self.connections = 0
+
+    def get_request(self):
+        request = super().get_request()
+        self.connections += 1
+        time.sleep(self.handshake_ms / 1000)  # Stand-in for TCP + TLS setup
+        return request
+
+
+def run_turn(client):
+    start = time.perf_counter()
+    stream = client.chat.completions.create(
+        model=MODEL_NAME, messages=[{"role": "user", "content": "How do I opt out?"}], stream=True
+    )
+    answer = "".join(chunk.choices[0].delta.content or "" for chunk in stream)
+    client.chat.completions.create(
+        model=MODEL_NAME, messages=[{"role": "user", "content": f"Follow-up for: {answer}"}], stream=False
+    )
+    return (time.perf_counter() - start) * 1000
+
+
+def main(turns=50, handshake_ms=50.0):
+    server = MockServer(handshake_ms)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    print(f"Mock endpoint {base_url} (handshake {handshake_ms:.0f} ms), {turns} turns\n")
+
+    results = {}
+
+    # Previous behaviour: chatbot.py built Groq() at the top of every rerun
+    server.connections = 0
+    latencies = [run_turn(Groq(api_key="mock", base_url=base_url)) for _ in range(turns)]
+    results["Groq() per rerun"] = (latencies, server.connections)
+
+    # Shared pooled client
+    llm_client.BASE_URL = base_url
+    llm_client.reset_llm_client()
+    client = llm_client.get_llm_client("mock")
+    server.connections = 0
+    latencies = [run_turn(client) for _ in range(turns)]
+    results["pooled llm_client"] = (latencies, server.connections)
+
+    print(f"{'Client':<20} {'Connections':>11} {'Mean ms/turn':>13} {'p50':>8} {'p95':>8}")
+    for name, (latencies, connections) in results.items():
+        ordered = sorted(latencies)
+        print(f"{name:<20} {connections:>11} {statistics.mean(latencies):>13.1f} "
+              f"{ordered[len(ordered) // 2]:>8.1f} {ordered[int(len(ordered) * 0.95) - 1]:>8.1f}")
+
+    saved = statistics.mean(results["Groq() per rerun"][0]) - statistics.mean(results["pooled llm_client"][0])
+    print(f"\nSaved per turn: {saved:.1f} ms")
+    print(f"Client health: {llm_client.get_llm_health()}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(int(args[0]) if args else 50, float(args[1]) if len(args) > 1 else 50.0)
@@ -0,0 +1,148 @@
+"""
+Benchmark: prompt-prefix stability of the answer prompt (prompts.py).
+
+Starts a local mock of the streaming chat completions endpoint that, like
+real providers, reports as cached the prompt tokens (in whole blocks) of
+the longest prefix it has seen before. Then replays a conversation whose
+context, history and date change every turn, once with the previous layout
+(date first, everything in one system message) and once with
+prompts.answer_messages, and checks that the first message is
+byte-identical on every turn and reused from the second turn on.
+
+Usage:
+    python bench_prompts.py [turns]
+"""
+import json
+import sys
+import threading
+from datetime import datetime, timedelta
+
+from prompts import ANSWER_INSTRUCTIONS, answer_messages, format_recent
+
+CACHE_BLOCK_TOKENS = 32  # The mock caches whole blocks, like real providers
+
+
+def _serialize(messages):
+    return "".join(f"<|{m['role']}|>{m['content']}" for m in messages)
+
+
+def start_mock_backend():
+    """Streaming chat endpoint that reports cached tokens for the longest prefix seen before."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    from dedup import approx_tokens
+
+    seen, requests_log = [], []
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            prompt = _serialize(body["messages"])
+            shared = max((len(_common_prefix(prompt, old)) for old in seen), default=0)
+            seen.append(prompt)
+            requests_log.append(body["messages"])
+            prompt_tokens = approx_tokens(prompt)
+            cached = approx_tokens(prompt[:shared]) // CACHE_BLOCK_TOKENS * CACHE_BLOCK_TOKENS
+            usage = {
+                "prompt_tokens": prompt_tokens, "completion_tokens": 3, "total_tokens": prompt_tokens + 3,
+                "prompt_tokens_details": {"cached_tokens": min(cached, prompt_tokens)},
+            }
+            chunks = [
+                {"choices": [{"index": 0, "delta": {"content": "You can "}, "finish_reason": None}]},
+                {"choices": [{"index": 0, "delta": {"content": "opt out."}, "finish_reason": None}]},
+                {"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}], "x_groq": {"usage": usage}},
+            ]
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for chunk in chunks:
+                chunk.update({"id": "mock", "object": "chat.completion.chunk", "created": 0, "model": body["model"]})
+                data = f"data: {json.dumps(chunk)}\n\n".encode()
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            data = b"data: [DONE]\n\n"
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n0\r\n\r\n")
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, requests_log
+
+
+def _common_prefix(a, b):
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        n += 1
+    return a[:n]
+
+
+def legacy_messages(query, context_text, date_result="", summary="", history=(), today=None):
+    """The previous layout: date first, everything in one system message."""
+    today = today or datetime.now()
+    conversation = f"\n\nEARLIER CONVERSATION (summary):\n{summary}\n" if summary else ""
+    recent = format_recent(list(history))
+    if recent:
+        conversation += "\n\nRECENT CONVERSATION:\n" + recent
+    date_block = f"\n\n*** DATE CALCULATION RESULT ***\n{date_result}\n" if date_result else ""
+    system = (f"You are a helpful and strict assistant for a Help Center. TODAY'S DATE: {today.strftime('%d %B %Y')}\n"
+              + ANSWER_INSTRUCTIONS.split("\n", 1)[1] + "\n\nCONTEXT:\n" + context_text + date_block + conversation)
+    return [{"role": "system", "content": system}, {"role": "user", "content": query}]
+
+
+def check(turns=8):
+    """Replay a conversation (changing context, history and date) against the mock and assert prefix stability."""
+    import admission
+    import llm_client
+
+    server, requests_log = start_mock_backend()
+    llm_client.BASE_URL = f"http://127.0.0.1:{server.server_address[1]}"
+    llm_client.reset_llm_client()
+    client = llm_client.get_llm_client("mock")
+
+    with open("data/scraped_content.json", "r", encoding="utf-8") as f:
+        articles = json.load(f)
+    start_day = datetime(2026, 1, 30, 23, 0)
+
+    results = {}
+    for name, build in (("previous layout", legacy_messages), ("static prefix", answer_messages)):
+        before = llm_client.get_prompt_cache_stats()
+        history, first_messages = [], []
+        for turn in range(turns):
+            article = articles[(turn * 7 + len(name)) % len(articles)]
+            query = f"{article['header']} (turn {turn})"
+            history.append({"role": "user", "content": query})
+            messages = build(
+                query, f"Source (Member): {article['header']}\n{article['content'][:1200]}",
+                date_result="Your opt-out period ends on 5 March 2026." if turn % 3 == 0 else "",
+                summary="Member asked about opting out." if turn >= 4 else "",
+                history=history, today=start_day + timedelta(hours=turn),  # Crosses midnight
+            )
+            answer = "".join(admission.stream_chat(client, model="mock-model", messages=messages, temperature=0.3))
+            history.append({"role": "assistant", "content": answer})
+            first_messages.append(requests_log[-1][0]["content"])
+        after = llm_client.get_prompt_cache_stats()
+        prompt = after["prompt_tokens"] - before["prompt_tokens"]
+        cached = after["cached_prompt_tokens"] - before["cached_prompt_tokens"]
+        results[name] = (prompt, cached, len(set(first_messages)))
+
+    server.shutdown()
+    print(f"{turns} turns per layout (context, history and date change every turn)\n")
+    print(f"{'Layout':<16} {'Prompt tokens':>13} {'Cached':>8} {'Cached %':>9} {'Distinct first messages':>24}")
+    for name, (prompt, cached, distinct) in results.items():
+        print(f"{name:<16} {prompt:>13} {cached:>8} {100 * cached / max(prompt, 1):>8.1f}% {distinct:>24}")
+
+    prompt, cached, distinct = results["static prefix"]
+    assert distinct == 1, "The first message changed between turns"
+    static_tokens = CACHE_BLOCK_TOKENS * (len(ANSWER_INSTRUCTIONS.split()) // CACHE_BLOCK_TOKENS)
+    assert cached >= (turns - 1) * static_tokens, "Turns after the first did not reuse the static prefix"
+    print("\nOK: the static prefix is byte-identical on every turn and reused from the second turn on.")
+
+
+if __name__ == "__main__":
+    check(int(sys.argv[1]) if len(sys.argv) > 1 else 8)
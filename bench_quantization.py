@@ -0,0 +1,96 @@
+"""
+Benchmark: recall vs memory of the quantized first pass in mmap_index.
+
+Expands the Member shard built from scraped_content.json into a larger
+synthetic corpus (every article repeated `scale` times with jittered
+vectors, as in bench_workers.py), exports it in the mmap format and runs
+the same queries through every first pass:
+
+  none     exact scan over the float32 vectors
+  int8     scan over per-row int8 codes, rescore shortlist in float32
+  binary   Hamming scan over packed sign bits, rescore shortlist in float32
+
+Recall@k is the overlap with the exact top-k. "Scanned MB" is what the
+first pass reads on every query (what has to stay resident to be fast);
+the float32 rows are only read for the shortlist.
+
+Usage:
+    python bench_quantization.py [scale] [queries]
+"""
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import mmap_index
+from bench_workers import CATEGORY, expand_rows, load_base_rows
+
+K_VALUES = (3, 10)
+# (first pass, rescore factor): the shortlist is max(factor x k, MIN_SHORTLIST) rows
+CONFIGS = [("none", 10), ("int8", 10), ("binary", 10), ("binary", 50)]
+QUERY_NOISE = 0.03
+
+
+def query_vectors(rows, n_queries, seed=7):
+    """Benchmark questions plus jittered corpus vectors (near-duplicate heavy: the hard case)."""
+    import json
+
+    from retrieval import get_embedding_function
+
+    with open("data/benchmark_queries.json", "r", encoding="utf-8") as f:
+        texts = [item["query"] for item in json.load(f)]
+    queries = [np.asarray(v, dtype=np.float32) for v in get_embedding_function()(texts)]
+    rng = np.random.default_rng(seed)
+    vectors = rows[1]
+    for row in rng.choice(len(vectors), max(n_queries - len(queries), 0), replace=False):
+        q = vectors[row] + rng.normal(0, QUERY_NOISE, vectors.shape[1]).astype(np.float32)
+        queries.append(q / np.linalg.norm(q))
+    return queries[:n_queries]
+
+
+def scanned_mb(shard, quantization):
+    if quantization == "none":
+        arrays = [shard.vectors, shard.sqnorms]
+    elif quantization == "int8":
+        arrays = shard.codes("int8") + [shard.sqnorms]
+    else:
+        arrays = shard.codes("binary")[:1]
+    return sum(a.nbytes for a in arrays) / 1024 / 1024
+
+
+def main(scale=500, n_queries=200):
+    rows = expand_rows(load_base_rows(), scale)
+    directory = tempfile.mkdtemp(prefix="bench_quant_")
+    try:
+        mmap_index.write_shard(directory, CATEGORY, *rows)
+        shard = mmap_index.MmapShard(directory, CATEGORY)
+        queries = query_vectors(rows, n_queries)
+        k_max = max(K_VALUES)
+        truth = [shard.query(q, k_max)["ids"][0] for q in queries]
+
+        print(f"{len(shard)} vectors x {shard.vectors.shape[1]} dims, {len(queries)} queries\n")
+        header = f"{'First pass':<10} {'Rescore':>7} {'Scanned MB':>10} {'ms/query':>9}"
+        header += "".join(f" {f'Recall@{k}':>10}" for k in K_VALUES)
+        print(header)
+        for quantization, factor in CONFIGS:
+            mmap_index.RESCORE_FACTOR = factor
+            recalls = {k: [] for k in K_VALUES}
+            elapsed = 0.0
+            for q, expected in zip(queries, truth):
+                for k in K_VALUES:
+                    start = time.perf_counter()
+                    ids = shard.query(q, k, quantization=quantization)["ids"][0]
+                    elapsed += time.perf_counter() - start
+                    recalls[k].append(len(set(ids) & set(expected[:k])) / k)
+            ms = elapsed * 1000 / (len(queries) * len(K_VALUES))
+            line = f"{quantization:<10} {f'{factor}x' if quantization != 'none' else '-':>7} {scanned_mb(shard, quantization):>10.1f} {ms:>9.2f}"
+            line += "".join(f" {np.mean(recalls[k]):>10.3f}" for k in K_VALUES)
+            print(line)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main(*(int(a) for a in sys.argv[1:]))
@@ -0,0 +1,90 @@
+"""
+Benchmark: server-side chat render time against history length.
+
+Runs a small Streamlit script under streamlit.testing (the real element
+and protobuf code path, no browser) that draws a conversation of N
+messages three ways, timing only the rendering:
+
+  per-message elements   the previous chatbot.py loop: chat bubble +
+                         st.markdown + st.caption for every message,
+                         twice per turn (the extra st.rerun())
+  full run               chat_view.render_messages: one cached markdown
+                         element per message, once per turn
+  fragment run           what a follow-up click redraws: only the
+                         messages added since the last full run
+
+Usage:
+    python bench_render.py [lengths...]
+"""
+import sys
+
+from streamlit.testing.v1 import AppTest
+
+DEFAULT_LENGTHS = [10, 25, 50, 100, 200]
+REPEATS = 5
+
+
+def render_script():
+    import json
+    import time
+
+    import streamlit as st
+
+    import chat_view
+    import conversation_store
+    from conversation_store import ConversationStore
+
+    mode = st.query_params["mode"]
+    n_messages = int(st.query_params["n"])
+    if "conversation" not in st.session_state:
+        # Lift the cap so render cost can be measured at any length
+        conversation_store.MAX_RECENT_MESSAGES = n_messages + 1
+        with open("data/scraped_content.json", "r", encoding="utf-8") as f:
+            articles = json.load(f)
+        conversation = ConversationStore()
+        for i in range(n_messages):
+            article = articles[i % len(articles)]
+            if i % 2:
+                conversation.append("assistant", article["content"][:1200])
+            else:
+                conversation.append("user", article["header"])
+        st.session_state.conversation = conversation
+    conversation = st.session_state.conversation
+
+    start = time.perf_counter()
+    if mode == "per-message elements":
+        for _ in range(2):
+            for message in conversation.messages:
+                with st.chat_message(message["role"]):
+                    st.markdown(message["content"])
+                    st.caption(f"_{message['timestamp']}_")
+    elif mode == "full run":
+        chat_view.render_messages(conversation)
+    else:
+        chat_view.render_messages(conversation, after_id=conversation.last["id"] - 2)
+    st.session_state.render_ms = (time.perf_counter() - start) * 1000
+
+
+def measure(mode, n_messages):
+    at = AppTest.from_function(render_script, default_timeout=60)
+    at.query_params["mode"] = mode
+    at.query_params["n"] = n_messages
+    at.run()  # Builds the conversation and warms the display cache
+    timings = []
+    for _ in range(REPEATS):
+        at.run()
+        timings.append(at.session_state.render_ms)
+    return min(timings)
+
+
+def main(lengths):
+    modes = ["per-message elements", "full run", "fragment run"]
+    print(f"Render ms per turn (best of {REPEATS})\n")
+    print(f"{'Messages':>8} " + " ".join(f"{mode:>21}" for mode in modes))
+    for n_messages in lengths:
+        row = [measure(mode, n_messages) for mode in modes]
+        print(f"{n_messages:>8} " + " ".join(f"{ms:>21.2f}" for ms in row))
+
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or DEFAULT_LENGTHS)
@@ -0,0 +1,187 @@
+"""
+Benchmark: memory per worker process, Chroma per worker vs shared mmap.
+
+Builds a synthetically expanded copy of the Member shard (every article
+repeated `scale` times with small noise on its vector) both as a Chroma
+store and in the mmap_index format, then forks 1, 4 and 8 workers that
+each answer the benchmark queries:
+
+  chroma per worker   each worker loads the embedding model and opens the
+                      Chroma collection itself (what separate app
+                      processes do today)
+  mmap + preload      the parent loads the model and maps the shard
+                      (retrieval.preload), then forks; workers share the
+                      model weights copy-on-write and the vectors through
+                      the page cache
+
+Once every worker has answered, all of them report RSS and PSS (shared
+pages split between the processes mapping them) from /proc/self/smaps_rollup
+while they are all still alive. Linux only.
+
+Usage:
+    python bench_workers.py [scale] [queries_per_worker]
+"""
+import json
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+import mmap_index
+
+CATEGORY = "Member"
+WORKER_COUNTS = [1, 4, 8]
+BENCHMARK_FILE = "data/benchmark_queries.json"
+NOISE = 0.02
+
+
+def load_base_rows(category=CATEGORY):
+    """(ids, vectors, documents, metadatas) of the shard being served."""
+    import retrieval
+
+    index = retrieval._active_index()
+    directory = mmap_index.mmap_dir(index.path)
+    if not mmap_index.has_shard(directory, category):
+        directory = tempfile.mkdtemp(prefix="bench_base_")
+        collection, _ = retrieval.get_shard(category)
+        mmap_index.export_collection(collection, directory, category)
+    shard = mmap_index.MmapShard(directory, category)
+    records = [shard.record(row) for row in range(len(shard))]
+    return (
+        [r["id"] for r in records],
+        np.array(shard.vectors),
+        [r["document"] for r in records],
+        [r["metadata"] for r in records],
+    )
+
+
+def expand_rows(rows, scale, seed=42):
+    """Repeat every row `scale` times, jittering the vectors so they're distinct."""
+    ids, vectors, documents, metadatas = rows
+    rng = np.random.default_rng(seed)
+    copies = np.repeat(vectors[None, :, :], scale, axis=0).reshape(-1, vectors.shape[1])
+    copies = copies + rng.normal(0, NOISE, copies.shape).astype(np.float32)
+    copies /= np.linalg.norm(copies, axis=1, keepdims=True)
+    copies[:len(ids)] = vectors  # Keep the originals exactly
+    return (
+        [f"{doc_id}-{k}" for k in range(scale) for doc_id in ids],
+        copies.astype(np.float32),
+        documents * scale,
+        metadatas * scale,
+    )
+
+
+def build_stores(directory, rows):
+    import chromadb
+
+    ids, vectors, documents, metadatas = rows
+    mmap_index.write_shard(os.path.join(directory, "mmap"), CATEGORY, ids, vectors, documents, metadatas)
+    client = chromadb.PersistentClient(path=os.path.join(directory, "chroma"))
+    collection = client.create_collection(name="bench")
+    batch_size = 5000
+    for i in range(0, len(ids), batch_size):
+        collection.add(
+            ids=ids[i:i + batch_size],
+            embeddings=vectors[i:i + batch_size],
+            documents=documents[i:i + batch_size],
+            metadatas=metadatas[i:i + batch_size],
+        )
+
+
+def memory_mb():
+    values = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            key, _, rest = line.partition(":")
+            if key in ("Rss", "Pss"):
+                values[key] = int(rest.split()[0]) / 1024
+    return values
+
+
+def worker(mode, directory, queries, shared, ready, measured, reports):
+    if mode == "chroma per worker":
+        import chromadb
+        from retrieval import EMBEDDING_MODEL
+        from chromadb.utils import embedding_functions
+
+        ef = embedding_functions.SentenceTransformerEmbeddingFunction(model_name=EMBEDDING_MODEL)
+        client = chromadb.PersistentClient(path=os.path.join(directory, "chroma"))
+        collection = client.get_collection(name="bench", embedding_function=ef)
+        for query in queries:
+            collection.query(query_texts=[query], n_results=3)
+    else:
+        ef, shard = shared
+        for query in queries:
+            shard.query(ef([query])[0], 3)
+    ready.wait()         # Every worker is loaded and has answered
+    reports.put(memory_mb())
+    measured.wait()      # Stay alive until everyone has measured
+
+
+def run_mode(mode, n_workers, directory, n_queries):
+    """Run one (mode, worker count) in this process and print a JSON summary."""
+    with open(BENCHMARK_FILE, "r", encoding="utf-8") as f:
+        queries = [item["query"] for item in json.load(f)]
+    queries = (queries * (n_queries // len(queries) + 1))[:n_queries]
+
+    shared = None
+    if mode == "mmap + preload":
+        import retrieval
+
+        retrieval.preload([])  # Model only; the synthetic shard is mapped below
+        shard = mmap_index.MmapShard(os.path.join(directory, "mmap"), CATEGORY)
+        shard.query(retrieval.get_embedding_function()(["help"])[0], 3)
+        shared = (retrieval.get_embedding_function(), shard)
+
+    ctx = multiprocessing.get_context("fork")
+    ready, measured = ctx.Barrier(n_workers), ctx.Barrier(n_workers)
+    reports = ctx.Queue()
+    workers = [
+        ctx.Process(target=worker, args=(mode, directory, queries, shared, ready, measured, reports))
+        for _ in range(n_workers)
+    ]
+    for p in workers:
+        p.start()
+    samples = [reports.get(timeout=600) for _ in workers]
+    for p in workers:
+        p.join()
+    print(json.dumps({
+        "rss": sum(s["Rss"] for s in samples) / n_workers,
+        "pss": sum(s["Pss"] for s in samples) / n_workers,
+        "total_pss": sum(s["Pss"] for s in samples),
+    }))
+
+
+def main(scale=200, n_queries=36):
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")  # Tokenizer threads don't survive fork
+    rows = expand_rows(load_base_rows(), scale)
+    directory = tempfile.mkdtemp(prefix="bench_workers_")
+    try:
+        build_stores(directory, rows)
+        vector_mb = rows[1].nbytes / 1024 / 1024
+        print(f"{len(rows[0])} vectors ({vector_mb:.1f} MB float32), {n_queries} queries per worker\n")
+        print(f"{'Workers':>7}  {'Mode':<18} {'RSS MB/worker':>14} {'PSS MB/worker':>14} {'Total PSS MB':>13}")
+        for n_workers in WORKER_COUNTS:
+            for mode in ("chroma per worker", "mmap + preload"):
+                # Fresh interpreter per run so nothing loaded by an earlier run is shared
+                output = subprocess.run(
+                    [sys.executable, __file__, "_run", mode, str(n_workers), directory, str(n_queries)],
+                    capture_output=True, text=True, check=True,
+                ).stdout
+                result = json.loads(output.strip().splitlines()[-1])
+                print(f"{n_workers:>7}  {mode:<18} {result['rss']:>14.1f} {result['pss']:>14.1f} "
+                      f"{result['total_pss']:>13.1f}")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if args and args[0] == "_run":
+        run_mode(args[1], int(args[2]), args[3], int(args[4]))
+    else:
+        main(*(int(a) for a in args))
@@ -0,0 +1,250 @@
+"""
+Bulk Answer - Answer a file of questions offline, through the app's own pipeline.
+
+QA and content teams need answers for hundreds of candidate questions
+(e.g. before a help-centre change). This reads questions from a CSV, JSONL
+or JSON file and answers each one as the app would answer it as a first
+question: retrieval (query_rag_batch), context compression, date logic,
+prompt, admission layer and output guard (rag_engine.py).
+
+  - Questions are retrieved in batches of --batch-size per category: one
+    embedding call and one Chroma query per batch.
+  - Answers are generated by --concurrency worker threads. The admission
+    layer still caps upstream calls at LLM_MAX_CONCURRENT and backs off
+    on rate limits.
+  - Each finished question is appended to the output JSONL as one line:
+    answer, sources, token counts reported by the backend, retrieval /
+    first-token / total latency and any error.
+  - The run is resumable: questions whose id is already in the output
+    without an error are skipped, so after a crash or Ctrl-C the same
+    command carries on. A half-written last line is dropped.
+
+Input: CSV with a "question" (or "query") column and optional "id" and
+"category" columns; JSONL or a JSON list of objects with the same keys
+(data/benchmark_queries.json works as is). Without an id, the id is a hash
+of category + question.
+
+Usage:
+    python bulk_answer.py QUESTIONS [-o answers.jsonl] [--category Member]
+                          [--concurrency 4] [--batch-size 32] [--max-tokens 512]
+    (needs GROQ_API_KEY; LLM_BASE_URL points it at another endpoint)
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from admission import AdmissionRejected
+from dedup import approx_tokens
+from llm_client import get_llm_client
+from rag_engine import MODEL_NAME, build_context, generate_answer_stream
+from retrieval import DEFAULT_CATEGORY, get_index_version, normalize_category, query_rag_batch
+
+DEFAULT_CONCURRENCY = 4
+DEFAULT_BATCH_SIZE = 32
+N_RESULTS = 3
+
+
+def question_id(category, question):
+    return hashlib.sha256(f"{category}\n{question.strip()}".encode("utf-8")).hexdigest()[:16]
+
+
+def read_questions(path, default_category=DEFAULT_CATEGORY):
+    """[{id, question, category}] from a CSV, JSONL or JSON file (duplicate ids dropped)."""
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        if path.lower().endswith(".csv"):
+            rows = list(csv.DictReader(f))
+        elif path.lower().endswith(".jsonl"):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = json.load(f)
+    questions, seen = [], set()
+    for row in rows:
+        question = (row.get("question") or row.get("query") or "").strip()
+        if not question:
+            continue
+        category = normalize_category(row.get("category") or default_category)
+        qid = str(row.get("id") or question_id(category, question))
+        if qid in seen:
+            continue
+        seen.add(qid)
+        questions.append({"id": qid, "question": question, "category": category})
+    return questions
+
+
+def load_done(output_path):
+    """Ids already answered without an error. Drops a half-written last line."""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, "rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)  # Crashed mid-write
+            data = data[:data.rfind(b"\n") + 1]
+    for line in data.decode("utf-8").splitlines():
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if not record.get("error"):
+            done.add(record["id"])
+        else:
+            done.discard(record["id"])  # A later failure means it has to run again
+    return done
+
+
+class ResultWriter:
+    """Appends records to the output JSONL, one flushed line each (thread-safe)."""
+
+    def __init__(self, path):
+        self.file = open(path, "a", encoding="utf-8")
+        self.lock = threading.Lock()
+
+    def write(self, record):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        self.file.close()
+
+
+def answer_one(client, item, results, retrieval_ms, max_tokens):
+    """Generate one answer from its retrieved results; returns the output record."""
+    record = {
+        "id": item["id"], "question": item["question"], "category": item["category"],
+        "model": MODEL_NAME, "index_version": get_index_version(),
+        "sources": [{"url": meta["url"], "header": meta["header"]} for meta in results["metadatas"][0]],
+        "retrieval_ms": round(retrieval_ms, 1),
+    }
+    usage = {}
+    start = time.perf_counter()
+    ttft = None
+    parts = []
+    try:
+        context_text = build_context(results, item["question"], item["category"])
+        record["context_tokens"] = approx_tokens(context_text)
+        messages = [{"role": "user", "content": item["question"]}]
+        for text in generate_answer_stream(
+            client, item["question"], context_text, messages, max_tokens=max_tokens,
+            on_usage=lambda u: usage.update(
+                prompt_tokens=u.prompt_tokens, completion_tokens=u.completion_tokens,
+                cached_tokens=getattr(getattr(u, "prompt_tokens_details", None), "cached_tokens", None),
+            ),
+        ):
+            if ttft is None:
+                ttft = (time.perf_counter() - start) * 1000
+            parts.append(text)
+        record["error"] = None
+    except AdmissionRejected as e:
+        record["error"] = f"rejected: {e}"
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+    record["answer"] = "".join(parts)
+    record["prompt_tokens"] = usage.get("prompt_tokens")
+    record["completion_tokens"] = usage.get("completion_tokens")
+    record["cached_tokens"] = usage.get("cached_tokens")
+    record["ttft_ms"] = round(ttft, 1) if ttft is not None else None
+    record["generation_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    record["total_ms"] = round(retrieval_ms + record["generation_ms"], 1)
+    return record
+
+
+def run(questions, output_path, client, concurrency=DEFAULT_CONCURRENCY, batch_size=DEFAULT_BATCH_SIZE,
+        max_tokens=512):
+    """Answer every question not yet in the output. Returns the new records."""
+    done = load_done(output_path)
+    todo = [item for item in questions if item["id"] not in done]
+    print(f"{len(questions)} questions, {len(questions) - len(todo)} already answered, {len(todo)} to go "
+          f"(concurrency {concurrency}, batches of {batch_size})")
+    if not todo:
+        return []
+
+    import date_logic  # noqa: F401  Loaded up front so its start-up isn't charged to the first answers
+
+    by_category = {}
+    for item in todo:
+        by_category.setdefault(item["category"], []).append(item)
+
+    writer = ResultWriter(output_path)
+    records = []
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="bulk") as pool:
+            futures = []
+            for category, items in by_category.items():
+                for i in range(0, len(items), batch_size):
+                    batch = items[i:i + batch_size]
+                    start = time.perf_counter()
+                    try:
+                        batch_results = query_rag_batch([item["question"] for item in batch], category, N_RESULTS)
+                    except Exception as e:
+                        for item in batch:
+                            failed = dict(item, error=f"retrieval: {type(e).__name__}: {e}", answer="")
+                            writer.write(failed)
+                            records.append(failed)
+                        continue
+                    # The batch shares one search, so each question is charged its share
+                    retrieval_ms = (time.perf_counter() - start) * 1000 / len(batch)
+                    futures += [
+                        pool.submit(answer_one, client, item, results, retrieval_ms, max_tokens)
+                        for item, results in zip(batch, batch_results)
+                    ]
+            for n, future in enumerate(as_completed(futures), 1):
+                record = future.result()
+                writer.write(record)
+                records.append(record)
+                if n % 10 == 0 or n == len(futures):
+                    print(f"  {n}/{len(futures)} answered", flush=True)
+    finally:
+        writer.close()
+    return records
+
+
+def summarize(records):
+    ok = [r for r in records if not r.get("error")]
+    print(f"\n{len(ok)} answered, {len(records) - len(ok)} failed")
+    if not ok:
+        return
+    for field in ("retrieval_ms", "ttft_ms", "total_ms"):
+        values = sorted(r[field] for r in ok if r.get(field) is not None)
+        if values:
+            p95 = values[min(len(values) - 1, int(0.95 * len(values)))]
+            print(f"  {field:<14} p50 {statistics.median(values):8.1f}   p95 {p95:8.1f}")
+    for field in ("prompt_tokens", "completion_tokens", "cached_tokens"):
+        values = [r[field] for r in ok if r.get(field) is not None]
+        if values:
+            print(f"  {field:<18} total {sum(values):>8}   mean {statistics.mean(values):8.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Answer a file of questions through the RAG pipeline.")
+    parser.add_argument("questions", help="CSV, JSONL or JSON file of questions")
+    parser.add_argument("-o", "--output", default="data/bulk_answers.jsonl")
+    parser.add_argument("--category", default=DEFAULT_CATEGORY, help="Category for rows without one")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--max-tokens", type=int, default=512)
+    args = parser.parse_args(argv)
+
+    api_key = os.environ.get("GROQ_API_KEY")
+    if not api_key:
+        sys.exit("Set GROQ_API_KEY (and LLM_BASE_URL to use another endpoint).")
+    questions = read_questions(args.questions, args.category)
+    start = time.perf_counter()
+    records = run(questions, args.output, get_llm_client(api_key), args.concurrency, args.batch_size,
+                  args.max_tokens)
+    summarize(records)
+    print(f"\nWrote {len(records)} records to {args.output} in {time.perf_counter() - start:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
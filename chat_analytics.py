@@ -0,0 +1,518 @@
+"""
+Chat Analytics - Per-turn columnar store and reports over chat logs and feedback.
+
+data/chat_logs.csv keeps one row per chat with the whole transcript in one
+quoted cell. Any question about the logs (average rating, top questions,
+sessions with bad feedback) meant parsing the whole CSV and splitting
+transcripts. feedback_manager.py now also appends every turn to
+data/chat_turns.jsonl and every rating to data/chat_feedback.jsonl. This
+module turns them into Parquet:
+
+    data/analytics/turns/*.parquet      session_id, category, turn, role, content, time, sources, origin
+    data/analytics/feedback/*.parquet   session_id, rating, text, time
+
+  export    appends what was logged since the last export as new part files
+            (byte offsets kept in data/analytics/state.json). The first export
+            also imports the chats that exist only in the CSV, splitting their
+            transcripts. Greeting/name turns are left out, since they hold the
+            member's name.
+  compact   merges the part files into one file per table. It keeps the latest
+            row per (session, turn) and per rated session, so an export that
+            is re-run after a crash doesn't double count.
+  report    runs the standard questions with pyarrow compute kernels
+            (group_by, value_counts, joins). No Python loop over rows.
+
+Usage:
+    python chat_analytics.py export
+    python chat_analytics.py compact
+    python chat_analytics.py report
+    python chat_analytics.py bench [sessions]    # synthetic log: report times vs parsing the CSV
+"""
+import csv
+import glob
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from feedback_manager import FEEDBACK_FILE, FEEDBACK_LOG, TURNS_LOG
+
+ANALYTICS_DIR = "data/analytics"
+STATE_FILE = os.path.join(ANALYTICS_DIR, "state.json")
+BAD_RATING = 4  # Ratings are 1-10; this or lower counts as bad feedback
+TOP_N = 10
+
+TURN_SCHEMA = pa.schema([
+    ("session_id", pa.string()),
+    ("category", pa.dictionary(pa.int8(), pa.string())),  # Bot category (?category=); null for older chats
+    ("turn", pa.int32()),
+    ("role", pa.dictionary(pa.int8(), pa.string())),
+    ("content", pa.string()),
+    ("time", pa.timestamp("s")),
+    ("sources", pa.list_(pa.string())),
+    ("origin", pa.dictionary(pa.int8(), pa.string())),  # "log" (chat_turns.jsonl) or "csv" (legacy rows)
+])
+FEEDBACK_SCHEMA = pa.schema([
+    ("session_id", pa.string()),
+    ("rating", pa.int8()),
+    ("text", pa.string()),
+    ("time", pa.timestamp("s")),
+])
+TRANSCRIPT_LINE = re.compile(r"^(User|Assistant|System): ", re.MULTILINE)
+
+
+def _table_dir(name, root=ANALYTICS_DIR):
+    return os.path.join(root, name)
+
+
+def _parse_time(value):
+    try:
+        return datetime.fromisoformat(value.replace(" ", "T"))
+    except (AttributeError, ValueError):
+        return None
+
+
+def read_new_lines(path, offset):
+    """(records, new offset) for the complete JSON lines after `offset`."""
+    if not os.path.exists(path):
+        return [], offset
+    with open(path, "rb") as f:
+        f.seek(offset)
+        data = f.read()
+    end = data.rfind(b"\n") + 1  # A line still being written is left for next time
+    records = []
+    for line in data[:end].decode("utf-8").splitlines():
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            continue
+    return records, offset + end
+
+
+def split_transcript(transcript):
+    """[(role, content)] from a CSV transcript cell, without the greeting/name exchange."""
+    parts = TRANSCRIPT_LINE.split(transcript or "")
+    entries = [(parts[i].lower(), parts[i + 1].strip()) for i in range(1, len(parts) - 1, 2)]
+    for i, (role, content) in enumerate(entries[:4]):
+        if role == "assistant" and content.startswith("How can I help you"):
+            return entries[i + 1:]
+    return [entry for entry in entries if not (entry[0] == "assistant" and entry[1].startswith("Hello! Welcome"))]
+
+
+def legacy_rows(skip_sessions, path=FEEDBACK_FILE):
+    """Turn and feedback records for CSV chats that aren't in the turn log."""
+    turns, feedback = [], []
+    if not os.path.exists(path):
+        return turns, feedback
+    with open(path, "r", newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        for row in reader:
+            if len(row) < 7 or row[2] in skip_sessions:
+                continue
+            session_id, logged = row[2], row[1]
+            for turn, (role, content) in enumerate(split_transcript(row[4])):
+                turns.append({"session_id": session_id, "turn": turn, "role": role, "content": content,
+                              "time": logged, "sources": [], "origin": "csv"})
+            if row[5].strip().isdigit():
+                feedback.append({"session_id": session_id, "rating": int(row[5]), "text": row[6], "time": logged})
+    return turns, feedback
+
+
+def turns_table(records):
+    return pa.Table.from_pydict({
+        "session_id": [r["session_id"] for r in records],
+        "category": [r.get("category") for r in records],
+        "turn": [r["turn"] for r in records],
+        "role": [r["role"] for r in records],
+        "content": [r["content"] for r in records],
+        "time": [_parse_time(r.get("time")) for r in records],
+        "sources": [list(r.get("sources") or []) for r in records],
+        "origin": [r.get("origin", "log") for r in records],
+    }, schema=TURN_SCHEMA)
+
+
+def feedback_table(records):
+    return pa.Table.from_pydict({
+        "session_id": [r["session_id"] for r in records],
+        "rating": [int(r["rating"]) for r in records],
+        "text": [r.get("text") or "" for r in records],
+        "time": [_parse_time(r.get("time")) for r in records],
+    }, schema=FEEDBACK_SCHEMA)
+
+
+def _write_part(table, name, root=ANALYTICS_DIR, prefix="part"):
+    directory = _table_dir(name, root)
+    os.makedirs(directory, exist_ok=True)
+    # Names sort in write order (load_tables relies on it): the second, then nanoseconds within it
+    ns = time.time_ns()
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(ns // 10**9))
+    path = os.path.join(directory, f"{prefix}-{stamp}-{ns % 10**9:09d}.parquet")
+    pq.write_table(table, path + ".tmp", compression="zstd")
+    os.replace(path + ".tmp", path)
+    return path
+
+
+def _load_state():
+    try:
+        with open(STATE_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"turns_offset": 0, "feedback_offset": 0, "csv_imported": False}
+
+
+def _save_state(state):
+    os.makedirs(ANALYTICS_DIR, exist_ok=True)
+    with open(STATE_FILE + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(STATE_FILE + ".tmp", STATE_FILE)
+
+
+def export():
+    """Append turns and ratings logged since the last export as new Parquet parts."""
+    state = _load_state()
+    turns, state_turns = read_new_lines(TURNS_LOG, state["turns_offset"])
+    feedback, state_feedback = read_new_lines(FEEDBACK_LOG, state["feedback_offset"])
+    for record in turns:
+        record["origin"] = "log"
+
+    if not state["csv_imported"]:
+        logged = {r["session_id"] for r in read_new_lines(TURNS_LOG, 0)[0]}
+        rated = {r["session_id"] for r in read_new_lines(FEEDBACK_LOG, 0)[0]}
+        csv_turns, csv_feedback = legacy_rows(logged)
+        turns = csv_turns + turns
+        feedback = [r for r in csv_feedback if r["session_id"] not in rated] + feedback
+        print(f"Imported {len({r['session_id'] for r in csv_turns})} chats from {FEEDBACK_FILE}")
+
+    if turns:
+        _write_part(turns_table(turns), "turns")
+    if feedback:
+        _write_part(feedback_table(feedback), "feedback")
+    state.update(turns_offset=state_turns, feedback_offset=state_feedback, csv_imported=True)
+    _save_state(state)
+    print(f"Exported {len(turns)} turns and {len(feedback)} ratings to {ANALYTICS_DIR}")
+
+
+def _latest(table, keys):
+    """Rows of `table` with the last occurrence of each key (in file order)."""
+    if table.num_rows == 0:
+        return table
+    indexed = table.append_column("_row", pa.array(np.arange(table.num_rows)))
+    rows = indexed.group_by(keys).aggregate([("_row", "max")])["_row_max"]
+    return table.take(pc.take(rows, pc.sort_indices(rows)))  # Row numbers of the input, in file order
+
+
+def load_tables(root=ANALYTICS_DIR):
+    """(turns, feedback) tables from every part file under `root`."""
+    tables = []
+    for name, schema in (("turns", TURN_SCHEMA), ("feedback", FEEDBACK_SCHEMA)):
+        files = sorted(glob.glob(os.path.join(_table_dir(name, root), "*.parquet")))
+        tables.append(pa.concat_tables([pq.read_table(f, schema=schema) for f in files]) if files
+                      else schema.empty_table())
+    return tuple(tables)
+
+
+def compact(root=ANALYTICS_DIR):
+    """Merge each table's part files into one, keeping the latest row per key."""
+    turns, feedback = load_tables(root)
+    for name, table, keys, order in (
+        ("turns", turns, ["session_id", "turn"], [("session_id", "ascending"), ("turn", "ascending")]),
+        ("feedback", feedback, ["session_id"], [("session_id", "ascending")]),
+    ):
+        old = glob.glob(os.path.join(_table_dir(name, root), "*.parquet"))
+        if len(old) <= 1:
+            continue
+        merged = _latest(table, keys).sort_by(order)
+        _write_part(merged, name, root, prefix="compacted")
+        for path in old:
+            os.remove(path)
+        print(f"Compacted {len(old)} {name} files: {table.num_rows} -> {merged.num_rows} rows")
+
+
+# -----------------------------------------------------------------------------
+# Reports
+# -----------------------------------------------------------------------------
+
+def _normalize(text):
+    text = pc.utf8_lower(text)
+    text = pc.replace_substring_regex(text, r"\s+", " ")
+    return pc.replace_substring_regex(pc.utf8_trim_whitespace(text), r"[?.!\s]+$", "")
+
+
+def rating_summary(feedback):
+    feedback = _latest(feedback, ["session_id"])
+    counts = pc.value_counts(feedback["rating"])
+    histogram = sorted(zip(counts.field("values").to_pylist(), counts.field("counts").to_pylist()))
+    return {
+        "rated_sessions": feedback.num_rows,
+        "average_rating": pc.mean(feedback["rating"]).as_py(),
+        "histogram": histogram,
+    }
+
+
+def top_questions(turns, n=TOP_N):
+    user = turns.filter(pc.equal(turns["role"].cast(pa.string()), "user"))
+    # Count exact strings first, so only the distinct questions go through the regexes
+    exact = pc.value_counts(user["content"])
+    counts = pa.table({"question": _normalize(exact.field("values")), "count": exact.field("counts")}) \
+        .group_by("question").aggregate([("count", "sum")]) \
+        .sort_by([("count_sum", "descending")]).slice(0, n)
+    return list(zip(counts["question"].to_pylist(), counts["count_sum"].to_pylist()))
+
+
+def first_questions(turns):
+    """session_id -> its first user question (table)."""
+    user = turns.filter(pc.equal(turns["role"].cast(pa.string()), "user"))
+    first = user.group_by("session_id").aggregate([("turn", "min")])
+    return user.select(["session_id", "turn", "content"]).join(
+        first.rename_columns(["session_id", "turn"]), ["session_id", "turn"], join_type="inner"
+    ).select(["session_id", "content"]).rename_columns(["session_id", "first_question"])
+
+
+def bad_sessions(turns, feedback, max_rating=BAD_RATING, n=TOP_N):
+    """Worst-rated sessions with their first question and length."""
+    feedback = _latest(feedback, ["session_id"])
+    bad = feedback.filter(pc.less_equal(feedback["rating"], max_rating))
+    lengths = turns.group_by("session_id").aggregate([("turn", "count")]).rename_columns(["session_id", "turns"])
+    joined = bad.join(first_questions(turns), "session_id", join_type="left outer") \
+        .join(lengths, "session_id", join_type="left outer") \
+        .sort_by([("rating", "ascending"), ("time", "descending")])
+    return joined.num_rows, joined.slice(0, n).select(["session_id", "rating", "first_question", "turns", "text"])
+
+
+def _session_sources(turns):
+    """(session_id, source) for every source shown in an answer."""
+    answers = turns.filter(pc.greater(pc.list_value_length(turns["sources"]), 0))
+    parents = pc.list_parent_indices(answers["sources"])
+    return pa.table({
+        "session_id": pc.take(answers["session_id"], parents),
+        "source": pc.list_flatten(answers["sources"]).dictionary_encode(),
+    })
+
+
+def top_sources(turns, n=TOP_N):
+    counts = pc.value_counts(_session_sources(turns)["source"])
+    top = counts.take(pc.array_sort_indices(counts.field("counts"), order="descending")[:n])
+    return list(zip(top.field("values").to_pylist(), top.field("counts").to_pylist()))
+
+
+def source_ratings(turns, feedback, min_sessions=5, n=TOP_N):
+    """Articles by the average rating of the sessions that showed them (lowest first)."""
+    feedback = _latest(feedback, ["session_id"]).select(["session_id", "rating"])
+    # Only rated sessions matter, so the rest are dropped before exploding the source lists
+    rated = turns.filter(pc.is_in(turns["session_id"], value_set=feedback["session_id"]))
+    pairs = _session_sources(rated).group_by(["session_id", "source"]).aggregate([])  # Once per session
+    stats = pairs.join(feedback, "session_id").group_by("source").aggregate([("rating", "mean"), ("rating", "count")])
+    stats = stats.filter(pc.greater_equal(stats["rating_count"], min_sessions))
+    return stats.sort_by([("rating_mean", "ascending")]).slice(0, n)
+
+
+def sessions_by_category(turns):
+    """[(category, sessions)]; chats logged before categories were recorded count as None."""
+    pairs = turns.select(["session_id", "category"]).group_by(["session_id", "category"]).aggregate([])
+    counts = pc.value_counts(pairs["category"].cast(pa.string()))
+    return sorted(zip(counts.field("values").to_pylist(), counts.field("counts").to_pylist()),
+                  key=lambda item: -item[1])
+
+
+def daily_sessions(turns):
+    days = pc.cast(turns["time"], pa.date32())
+    table = pa.table({"day": days, "session_id": turns["session_id"]})
+    return table.group_by("day").aggregate([("session_id", "count_distinct")]).sort_by("day")
+
+
+def report(turns=None, feedback=None):
+    if turns is None:
+        turns, feedback = load_tables()
+    timings = {}
+
+    def timed(name, fn, *args):
+        start = time.perf_counter()
+        result = fn(*args)
+        timings[name] = (time.perf_counter() - start) * 1000
+        return result
+
+    sessions = pc.count_distinct(turns["session_id"]).as_py()
+    print(f"{turns.num_rows} turns in {sessions} sessions, {feedback.num_rows} ratings")
+    categories = timed("categories", sessions_by_category, turns)
+    print("Sessions by category: " + ", ".join(f"{category or 'unknown'} {count}" for category, count in categories) + "\n")
+
+    ratings = timed("ratings", rating_summary, feedback)
+    average = ratings["average_rating"]
+    print(f"Average rating: {average:.2f} over {ratings['rated_sessions']} rated sessions" if average is not None
+          else "No ratings yet")
+    if ratings["histogram"]:
+        print("  " + "  ".join(f"{rating}: {count}" for rating, count in ratings["histogram"]))
+
+    print("\nTop questions:")
+    for question, count in timed("top questions", top_questions, turns):
+        print(f"  {count:>7}  {question[:90]}")
+
+    n_bad, bad = timed("bad sessions", bad_sessions, turns, feedback)
+    print(f"\nSessions rated {BAD_RATING} or lower: {n_bad}")
+    for row in bad.to_pylist():
+        print(f"  {row['rating']:>2}  {row['session_id'][:8]}  {row['turns'] or 0:>3} turns  "
+              f"{(row['first_question'] or '')[:60]!r}  {row['text'][:40]!r}")
+
+    print("\nMost shown articles:")
+    for source, count in timed("top sources", top_sources, turns):
+        print(f"  {count:>7}  {source}")
+
+    print("\nArticles in the lowest-rated sessions:")
+    for row in timed("source ratings", source_ratings, turns, feedback).to_pylist():
+        print(f"  {row['rating_mean']:5.2f} over {row['rating_count']:>5} sessions  {row['source']}")
+
+    days = timed("daily sessions", daily_sessions, turns)
+    if days.num_rows:
+        counts = days["session_id_count_distinct"]
+        print(f"\nSessions per day: {days.num_rows} days, mean {pc.mean(counts).as_py():.1f}, "
+              f"max {pc.max(counts).as_py()}")
+
+    print("\nReport times: " + ", ".join(f"{name} {ms:.1f} ms" for name, ms in timings.items()))
+    return timings
+
+
+# -----------------------------------------------------------------------------
+# Synthetic log benchmark
+# -----------------------------------------------------------------------------
+
+def synthetic_tables(n_sessions, seed=7):
+    """A large fake log (turns, feedback) built with numpy from the real questions and articles."""
+    rng = np.random.default_rng(seed)
+    with open("data/benchmark_queries.json", "r", encoding="utf-8") as f:
+        questions = [q["query"] for q in json.load(f)]
+    with open("data/scraped_content.json", "r", encoding="utf-8") as f:
+        articles = json.load(f)
+    questions += [item["header"] for item in articles]
+    urls = pa.array([item["url"] for item in articles])
+    answers = pa.array([item["content"][:400] for item in articles[:50]])
+    questions = pa.array(questions)
+
+    exchanges = rng.integers(1, 6, n_sessions)              # Questions per session
+    session_ids = pa.array([f"{i:08x}-synthetic" for i in range(n_sessions)])
+    per_session = exchanges * 2
+    session_of_turn = np.repeat(np.arange(n_sessions), per_session)
+    turn = np.arange(len(session_of_turn)) - np.repeat(np.cumsum(per_session) - per_session, per_session)
+    is_user = turn % 2 == 0
+    # Popular questions are asked much more often (Zipf-like)
+    popularity = 1 / np.arange(1, len(questions) + 1)
+    question_pick = rng.choice(len(questions), len(turn), p=popularity / popularity.sum())
+    # Strings are picked by index (Array.take) rather than built row by row
+    content = pc.if_else(is_user, questions.take(question_pick),
+                         answers.take(rng.integers(0, len(answers), len(turn))))
+    start = np.datetime64("2026-01-01T00:00:00") + rng.integers(0, 90 * 86400, n_sessions).astype("timedelta64[s]")
+    times = start[session_of_turn] + (turn * 20).astype("timedelta64[s]")
+
+    n_sources = np.where(is_user, 0, 3)
+    flat_sources = urls.take(rng.integers(0, len(urls), int(n_sources.sum())))
+    offsets = np.concatenate([[0], np.cumsum(n_sources)]).astype(np.int32)
+    turns = pa.table({
+        "session_id": session_ids.take(session_of_turn),
+        "category": pa.array(["Member"] * len(turn)).dictionary_encode().cast(TURN_SCHEMA.field("category").type),
+        "turn": pa.array(turn.astype(np.int32)),
+        "role": pa.array(np.where(is_user, "user", "assistant")).dictionary_encode().cast(TURN_SCHEMA.field("role").type),
+        "content": content,
+        "time": pa.array(times.astype("datetime64[s]")),
+        "sources": pa.ListArray.from_arrays(pa.array(offsets), flat_sources),
+        "origin": pa.array(["log"] * len(turn)).dictionary_encode().cast(TURN_SCHEMA.field("origin").type),
+    }, schema=TURN_SCHEMA)
+
+    rated = np.flatnonzero(rng.random(n_sessions) < 0.4)
+    ratings = np.clip(np.round(rng.normal(7, 2.5, len(rated))), 1, 10).astype(np.int8)
+    feedback = pa.table({
+        "session_id": session_ids.take(rated),
+        "rating": pa.array(ratings),
+        "text": pa.array(np.where(ratings <= BAD_RATING, "Didn't answer my question", "")),
+        "time": pa.array((start[rated] + np.timedelta64(600, "s")).astype("datetime64[s]")),
+    }, schema=FEEDBACK_SCHEMA)
+    return turns, feedback
+
+
+def write_legacy_csv(turns, feedback, path):
+    """The same log in the chat_logs.csv layout (one row per chat, transcript in one cell)."""
+    ratings = dict(zip(feedback["session_id"].to_pylist(), feedback["rating"].to_pylist()))
+    columns = turns.select(["session_id", "role", "content", "time"]).to_pydict()
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Sr. no", "Date", "Unique ID", "Member Name", "Transcript", "Feedback Rating", "Feedback Text"])
+        current, lines, first_time, n = None, [], None, 0
+
+        def flush():
+            writer.writerow([n, first_time, current, "Member", "\n".join(lines), ratings.get(current, ""), ""])
+
+        for session_id, role, content, at in zip(columns["session_id"], columns["role"], columns["content"],
+                                                 columns["time"]):
+            if session_id != current:
+                if current is not None:
+                    flush()
+                current, lines, first_time, n = session_id, [], at, n + 1
+            lines.append(f"{role.capitalize()}: {content}")
+        if current is not None:
+            flush()
+
+
+def csv_reports(path):
+    """Average rating and top questions the old way: parse the CSV and split every transcript."""
+    ratings, questions = [], {}
+    with open(path, "r", newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        next(reader)
+        for row in reader:
+            if row[5].isdigit():
+                ratings.append(int(row[5]))
+            for role, content in split_transcript(row[4]):
+                if role == "user":
+                    key = re.sub(r"[?.!\s]+$", "", " ".join(content.lower().split()))
+                    questions[key] = questions.get(key, 0) + 1
+    top = sorted(questions.items(), key=lambda item: -item[1])[:TOP_N]
+    return sum(ratings) / max(len(ratings), 1), top
+
+
+def bench(n_sessions=100000):
+    start = time.perf_counter()
+    turns, feedback = synthetic_tables(n_sessions)
+    print(f"Generated {n_sessions} sessions ({turns.num_rows} turns) in {time.perf_counter() - start:.1f} s")
+    directory = tempfile.mkdtemp(prefix="chat_analytics_")
+    try:
+        _write_part(turns, "turns", directory)
+        _write_part(feedback, "feedback", directory)
+        parquet_mb = sum(os.path.getsize(p) for p in glob.glob(f"{directory}/*/*.parquet")) / 1e6
+        start = time.perf_counter()
+        turns, feedback = load_tables(directory)
+        load_ms = (time.perf_counter() - start) * 1000
+        print(f"Parquet: {parquet_mb:.1f} MB, loaded in {load_ms:.0f} ms\n")
+        timings = report(turns, feedback)
+
+        csv_path = os.path.join(directory, "chat_logs.csv")
+        write_legacy_csv(turns, feedback, csv_path)
+        start = time.perf_counter()
+        average, top = csv_reports(csv_path)
+        csv_ms = (time.perf_counter() - start) * 1000
+        print(f"\nSame log as chat_logs.csv: {os.path.getsize(csv_path) / 1e6:.1f} MB")
+        print(f"  average rating + top questions by parsing the CSV: {csv_ms:.0f} ms "
+              f"(Parquet load + both reports: {load_ms + timings['ratings'] + timings['top questions']:.0f} ms)")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command == "export":
+        export()
+    elif command == "compact":
+        compact()
+    elif command == "report":
+        report()
+    elif command == "bench":
+        bench(int(sys.argv[2]) if len(sys.argv) > 2 else 100000)
+    else:
+        print(__doc__)
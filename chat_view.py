@@ -0,0 +1,28 @@
+"""
+Chat View - Rendering of the chat history.
+
+Each message is one chat bubble holding a single markdown element (content
+and timestamp together), built once per message and cached by id in the
+ConversationStore. chatbot.py renders the history up to the last full
+script run with render_messages(), and the chat fragment renders only the
+messages added since (render_messages(after_id=...)), so answering a
+follow-up doesn't re-render the whole conversation.
+"""
+import streamlit as st
+
+
+def render_message(conversation, msg):
+    with st.chat_message(msg["role"]):
+        st.markdown(conversation.display_markdown(msg))
+
+
+def render_messages(conversation, after_id=-1):
+    """Render the recent messages newer than `after_id`.
+
+    Returns the id of the last message in the conversation (-1 if empty),
+    to pass as `after_id` next time.
+    """
+    for msg in conversation.messages:
+        if msg["id"] > after_id:
+            render_message(conversation, msg)
+    return conversation.last["id"] if conversation.last else -1
@@ -1,29 +1,46 @@
 import streamlit as st
-import chromadb
-from chromadb.utils import embedding_functions
-from groq import Groq
 import uuid
 import json
+import os
 from feedback_manager import log_chat, update_feedback_log
 from google_sheets_logger import log_to_sheet, update_sheet_feedback
-
-# Configuration
-DB_PATH = "data/chroma_db"
-COLLECTION_NAME = "rag_knowledge_base"
-# MODEL_NAME = "llama3.2:3b" 
-MODEL_NAME = "llama-3.1-8b-instant" # Groq Llama 3 model
-
-# Initialize Groq Client
+from retrieval import normalize_category
+from query_rewriter import retrieve_for_turn
+from topic_graph import suggest_follow_up
+from prefetch import discard as discard_prefetch, start_prefetch, take_prefetch
+from conversation_store import ConversationStore, get_time_str
+from chat_view import render_messages
+from llm_client import get_llm_client
+from admission import AdmissionRejected, complete_chat
+from stream_batcher import batch_stream
+from profiling import admin_requested, begin as begin_profile, profile_run
+from rag_engine import MODEL_NAME, build_context as build_engine_context, conversation_history, generate_answer_stream
+from faq_store import as_results as faq_results, match as match_faq
+from session_store import persist as persist_session, restore as restore_session
+
+# Configuration (MODEL_NAME lives in rag_engine.py)
+# Follow-up suggestions: "graph" looks up data/topic_graph.json (LLM only as fallback), "llm" always asks the model
+FOLLOWUP_MODE = os.environ.get("FOLLOWUP_MODE", "graph")
+# Speculatively draft the follow-up answer too (costs an LLM call per suggestion, capped below).
+# Drafts run only when the admission gate has a free slot and no one waiting; a draft
+# that hits the cap would be cut off, so it is dropped and the answer generated live.
+PREFETCH_DRAFT = os.environ.get("PREFETCH_DRAFT", "0") == "1"
+PREFETCH_DRAFT_MAX_TOKENS = int(os.environ.get("PREFETCH_DRAFT_MAX_TOKENS", "200"))
+
+# Groq Client (one pooled, keep-alive client per process, shared across reruns and sessions)
 try:
     GROQ_API_KEY = st.secrets["GROQ_API_KEY"]
 except Exception:
     st.error("Missing GROQ_API_KEY in secrets.toml or Streamlit Cloud Secrets.")
     st.stop()
 
-client = Groq(api_key=GROQ_API_KEY)
+client = get_llm_client(GROQ_API_KEY)
+
+# Category served by this session, e.g. ?category=Employer (defaults to Member)
+BOT_CATEGORY = normalize_category(st.query_params.get("category", "Member"))
 
 # Page Config
-st.set_page_config(page_title="Member Help Center Bot", page_icon="🤖", layout="wide")
+st.set_page_config(page_title=f"{BOT_CATEGORY} Help Center Bot", page_icon="🤖", layout="wide")
 
 # Custom CSS for "Premium" look
 st.markdown("""
@@ -136,29 +153,6 @@ st.markdown("""
 # Backend / RAG Logic
 # -----------------------------------------------------------------------------
 
-# Helper to format time
-def get_time_str():
-    import datetime
-    return datetime.datetime.now().strftime("%H:%M:%S")
-
-@st.cache_resource
-def get_collection():
-    """Load ChromaDB collection once."""
-    client = chromadb.PersistentClient(path=DB_PATH)
-    ef = embedding_functions.SentenceTransformerEmbeddingFunction(model_name="all-MiniLM-L6-v2")
-    return client.get_collection(name=COLLECTION_NAME, embedding_function=ef)
-
-def query_rag(collection, query, category, n_results=3):
-    """Retrieve relevant documents filtered by category.
-    
-    Performance: Using n_results=3 provides better context while maintaining speed.
-    """
-    results = collection.query(
-        query_texts=[query],
-        n_results=n_results,
-        where={"category": category} # Strict filtering
-    )
-    return results
 
 # Create a helper to safely get content from chunk/response
 def get_content(item):
@@ -176,75 +170,55 @@ def get_content(item):
     # print(f"DEBUG: Could not extract content from {item}", flush=True)
     return ""
 
-def generate_response_stream(query, context_text):
-    """Generate answer using Llama 3.2 with streaming."""
-    import datetime
-    current_date = datetime.datetime.now().strftime("%d %B %Y")
-    
-    # --- INTELLIGENT LAYER: Check for Date logic ---
-    date_context = ""
+def build_context(results, query=None):
+    """CONTEXT block for this session's category (see rag_engine.build_context)."""
+    return build_engine_context(results, query, BOT_CATEGORY)
+
+def follow_up_query_for(topic):
+    """User message sent when the 'Yes, tell me more' button is clicked."""
+    return f"Tell me more about {topic}"
+
+def degraded_answer(results):
+    """Answer served when the LLM can't take the request (busy or rate limited)."""
+    answer = "I'm answering a lot of questions right now, so I can't write a full answer at the moment."
+    metadatas = results['metadatas'][0] if results else []
+    if metadatas:
+        answer += "\n\nThese help articles should help:\n"
+        answer += "\n".join(f"- [{meta['header']}]({meta['url']})" for meta in metadatas)
+    return answer + "\n\nPlease try asking again in a minute."
+
+def with_degraded_fallback(generator, results):
+    """Stream the answer, switching to a degraded answer if admission is refused."""
     try:
-        from date_logic import calculate_opt_out_dates
-        # We try to see if the user mentioned a date relevant to enrollment
-        # Heuristic: If parsing returns a date, we inject the math.
-        # Ideally we only do this if the query seems relevant, but for "Advanced Reasoning" demo we can be eager.
-        calc_result = calculate_opt_out_dates(query)
-        if calc_result:
-            date_context = f"\n\n*** DATE CALCULATION RESULT ***\n{calc_result['summary']}\n*********************************\n"
-    except Exception as e:
-        print(f"Date logic error: {e}")
-    # -----------------------------------------------
-
-    # Add conversation history for context
-    conversation_context = ""
-    if len(st.session_state.messages) > 1:
-        # Get last 3 exchanges (6 messages) for context
-        recent_messages = st.session_state.messages[-6:]
-        conversation_context = "\n\nRECENT CONVERSATION:\n"
-        for msg in recent_messages:
-            role = msg['role'].upper()
-            content = msg['content'][:150]  # Truncate for context
-            conversation_context += f"{role}: {content}...\n"
-    
-    system_prompt = (
-        "You are a helpful and strict assistant for a Help Center. "
-        f"TODAY'S DATE: {current_date}\n"
-        "INSTRUCTIONS:\n"
-        "1. **Greetings & Pleasantries**: If the user says 'Hello', 'Good morning', 'Thanks', or 'Thank you', respond politely and naturally. You do NOT need context for this.\n"
-        "2. **Information Queries**: For questions about NEST, pensions, or account details, you must answer based **ONLY** on the provided context below. "
-        "3. **Privacy & Security**: You are a public help bot. You do **NOT** have access to member accounts. **NEVER** ask for personal details like NEST ID, NNI, or Date of Birth. If a user asks about their specific account (e.g., 'What is my balance?'), explain that you cannot access their account and guide them to log in to the website.\n"
-        "If the context contains instructions, options, or steps (e.g., 'Website', 'Phone', 'Post'), you MUST summarize them clearly for the user. "
-        "ADVANCED REASONING: If the CALCULATED DATE RESULT (below) is available, use it to answer specific date questions perfectly. "
-        "Do NOT try to do the math yourself if the result is provided. Trust the 'DATE CALCULATION RESULT'. "
-        "Do NOT simply say 'check the link' if the content is available in the text. "
-        "Do NOT fabricate information. "
-        "Do NOT mention external resources or say '(link provided)' unless the link path is explicitly present in the CONTEXT. "
-        "Always format links as Markdown: `[Link Text](url)`. "
-        "Be conversational but do NOT ask identifying questions. "
-        "If the answer is not in the context, say 'I cannot find that information in the help articles provided.'\n\n"
-        "CONTEXT:\n" + context_text + date_context + conversation_context
-    )
-    
-    # Enable Streaming with optimized parameters
-    stream = client.chat.completions.create(
-        model=MODEL_NAME, 
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": query}
-        ],
-        stream=True,
-        temperature=0.3,
-        max_tokens=512
+        yield from generator
+    except AdmissionRejected as e:
+        print(f"DEBUG: Serving degraded answer: {e}", flush=True)
+        yield degraded_answer(results)
+
+def stream_draft(draft_text):
+    """Replay a prefetched draft answer through st.write_stream."""
+    for line in draft_text.splitlines(keepends=True):
+        yield line
+
+def generate_response_stream(query, context_text, messages, summary="", max_tokens=512, on_queue_position=None):
+    """Stream the answer with this process's client (see rag_engine.generate_answer_stream)."""
+    yield from generate_answer_stream(
+        client, query, context_text, messages, summary=summary, max_tokens=max_tokens,
+        on_queue_position=on_queue_position
     )
 
-    print("DEBUG: Starting Stream...", flush=True)
-    for chunk in stream:
-        content = chunk.choices[0].delta.content
-        if content:
-            yield content
+def predict_next_topic(query, answer, retrieved_urls=(), previous_topic=None):
+    """Predict a relevant follow-up topic.
+
+    Uses the precomputed topic graph on the retrieved articles first (a dict
+    lookup) and only falls back to an LLM round trip if it has no suggestion.
+    """
+    if FOLLOWUP_MODE == "graph":
+        exclude = (previous_topic,) if previous_topic else ()
+        suggestion = suggest_follow_up(list(retrieved_urls), exclude_labels=exclude)
+        if suggestion:
+            return suggestion
 
-def predict_next_topic(query, answer):
-    """Predict a relevant follow-up topic."""
     prompt = (
         f"Based on the user's question: '{query}' and your answer: '{answer}', "
         "predict ONE likely follow-up topic keywords based on the context. "
@@ -254,12 +228,12 @@ def predict_next_topic(query, answer):
     
     print("DEBUG: Calling predict_next_topic", flush=True)
     try:
-        response = client.chat.completions.create(
-            model=MODEL_NAME, 
+        response = complete_chat(
+            client,
+            model=MODEL_NAME,
             messages=[
                 {"role": "user", "content": prompt}
-            ], 
-            stream=False
+            ]
         )
         
         return response.choices[0].message.content
@@ -274,66 +248,123 @@ import datetime
 # UI Logic
 # -----------------------------------------------------------------------------
 
-# Initialize Session ID (for chat logging)
+
+# Initialize Session ID (for chat logging). The id is kept in the URL (?sid=)
+# so a refresh, reconnect or another worker restores the chat from the
+# shared session store (see session_store.py).
 if "session_id" not in st.session_state:
-    st.session_state.session_id = str(uuid.uuid4())
+    if not restore_session(st.session_state, st.query_params.get("sid"), BOT_CATEGORY):
+        st.session_state.session_id = str(uuid.uuid4())
+if st.query_params.get("sid") != st.session_state.session_id:
+    st.query_params["sid"] = st.session_state.session_id
 
 if "chat_ended" not in st.session_state:
     st.session_state.chat_ended = False
 
-if "messages" not in st.session_state:
-    st.session_state.messages = [{
-        "role": "assistant",
-        "content": "Hello! Welcome to the Member Help Center. To get started, please tell me your name.",
-        "timestamp": get_time_str()
-    }]
+# Opt-in profiling: ?profile=<PROFILE_ADMIN_TOKEN> profiles every run of this
+# session, PROFILE_SAMPLE_RATE a share of all runs (see profiling.py)
+if admin_requested(st.query_params.get("profile")):
+    st.session_state.profile_requested = True
+run_profile = begin_profile(
+    st.session_state.session_id, "rerun", requested=st.session_state.get("profile_requested", False),
+    state=st.session_state
+)
+
+GREETING = f"Hello! Welcome to the {BOT_CATEGORY} Help Center. To get started, please tell me your name."
+
+# Bounded chat history: recent messages + rolling summary + incremental transcript
+if "conversation" not in st.session_state:
+    st.session_state.conversation = ConversationStore(GREETING)
+conversation = st.session_state.conversation
 
 if "conversation_step" not in st.session_state:
     st.session_state.conversation_step = "ASK_NAME" # Steps: ASK_NAME, READY
 
+# Widget callbacks run before the next script run, so each interaction costs
+# exactly one rerun (no st.rerun() to refresh after changing state). They read
+# st.session_state rather than this run's globals, which belong to the
+# run that registered them.
+
+def end_chat():
+    conversation = st.session_state.conversation
+    st.session_state.chat_ended = True
+    discard_prefetch(st.session_state.session_id)
+    with profile_run(st.session_state.session_id, "end_chat", st.session_state.get("profile_requested", False)):
+        log_chat(
+            session_id=st.session_state.session_id,
+            user_name=st.session_state.get('user_name', 'Anonymous'),
+            conversation_history=conversation.transcript_messages(),
+            category=BOT_CATEGORY
+        )
+        # Log to Google Sheets
+        log_to_sheet(
+            session_id=st.session_state.session_id,
+            user_name=st.session_state.get('user_name', 'Anonymous'),
+            transcript=conversation.log_text()
+        )
+
+def start_new_chat():
+    st.session_state.conversation = ConversationStore(GREETING)
+    discard_prefetch(st.session_state.session_id)
+    st.session_state.session_id = str(uuid.uuid4())
+    st.query_params["sid"] = st.session_state.session_id
+    st.session_state.chat_ended = False
+    if "user_name" in st.session_state:
+        del st.session_state.user_name
+    st.session_state.conversation_step = "ASK_NAME"
+    if "last_prediction" in st.session_state:
+        del st.session_state.last_prediction
+    st.session_state.pop("accepted_topic", None)
+
+def submit_prompt():
+    prompt = st.session_state.get("chat_prompt")
+    if not prompt:
+        return
+    conversation = st.session_state.conversation
+    conversation.append("user", prompt)
+
+    # The first message is the member's name: greet them and get ready for questions
+    if st.session_state.conversation_step == "ASK_NAME":
+        conversation.last["onboarding"] = True
+        st.session_state.user_name = prompt
+        st.session_state.conversation_step = "READY"
+        conversation.append("assistant", f"How can I help you, {prompt}?", onboarding=True)
+
+def accept_follow_up():
+    # Add the user query; the chat fragment answers it on this rerun
+    follow_up_query = follow_up_query_for(st.session_state.last_prediction)
+    st.session_state.conversation.append("user", follow_up_query)
+    # Kept for this answer's suggestion, so the graph doesn't offer the same topic again
+    st.session_state.accepted_topic = st.session_state.last_prediction
+    del st.session_state.last_prediction
+
+def decline_follow_up():
+    user_name = st.session_state.get("user_name", "User")
+    # Bot closes this topic, then drop the unused prefetch
+    st.session_state.conversation.append("assistant", f"How else can I help you, {user_name}?")
+    del st.session_state.last_prediction
+    discard_prefetch(st.session_state.session_id)
+
 # Header Area with End Chat
 col_title, col_end = st.columns([0.75, 0.25])
 with col_title:
-    st.title("🤖 Member Help Center Assistant")
+    st.title(f"🤖 {BOT_CATEGORY} Help Center Assistant")
 with col_end:
     st.markdown('<div style="height: 15px;"></div>', unsafe_allow_html=True) # Vertical alignment
     if not st.session_state.chat_ended:
-        if st.button("End Chat", type="primary", use_container_width=True):
-            st.session_state.chat_ended = True
-            log_chat(
-                session_id=st.session_state.session_id,
-                user_name=st.session_state.get('user_name', 'Anonymous'),
-                conversation_history=st.session_state.messages
-            )
-            # Log to Google Sheets
-            log_to_sheet(
-                session_id=st.session_state.session_id,
-                user_name=st.session_state.get('user_name', 'Anonymous'),
-                transcript=str(st.session_state.messages)
-            )
-            st.rerun()
-
-
-
-# Helper to format time (Moved to top)
-# def get_time_str():
-#     return datetime.datetime.now().strftime("%H:%M:%S")
+        st.button("End Chat", type="primary", use_container_width=True, on_click=end_chat)
 
 # Sidebar - Settings (Minimal)
 with st.sidebar:
     st.header("Settings")
-    st.info("💡 This chatbot serves **Member** queries only.")
+    st.info(f"💡 This chatbot serves **{BOT_CATEGORY}** queries only.")
     st.divider()
 
-# 2. Display Chat History
-for message in st.session_state.messages:
-    with st.chat_message(message["role"]):
-        st.markdown(message["content"])
-        if "timestamp" in message:
-            st.caption(f"_{message['timestamp']}_")
-
-# Chat Controls Removed (Moved to Header)
-
+# 2. Display Chat History (as of this full run; newer messages are drawn by the chat fragment)
+if conversation.summary:
+    with st.expander("Earlier in this conversation"):
+        st.text(conversation.summary)
+st.session_state.rendered_upto = render_messages(conversation)
 
 # Post-Chat Options
 if st.session_state.chat_ended:
@@ -358,201 +389,200 @@ if st.session_state.chat_ended:
     col_dl, col_new = st.columns(2)
     
     with col_dl:
-        # Generate Transcript
+        # Generate Transcript (on click: reruns after the chat ends don't build or hold a copy)
         user_name_dl = st.session_state.get('user_name', 'Anonymous')
-        chat_text = f"Chat Session: {st.session_state.session_id}\n"
-        chat_text += f"Date: {get_time_str()}\n"
-        chat_text += f"Member: {user_name_dl}\n\n"
-        for msg in st.session_state.messages:
-            role = "Bot" if msg["role"] == "assistant" else user_name_dl
-            chat_text += f"{role}: {msg['content']}\n\n"
-            
+        session_id_dl = st.session_state.session_id
+
+        def transcript_file():
+            chat_text = f"Chat Session: {session_id_dl}\n"
+            chat_text += f"Date: {get_time_str()}\n"
+            chat_text += f"Member: {user_name_dl}\n\n"
+            return chat_text + conversation.transcript_text(user_name_dl)
+
         st.download_button(
             label="📥 Save Transcript",
-            data=chat_text,
+            data=transcript_file,
             file_name=f"chat_{st.session_state.session_id[:8]}.txt",
             mime="text/plain",
             use_container_width=True
         )
         
     with col_new:
-        if st.button("🔄 Start New Chat (Skip)", type="primary", use_container_width=True):
-            st.session_state.messages = [{
-                "role": "assistant",
-                "content": "Hello! Welcome to the Member Help Center. To get started, please tell me your name.",
-                "timestamp": get_time_str()
-            }]
-            st.session_state.session_id = str(uuid.uuid4())
-            st.session_state.chat_ended = False
-            if "user_name" in st.session_state:
-                del st.session_state.user_name
-            st.session_state.conversation_step = "ASK_NAME"
-            if "last_prediction" in st.session_state:
-                del st.session_state.last_prediction
-            st.rerun()
-
-
-
-# 3. Handle User Input & Logic
-# We use a flag to process response so buttons can trigger it too
-process_response = False
-user_input_text = None
-
-# Determine prompt text
+        st.button("🔄 Start New Chat (Skip)", type="primary", use_container_width=True, on_click=start_new_chat)
+
+
+# 3. Answer the pending question (Normal Q&A)
+def answer_turn(conversation):
+    last_user_msg = conversation.last["content"]
+    with st.chat_message("assistant"):
+        # Placeholder for "Thinking" GIF (Show briefly while retrieving)
+        thinking_placeholder = st.empty()
+        # Text-based Thinking Animation
+        thinking_placeholder.markdown(
+            '<p class="thinking-text">Bot is thinking<span class="cursor"></span></p>', 
+            unsafe_allow_html=True
+        ) 
+        
+        try:
+            if "condense_memo" not in st.session_state:
+                st.session_state.condense_memo = {}
+
+            # A clicked follow-up was usually retrieved (and maybe drafted) in the background already
+            draft_text = None
+            prefetched = take_prefetch(st.session_state.session_id, last_user_msg)
+            # A frequent first question is answered from the reviewed FAQ store (no retrieval or LLM call)
+            faq = None
+            if not prefetched and not conversation_history(conversation.messages[:-1]):
+                try:
+                    faq = match_faq(last_user_msg, BOT_CATEGORY)
+                except Exception as e:
+                    print(f"DEBUG: FAQ lookup skipped: {e}", flush=True)
+            if prefetched:
+                results, retrieval_query, draft_text = prefetched
+            elif faq:
+                entry, similarity = faq
+                print(f"DEBUG: FAQ answer ({similarity:.3f}): {entry['question']}", flush=True)
+                results, retrieval_query, draft_text = faq_results(entry), last_user_msg, entry["answer"]
+            else:
+                # Retrieve Context from this category's shard only.
+                # Follow-ups ("what about by post?") are condensed into a standalone
+                # query using the earlier turns (minus the name exchange).
+                history = conversation_history(conversation.messages[:-1])
+                results, retrieval_query = retrieve_for_turn(
+                    last_user_msg, history, BOT_CATEGORY,
+                    client=client, model=MODEL_NAME, memo=st.session_state.condense_memo
+                )
+            if retrieval_query != last_user_msg:
+                print(f"DEBUG: Condensed query: {retrieval_query}", flush=True)
+            retrieved_urls = [meta['url'] for meta in results['metadatas'][0]]
+            
+            # Wrapper to clear UI placeholder only when first chunk arrives
+            def clear_placeholder_on_first_yield(generator, placeholder):
+                is_first = True
+                for chunk in generator:
+                    if is_first:
+                        placeholder.empty()
+                        is_first = False
+                    yield chunk
+            
+            # Show the queue position if the LLM is busy
+            def show_queue_position(position):
+                thinking_placeholder.markdown(
+                    f'<p class="thinking-text">Lots of members are asking questions right now. '
+                    f'You are number {position} in the queue<span class="cursor"></span></p>',
+                    unsafe_allow_html=True
+                )
+
+            # Generate Answer (Streamed)
+            if draft_text:
+                stream_generator = stream_draft(draft_text)
+            else:
+                context_text = build_context(results, retrieval_query)
+                stream_generator = with_degraded_fallback(
+                    generate_response_stream(
+                        last_user_msg, context_text, conversation.messages,
+                        summary=conversation.summary, on_queue_position=show_queue_position
+                    ),
+                    results
+                )
+            
+            # Pass the wrapper to st.write_stream, batching deltas so the UI
+            # re-renders a few times per second rather than once per token
+            answer_text = st.write_stream(
+                clear_placeholder_on_first_yield(batch_stream(stream_generator), thinking_placeholder)
+            )
+            
+            # Add timestamp (rendered after stream finishes)
+            st.caption(f"_{get_time_str()}_")
+            
+            conversation.append("assistant", answer_text, sources=retrieved_urls)
+            
+            # Predict Follow-up (Runs AFTER streaming is done; the buttons are drawn below in this run)
+            prediction_text = predict_next_topic(
+                last_user_msg, answer_text,
+                retrieved_urls=retrieved_urls,
+                previous_topic=st.session_state.pop("accepted_topic", None)
+            )
+            st.session_state.last_prediction = prediction_text
+
+            # Speculatively retrieve (and optionally draft) the suggested follow-up
+            if prediction_text:
+                follow_up_query = follow_up_query_for(prediction_text)
+                prefetch_history = conversation_history(conversation.messages)
+                draft_messages = conversation.messages + [{"role": "user", "content": follow_up_query}]
+                draft_summary = conversation.summary
+                memo = st.session_state.condense_memo
+
+                def prefetch_retrieve(query):
+                    return retrieve_for_turn(
+                        query, prefetch_history, BOT_CATEGORY,
+                        client=client, model=MODEL_NAME, memo=memo
+                    )
+
+                def prefetch_draft(query, prefetched_results):
+                    usage = []
+                    draft = "".join(generate_answer_stream(
+                        client, query, build_context(prefetched_results, query), draft_messages,
+                        summary=draft_summary, max_tokens=PREFETCH_DRAFT_MAX_TOKENS,
+                        on_usage=usage.append, background=True
+                    ))
+                    if usage and (usage[0].completion_tokens or 0) >= PREFETCH_DRAFT_MAX_TOKENS:
+                        return None  # Truncated at the cap
+                    return draft
+
+                start_prefetch(
+                    st.session_state.session_id, follow_up_query, prefetch_retrieve,
+                    draft_fn=prefetch_draft if PREFETCH_DRAFT else None
+                )
+            
+        except Exception as e:
+            thinking_placeholder.empty()
+            st.error(f"An error occurred: {e}")
+
+
+# 4. Chat fragment: the follow-up buttons rerun only this part of the page,
+# which draws the messages added since the last full run, answers the
+# pending question and offers the next topic.
+@st.fragment
+def chat_area():
+    conversation = st.session_state.conversation
+    render_messages(conversation, after_id=st.session_state.rendered_upto)
+
+    # If the last message is the user's, the bot must answer it (typed question or "Yes" click)
+    if (not st.session_state.chat_ended and st.session_state.conversation_step == "READY"
+            and conversation.last and conversation.last["role"] == "user"):
+        # Part of the run's profile on full runs; profiled on its own on fragment reruns
+        with profile_run(st.session_state.session_id, "turn", st.session_state.get("profile_requested", False)):
+            answer_turn(conversation)
+
+    # 5. Interactive Follow-up Buttons (Always show if prediction exists and last msg was assistant)
+    # Ensure we only show buttons if the LAST message was indeed the assistant answering
+    if "last_prediction" in st.session_state and conversation.last and conversation.last["role"] == "assistant":
+        prediction_text = st.session_state.last_prediction
+        
+        st.divider()
+        st.markdown(f"**Predicted Topic:** Do you want to know about **{prediction_text}**?")
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            st.button("✅ Yes, tell me more", use_container_width=True, on_click=accept_follow_up)
+        with col2:
+            st.button("❌ No, I'm good", use_container_width=True, on_click=decline_follow_up)
+
+    # Every state change (callbacks, answers) is followed by a full or fragment
+    # run, so saving here keeps the shared copy current (written behind).
+    persist_session(st.session_state, BOT_CATEGORY)
+
+chat_area()
+
+# 6. User Input (pinned to the bottom of the page; handled by submit_prompt before the next run)
 if st.session_state.conversation_step == "ASK_NAME":
     prompt_placeholder = "Enter your name..."
 else:
     user_name = st.session_state.get("user_name", "User")
     prompt_placeholder = f"How can I help you, {user_name}?"
 
-if prompt := st.chat_input(prompt_placeholder, disabled=st.session_state.chat_ended):
-    user_input_text = prompt
-    # User sent a message
-    st.session_state.messages.append({
-        "role": "user",
-        "content": prompt,
-        "timestamp": get_time_str()
-    })
-    
-    # Display it immediately (duplicate of history loop but needed for immediate feedback)
-    with st.chat_message("user"):
-        st.markdown(prompt)
-        st.caption(f"_{get_time_str()}_")
-    
-    process_response = True
-
-# 4. Check if we have a pending "Button Triggered" message to process
-# (This happens if st.rerun() was called after adding a user message programmatically)
-if not process_response and st.session_state.messages and st.session_state.messages[-1]["role"] == "user":
-    # If the last message was user and we haven't answered it yet (check length parity or manual flag)
-    # Simple heuristic: If last message is User, Bot must answer.
-    # Note: 'messages' includes the initial greeting (Assistant) -> User (Name) -> Assistant (Welcome) -> User (Question)
-    # So if last is User, we respond.
-    # CAUTION: We need to distinguish "Name Input" user message vs "Query" user message.
-    process_response = True
-
-# 5. Process Logic (State Machine)
-if process_response and not st.session_state.chat_ended: # Only process if chat is not ended
-    last_user_msg = st.session_state.messages[-1]["content"]
-    
-    # SCENARIO A: User just entered their Name
-    if st.session_state.conversation_step == "ASK_NAME":
-        # Save name
-        st.session_state.user_name = last_user_msg
-        st.session_state.conversation_step = "READY"
-        
-        # Bot responds: "Nice to meet you..."
-        with st.chat_message("assistant"):
-            response_msg = f"How can I help you, {st.session_state.user_name}?"
-            st.markdown(response_msg)
-            st.caption(f"_{get_time_str()}_")
-            
-            st.session_state.messages.append({
-                "role": "assistant",
-                "content": response_msg,
-                "timestamp": get_time_str()
-            })
-        st.rerun() # Refresh to update chat input placeholder to "How can I help..."
-
-    # SCENARIO B: Normal Q&A
-    elif st.session_state.conversation_step == "READY":
-        with st.chat_message("assistant"):
-            # Placeholder for "Thinking" GIF (Show briefly while retrieving)
-            thinking_placeholder = st.empty()
-            # Text-based Thinking Animation
-            thinking_placeholder.markdown(
-                '<p class="thinking-text">Bot is thinking<span class="cursor"></span></p>', 
-                unsafe_allow_html=True
-            ) 
-            
-            try:
-                collection = get_collection()
-                
-                # Retrieve Context (Member category only)
-                results = query_rag(collection, last_user_msg, "Member")
-                docs = results['documents'][0]
-                metadatas = results['metadatas'][0]
-                
-                if not docs:
-                    context_text = "No relevant documents found."
-                else:
-                    context_parts = []
-                    for doc, meta in zip(docs, metadatas):
-                        context_parts.append(f"Source ({meta['category']}): {meta['header']}\n{doc}")
-                    context_text = "\n---\n".join(context_parts)
-                
-                # Remove Thinking GIF once we start generating
-                # thinking_placeholder.empty() <--- REMOVED: Now handled in wrapper
-                
-                # Wrapper to clear UI placeholder only when first chunk arrives
-                def clear_placeholder_on_first_yield(generator, placeholder):
-                    is_first = True
-                    for chunk in generator:
-                        if is_first:
-                            placeholder.empty()
-                            is_first = False
-                        yield chunk
-                
-                # Generate Answer (Streamed)
-                stream_generator = generate_response_stream(last_user_msg, context_text)
-                
-                # Pass the wrapper to st.write_stream
-                answer_text = st.write_stream(clear_placeholder_on_first_yield(stream_generator, thinking_placeholder))
-                
-                # Add timestamp (rendered after stream finishes)
-                st.caption(f"_{get_time_str()}_")
-                
-                st.session_state.messages.append({
-                    "role": "assistant",
-                    "content": answer_text,
-                    "timestamp": get_time_str()
-                })
-                
-                # Predict Follow-up (Runs AFTER streaming is done)
-                prediction_text = predict_next_topic(last_user_msg, answer_text)
-                st.session_state.last_prediction = prediction_text
+st.chat_input(prompt_placeholder, key="chat_prompt", on_submit=submit_prompt, disabled=st.session_state.chat_ended)
 
-                
-                # Force rerun to show buttons below
-                st.rerun()
-                
-            except Exception as e:
-                thinking_placeholder.empty()
-                st.error(f"An error occurred: {e}")
-
-# 6. Interactive Follow-up Buttons (Always show if prediction exists and last msg was assistant)
-# Ensure we only show buttons if the LAST message was indeed the assistant answering
-if "last_prediction" in st.session_state and st.session_state.messages and st.session_state.messages[-1]["role"] == "assistant":
-    prediction_text = st.session_state.last_prediction
-    
-    st.divider()
-    st.markdown(f"**Predicted Topic:** Do you want to know about **{prediction_text}**?")
-    
-    col1, col2 = st.columns(2)
-    with col1:
-        if st.button("✅ Yes, tell me more", use_container_width=True):
-            # 1. Add User Query programmatically
-            follow_up_query = f"Tell me more about {prediction_text}"
-            st.session_state.messages.append({
-                "role": "user",
-                "content": follow_up_query,
-                "timestamp": get_time_str()
-            })
-            # 2. Clear prediction so buttons vanish
-            del st.session_state.last_prediction
-            # 3. Rerun - This will hit the "Check parity" logic in step 4 and trigger Step 5 (Scenario B)
-            st.rerun()
-            
-    with col2:
-        if st.button("❌ No, I'm good", use_container_width=True):
-            user_name = st.session_state.get("user_name", "User")
-            # 1. Bot closes this topic
-            st.session_state.messages.append({
-                "role": "assistant",
-                "content": f"How else can I help you, {user_name}?",
-                "timestamp": get_time_str()
-            })
-            # 2. Clear prediction
-            del st.session_state.last_prediction
-            # 3. Rerun to update chat
-            st.rerun()
+if run_profile is not None:
+    run_profile.finish()
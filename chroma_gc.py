@@ -0,0 +1,206 @@
+"""
+Chroma GC - Garbage collection and footprint report for the vector stores.
+
+Deleting and recreating collections (as embedder.py used to) leaves the old
+HNSW segment directories behind: Chroma drops the rows from chroma.sqlite3
+but never removes the files. Every rebuild added more dead directories to
+data/chroma_db, and Chroma scans the directory when it starts.
+
+For each store (the legacy data/chroma_db and every data/indexes/ version)
+this tool:
+  - reads the live segments from the `segments` table in
+    chroma.sqlite3 and lists segment directories not referenced there;
+  - reports per-collection vector count, on-disk size and load time;
+  - with --apply, deletes the orphaned directories and VACUUMs the
+    SQLite file to give back its free pages.
+The default is a dry run. Only directories named like a segment (a UUID)
+are ever deleted, and nothing is deleted from a store without a readable
+chroma.sqlite3.
+
+Usage:
+    python chroma_gc.py [--apply] [store paths...]
+"""
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import time
+
+from index_versions import INDEXES_DIR
+
+LEGACY_DB_PATH = "data/chroma_db"
+SQLITE_NAME = "chroma.sqlite3"
+SEGMENT_DIR_PATTERN = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$")
+
+
+def store_paths():
+    """The legacy store plus every versioned index directory."""
+    paths = [LEGACY_DB_PATH] if os.path.isdir(LEGACY_DB_PATH) else []
+    if os.path.isdir(INDEXES_DIR):
+        paths += [
+            os.path.join(INDEXES_DIR, name) for name in sorted(os.listdir(INDEXES_DIR))
+            if os.path.isdir(os.path.join(INDEXES_DIR, name))
+        ]
+    return paths
+
+
+def dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def format_size(n_bytes):
+    for unit in ("B", "KB", "MB", "GB"):
+        if n_bytes < 1024 or unit == "GB":
+            return f"{n_bytes:.0f} {unit}" if unit == "B" else f"{n_bytes:.1f} {unit}"
+        n_bytes /= 1024
+
+
+def read_catalog(path):
+    """Collections and live segments from chroma.sqlite3 (read-only), or None if unreadable."""
+    db_file = os.path.join(path, SQLITE_NAME)
+    if not os.path.exists(db_file):
+        return None
+    try:
+        conn = sqlite3.connect(f"file:{db_file}?mode=ro", uri=True)
+    except sqlite3.Error:
+        return None
+    try:
+        collections = {
+            collection_id: {"name": name, "dimension": dimension, "vector_segment": None, "vectors": 0}
+            for collection_id, name, dimension in conn.execute("SELECT id, name, dimension FROM collections")
+        }
+        live_segments = set()
+        for segment_id, scope, collection_id in conn.execute("SELECT id, scope, collection FROM segments"):
+            live_segments.add(segment_id)
+            if collection_id not in collections:
+                continue
+            if scope == "VECTOR":
+                collections[collection_id]["vector_segment"] = segment_id
+            elif scope == "METADATA":
+                collections[collection_id]["metadata_segment"] = segment_id
+        counts = dict(conn.execute("SELECT segment_id, COUNT(*) FROM embeddings GROUP BY segment_id"))
+        for info in collections.values():
+            info["vectors"] = counts.get(info.get("metadata_segment"), 0)
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    except sqlite3.Error as e:
+        print(f"  Could not read {db_file}: {e}")
+        return None
+    finally:
+        conn.close()
+    return {
+        "collections": collections,
+        "live_segments": live_segments,
+        "sqlite_bytes": os.path.getsize(db_file),
+        "free_bytes": page_size * free_pages,
+    }
+
+
+def orphaned_segments(path, catalog):
+    """Segment directories on disk that no live segment refers to."""
+    live = catalog["live_segments"] if catalog else set()
+    return sorted(
+        name for name in os.listdir(path)
+        if SEGMENT_DIR_PATTERN.match(name) and os.path.isdir(os.path.join(path, name)) and name not in live
+    )
+
+
+def measure_load_ms(path, catalog):
+    """Time to open each collection and run its first query (loads the HNSW index)."""
+    import chromadb
+
+    client = chromadb.PersistentClient(path=path)
+    timings = {}
+    for info in catalog["collections"].values():
+        start = time.perf_counter()
+        try:
+            collection = client.get_collection(name=info["name"])
+            if info["vectors"] and info["dimension"]:
+                collection.query(query_embeddings=[[0.0] * info["dimension"]], n_results=1)
+            timings[info["name"]] = (time.perf_counter() - start) * 1000
+        except Exception as e:
+            print(f"  Could not load {info['name']}: {e}")
+    return timings
+
+
+def vacuum(path):
+    db_file = os.path.join(path, SQLITE_NAME)
+    before = os.path.getsize(db_file)
+    try:
+        conn = sqlite3.connect(db_file, timeout=5)
+        conn.execute("VACUUM")
+        conn.close()
+    except sqlite3.Error as e:
+        print(f"  VACUUM skipped ({e}); retry when nothing is writing to the store")
+        return 0
+    return before - os.path.getsize(db_file)
+
+
+def collect(path, apply=False, measure=True):
+    """Report on one store and (with apply=True) remove its orphaned segments.
+
+    Returns a summary dict for callers such as embedder.py.
+    """
+    print(f"\n{path}")
+    catalog = read_catalog(path)
+    orphans = orphaned_segments(path, catalog)
+    orphan_bytes = sum(dir_size(os.path.join(path, name)) for name in orphans)
+    summary = {"path": path, "orphans": len(orphans), "orphan_bytes": orphan_bytes, "removed": 0, "freed_bytes": 0}
+
+    if catalog is None:
+        print(f"  No readable {SQLITE_NAME}: {len(orphans)} segment dir(s) ({format_size(orphan_bytes)}) "
+              "are not used by Chroma, but nothing is deleted without a catalog.")
+        return summary
+
+    timings = measure_load_ms(path, catalog) if measure else {}
+    print(f"  {'Collection':<32} {'Vectors':>8} {'Size':>10} {'Load ms':>8}")
+    for info in sorted(catalog["collections"].values(), key=lambda c: c["name"]):
+        segment_dir = os.path.join(path, info["vector_segment"] or "")
+        size = dir_size(segment_dir) if info["vector_segment"] and os.path.isdir(segment_dir) else 0
+        load = f"{timings[info['name']]:.0f}" if info["name"] in timings else "-"
+        print(f"  {info['name']:<32} {info['vectors']:>8} {format_size(size):>10} {load:>8}")
+    print(f"  SQLite: {format_size(catalog['sqlite_bytes'])} ({format_size(catalog['free_bytes'])} reclaimable)")
+    print(f"  Orphaned segment dirs: {len(orphans)} ({format_size(orphan_bytes)})")
+
+    if not apply:
+        if orphans or catalog["free_bytes"]:
+            print("  Dry run: re-run with --apply to delete them and vacuum.")
+        return summary
+
+    for name in orphans:
+        shutil.rmtree(os.path.join(path, name))
+    freed = orphan_bytes
+    if catalog["free_bytes"]:
+        freed += vacuum(path)
+    summary["removed"] = len(orphans)
+    summary["freed_bytes"] = freed
+    print(f"  Removed {len(orphans)} orphaned segment dir(s); freed {format_size(freed)}")
+    return summary
+
+
+def main(args):
+    apply = "--apply" in args
+    paths = [a for a in args if not a.startswith("--")] or store_paths()
+    if not paths:
+        print("No Chroma stores found.")
+        return
+    summaries = [collect(path, apply=apply) for path in paths]
+    orphans = sum(s["orphans"] for s in summaries)
+    orphan_bytes = sum(s["orphan_bytes"] for s in summaries)
+    print(f"\nFound {orphans} orphaned segment dir(s), {format_size(orphan_bytes)} across {len(paths)} store(s)")
+    if apply:
+        removed = sum(s["removed"] for s in summaries)
+        freed = sum(s["freed_bytes"] for s in summaries)
+        print(f"Removed {removed}, freed {format_size(freed)}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
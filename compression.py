@@ -0,0 +1,178 @@
+"""
+Context Compression - Sentence-level extraction from retrieved articles.
+
+The prompt used to carry the whole body of every retrieved article, even
+though a question is usually answered by a handful of sentences. At build
+time embedder.py now also embeds every sentence of every article and writes
+a sentence index next to the mmap export (data/indexes/<version>/mmap/):
+    <category>.sentences.npy        float32 (S x dim) unit-length sentence vectors
+    <category>.sentence_docs.npy    int32 (S,) row of the article in sentence_ids.json
+    <category>.sentence_spans.npy   int32 (S x 2) [start, end) character span in the document
+    <category>.sentence_tokens.npy  int32 (S,) approximate token count
+    <category>.sentence_ids.json    document ids, in row order
+
+At query time the sentences of the retrieved articles are scored against
+the query vector (already cached by query_cache) in one matrix-vector
+product. The best ones are kept, in reading order, until
+CONTEXT_BUDGET_TOKENS is reached. Each article keeps its header. A kept
+sentence also keeps the question-style subheading just before it
+("When can I opt out?"), and a kept subheading keeps the sentence after
+it. Sentences are never cut, so markdown links stay whole. Links that
+were in dropped sentences are listed under any article that keeps text
+(up to MAX_LINKS_PER_DOC), so the model can still point members to them.
+
+Set CONTEXT_BUDGET_TOKENS=0 to send whole articles again.
+"""
+import json
+import os
+import re
+import shutil
+
+import numpy as np
+
+from dedup import approx_tokens, split_passages
+
+CONTEXT_BUDGET_TOKENS = int(os.environ.get("CONTEXT_BUDGET_TOKENS", "400"))
+MAX_LINKS_PER_DOC = 3
+EMBED_BATCH_SIZE = 256
+SENTENCE_FILES = ("sentences.npy", "sentence_docs.npy", "sentence_spans.npy", "sentence_tokens.npy", "sentence_ids.json")
+LINK_PATTERN = re.compile(r"\[[^\]]+\]\(https?://[^)\s]+\)")
+
+
+def _file(directory, category, suffix):
+    return os.path.join(directory, f"{category.lower()}.{suffix}")
+
+
+def sentence_spans(document):
+    """[(start, end)] of each sentence of an article's body (the 'Header:' line is skipped)."""
+    spans = []
+    lines = document.split("\n")
+    body_start = len(lines[0]) + 1 if lines and lines[0].startswith("Header:") else 0
+    cursor = body_start
+    for _, sentence in split_passages(document[body_start:]):
+        start = document.find(sentence, cursor)
+        if start < 0:
+            continue
+        spans.append((start, start + len(sentence)))
+        cursor = start + len(sentence)
+    return spans
+
+
+def write_sentence_index(directory, category, ids, documents, embed):
+    """Embed every sentence of a shard's documents and write the index (temp files, then rename)."""
+    os.makedirs(directory, exist_ok=True)
+    doc_rows, spans, texts = [], [], []
+    for row, document in enumerate(documents):
+        for start, end in sentence_spans(document):
+            doc_rows.append(row)
+            spans.append((start, end))
+            texts.append(document[start:end])
+
+    vectors = [
+        np.asarray(embed(texts[i:i + EMBED_BATCH_SIZE]), dtype=np.float32)
+        for i in range(0, len(texts), EMBED_BATCH_SIZE)
+    ]
+    vectors = np.vstack(vectors) if vectors else np.zeros((0, 1), dtype=np.float32)
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+    arrays = {
+        "sentences.npy": vectors,
+        "sentence_docs.npy": np.asarray(doc_rows, dtype=np.int32),
+        "sentence_spans.npy": np.asarray(spans, dtype=np.int32).reshape(-1, 2),
+        "sentence_tokens.npy": np.asarray([approx_tokens(text) for text in texts], dtype=np.int32),
+    }
+    for suffix, array in arrays.items():
+        with open(_file(directory, category, suffix) + ".tmp", "wb") as f:
+            np.save(f, array)
+    with open(_file(directory, category, "sentence_ids.json") + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(list(ids), f)
+    for suffix in SENTENCE_FILES:
+        path = _file(directory, category, suffix)
+        os.replace(path + ".tmp", path)
+    return len(texts)
+
+
+def has_sentence_index(directory, category):
+    return os.path.exists(_file(directory, category, "sentence_ids.json"))
+
+
+def copy_sentence_index(source_directory, directory, category):
+    """Carry a sentence index over from another version (shard not rebuilt). False if there is none."""
+    if not has_sentence_index(source_directory, category):
+        return False
+    os.makedirs(directory, exist_ok=True)
+    for suffix in SENTENCE_FILES:
+        shutil.copyfile(_file(source_directory, category, suffix), _file(directory, category, suffix))
+    return True
+
+
+class SentenceIndex:
+    """Read-only, memory-mapped sentence index of one shard."""
+
+    def __init__(self, directory, category):
+        self.vectors = np.load(_file(directory, category, "sentences.npy"), mmap_mode="r")
+        self.doc_rows = np.load(_file(directory, category, "sentence_docs.npy"))
+        self.spans = np.load(_file(directory, category, "sentence_spans.npy"))
+        self.tokens = np.load(_file(directory, category, "sentence_tokens.npy"))
+        with open(_file(directory, category, "sentence_ids.json"), "r", encoding="utf-8") as f:
+            self.row_of = {doc_id: row for row, doc_id in enumerate(json.load(f))}
+
+    def __len__(self):
+        return len(self.doc_rows)
+
+    def compress(self, query_vector, ids, documents, budget=CONTEXT_BUDGET_TOKENS):
+        """Compressed copies of `documents` (same order), or None if any id isn't indexed."""
+        rows = [self.row_of.get(doc_id) for doc_id in ids]
+        if any(row is None for row in rows):
+            return None
+        candidates = np.flatnonzero(np.isin(self.doc_rows, rows))
+        if not len(candidates):
+            return None
+
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        scores = self.vectors[candidates] @ query
+        ranked = candidates[np.argsort(-scores, kind="stable")]
+
+        def text(s):
+            row = rows.index(int(self.doc_rows[s]))
+            start, end = self.spans[s]
+            return documents[row][start:end]
+
+        # Greedy by score; a sentence that doesn't fit is skipped, smaller ones may still fit
+        chosen, used = set(), 0
+        for s in ranked:
+            s = int(s)
+            if s in chosen:
+                continue
+            extra = [s]
+            same_doc = lambda i: 0 <= i < len(self.doc_rows) and self.doc_rows[i] == self.doc_rows[s]
+            if text(s).endswith("?") and same_doc(s + 1) and s + 1 not in chosen:
+                extra.append(s + 1)  # A subheading alone doesn't answer anything
+            elif same_doc(s - 1) and s - 1 not in chosen and text(s - 1).endswith("?"):
+                extra.insert(0, s - 1)
+            cost = int(sum(self.tokens[i] for i in extra))
+            if chosen and used + cost > budget:
+                continue
+            chosen.update(extra)
+            used += cost
+
+        compressed = []
+        for row, document in zip(rows, documents):
+            sentences = np.flatnonzero(self.doc_rows == row)
+            header = document.split("\n", 1)[0] if document.startswith("Header:") else ""
+            kept, links, previous = [], [], None
+            for s in sentences:
+                s = int(s)
+                if s in chosen:
+                    # Non-adjacent sentences start a new line so gaps are visible
+                    separator = " " if previous is not None and previous == s - 1 else "\n"
+                    kept.append((separator if kept else "") + text(s))
+                    previous = s
+                else:
+                    links += [link for link in LINK_PATTERN.findall(text(s)) if link not in links]
+            body = "".join(kept)
+            if links and kept:
+                body += ("\n" if body else "") + "Links: " + ", ".join(links[:MAX_LINKS_PER_DOC])
+            compressed.append(f"{header}\n\n{body}" if header else body)
+        return compressed
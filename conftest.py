@@ -0,0 +1,2 @@
+# test_ollama.py is a manual check against a running Ollama server, not a pytest module
+collect_ignore = ["test_ollama.py"]
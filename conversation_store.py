@@ -0,0 +1,179 @@
+"""
+Conversation Store - Bounded per-session chat history.
+
+Keeps the most recent messages verbatim for display and prompting, folds
+older turns into a short rolling summary, and builds the transcript
+incrementally (one entry per message) so ending a chat or rerunning the
+script never re-stringifies the whole history. The download text is built
+from the transcript only when it is asked for. Every message gets a stable
+id, and its display markdown is built once and cached by id.
+
+Every part has a hard size cap. Recent messages share their text with the
+transcript (MAX_RECENT_MESSAGES messages of MAX_MESSAGE_CHARS fit in the
+transcript cap), so a session holds at most MAX_SESSION_CHARS characters
+of text however long it runs.
+"""
+import datetime
+
+MAX_RECENT_MESSAGES = 24       # Messages kept verbatim (UI + prompt window)
+MAX_MESSAGE_CHARS = 4000       # Longest single message we keep (answers are capped at 512 tokens)
+MAX_SUMMARY_CHARS = 1500       # Rolling summary of evicted turns
+MAX_TRANSCRIPT_CHARS = 100000  # Transcript kept for logging / download
+MAX_DISPLAY_CHARS = 20000      # Cached display markdown (a screenful of recent messages)
+MAX_SESSION_CHARS = MAX_TRANSCRIPT_CHARS + MAX_SUMMARY_CHARS + MAX_DISPLAY_CHARS
+SUMMARY_LINE_CHARS = 120
+OMITTED_MARKER = "[... earlier messages omitted ...]"
+
+
+def get_time_str():
+    return datetime.datetime.now().strftime("%H:%M:%S")
+
+
+def _first_sentence(text, limit):
+    text = " ".join(text.split())
+    for end in (". ", "? ", "! ", "\n"):
+        idx = text.find(end)
+        if 0 < idx < limit:
+            return text[:idx + 1]
+    return text[:limit] + ("..." if len(text) > limit else "")
+
+
+class ConversationStore:
+    """Chat history for one session with bounded memory."""
+
+    def __init__(self, greeting=None):
+        self.messages = []          # Recent messages, oldest first
+        self.summary_lines = []     # One short line per evicted message
+        self.transcript = []        # (role, content, meta) for every message, capped
+        self.transcript_chars = 0
+        self.omitted = False        # True once the transcript cap dropped early entries
+        self._display = {}          # Message id -> display markdown (recent messages only)
+        self._display_chars = 0
+        self.next_id = 0
+        if greeting:
+            self.append("assistant", greeting, onboarding=True)
+
+    # -- Writing ----------------------------------------------------------------
+
+    def append(self, role, content, timestamp=None, **extra):
+        """Add a message, evicting older ones into the summary if needed."""
+        content = content or ""
+        if len(content) > MAX_MESSAGE_CHARS:
+            content = content[:MAX_MESSAGE_CHARS] + "..."
+        msg = {"id": self.next_id, "role": role, "content": content, "timestamp": timestamp or get_time_str()}
+        msg.update(extra)
+        self.next_id += 1
+        self.messages.append(msg)
+
+        # Full date and time plus sources/flags, for the per-turn analytics log
+        meta = dict(extra, time=datetime.datetime.now().isoformat(timespec="seconds"))
+        self.transcript.append((role, content, meta))
+        self.transcript_chars += len(content)
+        while self.transcript_chars > MAX_TRANSCRIPT_CHARS and len(self.transcript) > 1:
+            _, dropped, _ = self.transcript.pop(0)
+            self.transcript_chars -= len(dropped)
+            self.omitted = True
+
+        while len(self.messages) > MAX_RECENT_MESSAGES:
+            evicted = self.messages.pop(0)
+            self._display_chars -= len(self._display.pop(evicted["id"], ""))
+            self._summarize(evicted)
+        return msg
+
+    def _summarize(self, msg):
+        prefix = "User asked" if msg["role"] == "user" else "Bot answered"
+        self.summary_lines.append(f"{prefix}: {_first_sentence(msg['content'], SUMMARY_LINE_CHARS)}")
+        while sum(len(line) for line in self.summary_lines) > MAX_SUMMARY_CHARS:
+            self.summary_lines.pop(0)
+
+    # -- Persistence ------------------------------------------------------------
+
+    def to_dict(self):
+        """Plain data for session_store (render caches are left out and rebuilt on use).
+
+        Recent messages are the tail of the transcript, so their text is
+        stored once, in the transcript.
+        """
+        offset = len(self.transcript) - len(self.messages)
+        messages = []
+        for i, msg in enumerate(self.messages):
+            record = {key: value for key, value in msg.items() if key != "content"}
+            if offset + i < 0 or self.transcript[offset + i][1] != msg["content"]:
+                record["content"] = msg["content"]
+            messages.append(record)
+        return {
+            "messages": messages,
+            "summary_lines": self.summary_lines,
+            "transcript": [[role, content, meta] for role, content, meta in self.transcript],
+            "omitted": self.omitted,
+            "next_id": self.next_id,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        store = cls()
+        store.summary_lines = list(data["summary_lines"])
+        store.transcript = [(role, content, meta) for role, content, meta in data["transcript"]]
+        store.transcript_chars = sum(len(content) for _, content, _ in store.transcript)
+        store.omitted = data["omitted"]
+        store.next_id = data["next_id"]
+        offset = len(store.transcript) - len(data["messages"])
+        for i, record in enumerate(data["messages"]):
+            msg = dict(record)
+            if "content" not in msg:
+                msg["content"] = store.transcript[offset + i][1]
+            store.messages.append(msg)
+        return store
+
+    # -- Reading ----------------------------------------------------------------
+
+    @property
+    def summary(self):
+        return "\n".join(self.summary_lines)
+
+    @property
+    def last(self):
+        return self.messages[-1] if self.messages else None
+
+    def display_markdown(self, msg):
+        """Markdown shown in the chat bubble: the content plus a small timestamp."""
+        body = self._display.get(msg["id"])
+        if body is None:
+            body = f"{msg['content']}\n\n:small[:gray[_{msg['timestamp']}_]]"
+            self._display[msg["id"]] = body
+            self._display_chars += len(body)
+            while self._display_chars > MAX_DISPLAY_CHARS and len(self._display) > 1:
+                self._display_chars -= len(self._display.pop(next(iter(self._display))))
+        return body
+
+    def transcript_messages(self):
+        """Transcript as message dicts (with time, sources, onboarding), for feedback_manager.log_chat."""
+        entries = [dict(meta, role=role, content=content) for role, content, meta in self.transcript]
+        if self.omitted:
+            entries.insert(0, {"role": "system", "content": OMITTED_MARKER})
+        return entries
+
+    def transcript_text(self, user_name):
+        """Plain-text transcript body ('Bot: ...' / '<name>: ...').
+
+        Built on each call and not kept: the download button asks for it
+        only when clicked, so the session never holds a second copy.
+        """
+        return (OMITTED_MARKER + "\n\n" if self.omitted else "") + "".join(
+            f"{'Bot' if role == 'assistant' else user_name}: {content}\n\n"
+            for role, content, _ in self.transcript
+        )
+
+    def log_text(self):
+        """Compact 'Role: content' transcript for Google Sheets logging."""
+        return "\n".join(
+            f"{entry['role'].capitalize()}: {entry['content']}" for entry in self.transcript_messages()
+        )
+
+    def approx_bytes(self):
+        """Approximate payload size held by this session (characters of text).
+
+        Recent messages share their strings with the transcript, so they are
+        not counted twice. At most MAX_SESSION_CHARS.
+        """
+        return self.transcript_chars + len(self.summary) + self._display_chars
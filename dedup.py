@@ -0,0 +1,281 @@
+"""
+Dedup - Near-duplicate detection for ingest and retrieval.
+
+Help articles repeat whole blocks of text (login steps, where to find your
+Nest ID, how to send documents). Indexed as-is, one question retrieves
+three near-identical hits, and the prompt carries the same sentences
+several times. This module provides:
+
+  - Document level: MinHash signatures over word shingles, with LSH
+    banding to find candidate pairs. An article whose estimated Jaccard
+    similarity to an earlier one is DOC_DUPLICATE_JACCARD or more is
+    dropped, and its URL is recorded on the kept copy.
+  - Passage level: 64-bit SimHash fingerprints of every sentence. Passages
+    within SIMHASH_MAX_DISTANCE bits of each other are one group (found
+    by banding: with 4 bands of 16 bits, two fingerprints within 3 bits
+    share at least one band exactly). A group that appears in
+    BOILERPLATE_MIN_DOCS or more articles is boilerplate. It is kept in
+    its owner article, the shortest one it appears in, and elsewhere it
+    is replaced by one "See also" link to that article.
+  - Retrieval: mmr() re-ranks candidates by maximal marginal relevance,
+    and drop_repeated_passages() removes passages a prompt already holds.
+
+Usage:
+    python dedup.py          # report on data/scraped_content.json
+"""
+import hashlib
+import json
+import os
+import re
+
+import numpy as np
+
+INPUT_FILE = "data/scraped_content.json"
+
+# Sentence ends: . ? ! or a markdown link closing a sentence ("...opted out?](url) How do I...")
+SENTENCE_SPLIT = re.compile(r"(?<=[.?!)])\s+(?=[A-Z\[(“‘'\"])")
+WORD_PATTERN = re.compile(r"\w+")
+# Rough LLM token count: words and punctuation marks
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+SHINGLE_WORDS = 3
+# Shorter passages (headings, "Select 'Continue'.") are never treated as boilerplate
+MIN_PASSAGE_CHARS = int(os.environ.get("DEDUP_MIN_PASSAGE_CHARS", "60"))
+SIMHASH_MAX_DISTANCE = int(os.environ.get("DEDUP_SIMHASH_DISTANCE", "3"))
+SIMHASH_BANDS = 4
+BOILERPLATE_MIN_DOCS = int(os.environ.get("DEDUP_BOILERPLATE_DOCS", "2"))
+MINHASH_PERMUTATIONS = 64
+MINHASH_BANDS = 16
+DOC_DUPLICATE_JACCARD = float(os.environ.get("DEDUP_DOC_JACCARD", "0.85"))
+_MERSENNE = (1 << 31) - 1
+_rng = np.random.default_rng(20240901)
+_MINHASH_A = _rng.integers(1, _MERSENNE, MINHASH_PERMUTATIONS, dtype=np.uint64)
+_MINHASH_B = _rng.integers(0, _MERSENNE, MINHASH_PERMUTATIONS, dtype=np.uint64)
+_BITS = np.arange(64, dtype=np.uint64)
+
+
+def approx_tokens(text):
+    return len(TOKEN_PATTERN.findall(text))
+
+
+def split_passages(content):
+    """[(line number, sentence)] in reading order."""
+    passages = []
+    for line_no, line in enumerate(content.split("\n")):
+        for sentence in SENTENCE_SPLIT.split(line.strip()):
+            if sentence:
+                passages.append((line_no, sentence))
+    return passages
+
+
+def join_passages(passages):
+    lines = {}
+    for line_no, sentence in passages:
+        lines.setdefault(line_no, []).append(sentence)
+    return "\n".join(" ".join(lines[line_no]) for line_no in sorted(lines))
+
+
+def shingle_hashes(text, k=SHINGLE_WORDS):
+    """64-bit hashes of the word k-grams of a text (the text itself if it is shorter)."""
+    words = WORD_PATTERN.findall(text.lower())
+    grams = {" ".join(words[i:i + k]) for i in range(max(len(words) - k + 1, 1))}
+    return np.array(
+        [int.from_bytes(hashlib.blake2b(g.encode("utf-8"), digest_size=8).digest(), "little") for g in grams],
+        dtype=np.uint64,
+    )
+
+
+def simhash(text):
+    """64-bit SimHash: each bit is the majority vote of that bit over the shingle hashes."""
+    hashes = shingle_hashes(text)
+    bits = (hashes[:, None] >> _BITS) & np.uint64(1)
+    votes = (2 * bits.astype(np.int32) - 1).sum(axis=0)
+    return int(((votes > 0).astype(np.uint64) << _BITS).sum())
+
+
+def hamming64(a, b):
+    return bin(a ^ b).count("1")
+
+
+def minhash(text):
+    """MinHash signature of a text's shingle set (one min per permutation)."""
+    x = shingle_hashes(text) & np.uint64(0xFFFFFFFF)
+    return ((x[:, None] * _MINHASH_A + _MINHASH_B) % np.uint64(_MERSENNE)).min(axis=0)
+
+
+def _band_candidates(keys_per_item):
+    """Pairs of items that share at least one band key."""
+    buckets = {}
+    for item, keys in enumerate(keys_per_item):
+        for band, key in enumerate(keys):
+            buckets.setdefault((band, key), []).append(item)
+    pairs = set()
+    for items in buckets.values():
+        for i in range(len(items)):
+            for j in range(i + 1, len(items)):
+                pairs.add((items[i], items[j]))
+    return pairs
+
+
+def _groups(n, pairs):
+    """Connected components (union-find) of items 0..n-1 over the given pairs."""
+    parent = list(range(n))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for a, b in pairs:
+        parent[find(a)] = find(b)
+    groups = {}
+    for i in range(n):
+        groups.setdefault(find(i), []).append(i)
+    return list(groups.values())
+
+
+def near_duplicate_passages(fingerprints, max_distance=SIMHASH_MAX_DISTANCE):
+    """Groups of passage indices whose SimHash fingerprints are within max_distance bits."""
+    width = 64 // SIMHASH_BANDS
+    mask = (1 << width) - 1
+    keys = [[(fp >> (band * width)) & mask for band in range(SIMHASH_BANDS)] for fp in fingerprints]
+    pairs = {
+        (a, b) for a, b in _band_candidates(keys)
+        if hamming64(fingerprints[a], fingerprints[b]) <= max_distance
+    }
+    return [group for group in _groups(len(fingerprints), pairs) if len(group) > 1]
+
+
+def near_duplicate_documents(texts, threshold=DOC_DUPLICATE_JACCARD):
+    """(earlier, later, estimated Jaccard) for document pairs at or above the threshold."""
+    signatures = [minhash(text) for text in texts]
+    rows = MINHASH_PERMUTATIONS // MINHASH_BANDS
+    keys = [[sig[b * rows:(b + 1) * rows].tobytes() for b in range(MINHASH_BANDS)] for sig in signatures]
+    found = []
+    for a, b in sorted(_band_candidates(keys)):
+        jaccard = float(np.mean(signatures[a] == signatures[b]))
+        if jaccard >= threshold:
+            found.append((a, b, jaccard))
+    return found
+
+
+def dedupe_corpus(items):
+    """Drop duplicate articles and factor out boilerplate passages.
+
+    `items` are scraped_content.json records of one category. Returns
+    (items, report): new records (inputs are not modified) and counts of
+    what was removed.
+    """
+    report = {
+        "documents_in": len(items), "documents_dropped": 0, "boilerplate_groups": 0,
+        "passages_factored": 0, "chars_in": sum(len(item["content"]) for item in items),
+    }
+
+    # 1. Whole articles that are near-copies of an earlier one
+    dropped = {}
+    for a, b, _ in near_duplicate_documents([f"{item['header']}\n{item['content']}" for item in items]):
+        if a not in dropped and b not in dropped:
+            dropped[b] = a
+    kept = [i for i in range(len(items)) if i not in dropped]
+    records = {i: dict(items[i]) for i in kept}
+    for b, a in dropped.items():
+        records[a]["duplicate_urls"] = records[a].get("duplicate_urls", []) + [items[b]["url"]]
+    report["documents_dropped"] = len(dropped)
+
+    # 2. Boilerplate sentences shared by several articles
+    passages = {i: split_passages(records[i]["content"]) for i in kept}
+    index = [(i, p) for i in kept for p, (_, text) in enumerate(passages[i]) if len(text) >= MIN_PASSAGE_CHARS]
+    fingerprints = [simhash(passages[i][p][1]) for i, p in index]
+    replace = {}  # (doc, passage) -> owner doc
+    for group in near_duplicate_passages(fingerprints):
+        docs = sorted({index[g][0] for g in group})
+        if len(docs) < BOILERPLATE_MIN_DOCS:
+            continue
+        owner = min(docs, key=lambda i: (len(passages[i]), i))
+        report["boilerplate_groups"] += 1
+        for g in group:
+            doc, p = index[g]
+            if doc != owner:
+                replace[(doc, p)] = owner
+
+    for i in kept:
+        out, referenced = [], set()
+        for p, (line_no, text) in enumerate(passages[i]):
+            owner = replace.get((i, p))
+            if owner is None:
+                out.append((line_no, text))
+                continue
+            report["passages_factored"] += 1
+            if owner not in referenced:
+                referenced.add(owner)
+                out.append((line_no, f"(See also: [{records[owner]['header']}]({records[owner]['url']}))"))
+        if referenced:
+            records[i]["content"] = join_passages(out)
+
+    deduped = [records[i] for i in kept]
+    report["documents_out"] = len(deduped)
+    report["chars_out"] = sum(len(item["content"]) for item in deduped)
+    return deduped, report
+
+
+def drop_repeated_passages(documents):
+    """Remove passages that repeat (near-)verbatim one already kept in an earlier document."""
+    seen, out = [], []
+    for document in documents:
+        kept = []
+        for line_no, text in split_passages(document):
+            if len(text) >= MIN_PASSAGE_CHARS:
+                fingerprint = simhash(text)
+                if any(hamming64(fingerprint, s) <= SIMHASH_MAX_DISTANCE for s in seen):
+                    continue
+                seen.append(fingerprint)
+            kept.append((line_no, text))
+        out.append(join_passages(kept))
+    return out
+
+
+def mmr(query_vector, vectors, n_results, lambda_=0.7):
+    """Indices of `n_results` candidates picked by maximal marginal relevance.
+
+    Candidates must be ordered best first. Each pick maximises
+    lambda * sim(query) - (1 - lambda) * max sim(already picked), cosine similarity.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if len(vectors) <= 1:
+        return list(range(len(vectors)))
+    unit = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    query = np.asarray(query_vector, dtype=np.float32)
+    relevance = unit @ (query / max(float(np.linalg.norm(query)), 1e-12))
+    similarity = unit @ unit.T
+    picked = [0]  # The best match always stays first
+    redundancy = similarity[0].copy()
+    while len(picked) < min(n_results, len(vectors)):
+        scores = lambda_ * relevance - (1 - lambda_) * redundancy
+        scores[picked] = -np.inf
+        best = int(np.argmax(scores))
+        picked.append(best)
+        redundancy = np.maximum(redundancy, similarity[best])
+    return picked
+
+
+def main():
+    with open(INPUT_FILE, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    by_category = {}
+    for item in data:
+        by_category.setdefault(item["category"], []).append(item)
+    for category, items in sorted(by_category.items()):
+        deduped, report = dedupe_corpus(items)
+        tokens_in = sum(approx_tokens(item["content"]) for item in items)
+        tokens_out = sum(approx_tokens(item["content"]) for item in deduped)
+        print(f"{category}: {report['documents_in']} -> {report['documents_out']} articles, "
+              f"{report['boilerplate_groups']} boilerplate groups, {report['passages_factored']} passages factored out")
+        print(f"  {report['chars_in']} -> {report['chars_out']} chars, ~{tokens_in} -> ~{tokens_out} tokens "
+              f"({100 * (1 - tokens_out / max(tokens_in, 1)):.1f}% smaller)")
+        for item in deduped:
+            if item.get("duplicate_urls"):
+                print(f"  {item['url']} also covers {', '.join(item['duplicate_urls'])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,374 @@
+"""
+Discover URLs - Finds the help-centre articles to scrape (replaces ingest_urls.py).
+
+ingest_urls.py read the article list from an Excel sheet on one machine,
+so adding an article meant editing the sheet and re-scraping everything.
+This crawler builds data/url_list.json from the site itself instead. For
+each category in SITES it:
+  - reads robots.txt (Disallow rules and Sitemap: lines, falling back to
+    /sitemap.xml) and walks the sitemaps, following sitemap indexes, to
+    collect article URLs under the category's path prefix with their
+    <lastmod>;
+  - starts from the help-centre index page (the page fetch_site.py saves)
+    and follows links from every page found, in-article links included, as
+    long as they stay under the prefix. Fragments and query strings are
+    dropped, so one article is one URL.
+
+data/crawl_state.json remembers each URL's lastmod, ETag, Last-Modified,
+content hash and outgoing links. On a re-crawl a page whose sitemap lastmod
+is unchanged is not requested at all. Other pages are requested
+conditionally (If-None-Match / If-Modified-Since), and a 304 reuses the
+stored links. Each entry in url_list.json is marked "new", "changed" or
+"unchanged" (changed means the extracted article text differs) and carries
+the hash of that text. `python scraper.py --changed-only` fetches only the
+pages whose hash differs from the one stored with their scraped record, so
+an edit is still scraped if discovery runs again first or the scraper
+failed on the page.
+
+Usage:
+    python discover_urls.py                 # crawl SITES, write url_list.json
+    python discover_urls.py --fixture       # crawl fixtures/help_site on a local server and check the results
+"""
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import xml.etree.ElementTree as ET
+from collections import deque
+from datetime import datetime
+from urllib.parse import urldefrag, urljoin, urlparse
+from urllib.robotparser import RobotFileParser
+
+import requests
+from bs4 import BeautifulSoup
+
+from scraper import HEADERS, article_hash, extract_article
+
+OUTPUT_FILE = "data/url_list.json"
+STATE_FILE = "data/crawl_state.json"
+FIXTURE_DIR = "fixtures/help_site"
+
+# One entry per help centre: where to start and which paths count as its articles
+SITES = {
+    "Member": {
+        "start_url": "https://www.nestpensions.org.uk/schemeweb/memberhelpcentre.html",
+        "prefix": "/schemeweb/memberhelpcentre/",
+    },
+}
+
+MAX_PAGES = 2000
+MAX_SITEMAPS = 50
+CRAWL_DELAY = 0.5  # Seconds between requests, unless robots.txt asks for more
+REQUEST_TIMEOUT = 10
+SITEMAP_NS = "{http://www.sitemaps.org/schemas/sitemap/0.9}"
+
+
+def normalize_url(url, base):
+    """Absolute URL without fragment or query string, or None for non-HTTP links."""
+    url, _ = urldefrag(urljoin(base, url.strip()))
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https"):
+        return None
+    return parsed._replace(query="", params="").geturl()
+
+
+def in_scope(url, start_url, prefix):
+    """An article of this help centre: same host, under the prefix, an .html page."""
+    parsed, start = urlparse(url), urlparse(start_url)
+    return parsed.netloc == start.netloc and parsed.path.startswith(prefix) and parsed.path.endswith(".html")
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def load_state(path=STATE_FILE):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_json(path, data):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=4)
+    os.replace(tmp_path, path)
+
+
+class Crawler:
+    """One crawl of one help centre, with a polite delay between requests."""
+
+    def __init__(self, category, start_url, prefix, state, delay=CRAWL_DELAY):
+        self.category = category
+        self.start_url = start_url
+        self.prefix = prefix
+        self.state = state
+        self.delay = delay
+        self.session = requests.Session()
+        self.session.headers.update(HEADERS)
+        self.robots = RobotFileParser()
+        self.requests = 0
+        self._last_request = 0.0
+
+    def get(self, url, headers=None):
+        wait = self._last_request + self.delay - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        self._last_request = time.monotonic()
+        self.requests += 1
+        return self.session.get(url, headers=headers or {}, timeout=REQUEST_TIMEOUT)
+
+    def read_robots(self):
+        robots_url = urljoin(self.start_url, "/robots.txt")
+        try:
+            response = self.get(robots_url)
+            lines = response.text.splitlines() if response.status_code == 200 else []
+        except requests.RequestException as e:
+            print(f"Warning: could not read {robots_url}: {e}")
+            lines = []
+        self.robots.parse(lines)
+        delay = self.robots.crawl_delay(HEADERS["User-Agent"])
+        if delay:
+            self.delay = max(self.delay, float(delay))
+        sitemaps = self.robots.site_maps() or ["/sitemap.xml"]
+        return [urljoin(robots_url, url) for url in sitemaps]
+
+    def allowed(self, url):
+        return self.robots.can_fetch(HEADERS["User-Agent"], url)
+
+    def read_sitemaps(self, sitemap_urls):
+        """{url: lastmod} for in-scope URLs listed in the sitemaps (indexes are followed)."""
+        found, queue, seen = {}, deque(sitemap_urls), set()
+        while queue and len(seen) < MAX_SITEMAPS:
+            sitemap_url = queue.popleft()
+            if sitemap_url in seen:
+                continue
+            seen.add(sitemap_url)
+            try:
+                response = self.get(sitemap_url)
+                if response.status_code != 200:
+                    continue
+                root = ET.fromstring(response.content)
+            except (requests.RequestException, ET.ParseError) as e:
+                print(f"Warning: could not read sitemap {sitemap_url}: {e}")
+                continue
+            if root.tag == f"{SITEMAP_NS}sitemapindex":
+                for loc in root.iter(f"{SITEMAP_NS}loc"):
+                    queue.append(urljoin(sitemap_url, loc.text.strip()))
+                continue
+            for entry in root.iter(f"{SITEMAP_NS}url"):
+                loc = entry.findtext(f"{SITEMAP_NS}loc")
+                url = normalize_url(loc, sitemap_url) if loc else None
+                if url and in_scope(url, self.start_url, self.prefix):
+                    found[url] = (entry.findtext(f"{SITEMAP_NS}lastmod") or "").strip() or None
+        return found
+
+    def links(self, html, url):
+        soup = BeautifulSoup(html, "html.parser")
+        base = soup.find("base", href=True)
+        base_url = urljoin(url, base["href"]) if base else url
+        found = set()
+        for a_tag in soup.find_all("a", href=True):
+            link = normalize_url(a_tag["href"], base_url)
+            if link and in_scope(link, self.start_url, self.prefix):
+                found.add(link)
+        return sorted(found)
+
+    def visit(self, url, lastmod):
+        """Fetch one page if it may have changed. Returns (status, links) or None if it is gone."""
+        previous = self.state.get(url)
+        if previous and lastmod and previous.get("lastmod") == lastmod and "links" in previous:
+            return "unchanged", previous["links"]
+
+        headers = {}
+        if previous and previous.get("etag"):
+            headers["If-None-Match"] = previous["etag"]
+        if previous and previous.get("last_modified"):
+            headers["If-Modified-Since"] = previous["last_modified"]
+        try:
+            response = self.get(url, headers)
+        except requests.RequestException as e:
+            print(f"Warning: could not fetch {url}: {e}")
+            return ("unchanged", previous.get("links", [])) if previous else None
+
+        if response.status_code == 304 and previous:
+            previous["lastmod"] = lastmod or previous.get("lastmod")
+            return "unchanged", previous.get("links", [])
+        if response.status_code in (404, 410):
+            return None
+        if response.status_code != 200:
+            print(f"Warning: {url} returned HTTP {response.status_code}")
+            return ("unchanged", previous.get("links", [])) if previous else None
+
+        links = self.links(response.content, url)
+        if url == self.start_url:
+            digest = content_hash(response.text)
+        else:
+            digest = article_hash(extract_article(response.content, url))
+        status = "new" if not previous else "changed" if previous.get("content_hash") != digest else "unchanged"
+        self.state[url] = {
+            "category": self.category,
+            "lastmod": lastmod or response.headers.get("Last-Modified"),
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "content_hash": digest,
+            "links": links,
+            "first_seen": previous.get("first_seen") if previous else datetime.now().isoformat(timespec="seconds"),
+        }
+        return status, links
+
+    def crawl(self):
+        """[{url, category, lastmod, status, content_hash}] for every article reachable under the prefix."""
+        sitemap_entries = self.read_sitemaps(self.read_robots())
+        queue = deque([self.start_url] + sorted(sitemap_entries))
+        seen = set(queue)
+        articles = {}
+        while queue and len(articles) < MAX_PAGES:
+            url = queue.popleft()
+            if not self.allowed(url):
+                continue
+            result = self.visit(url, sitemap_entries.get(url))
+            if result is None:
+                self.state.pop(url, None)
+                continue
+            status, links = result
+            if url != self.start_url:
+                articles[url] = {
+                    "url": url,
+                    "category": self.category,
+                    "lastmod": self.state[url]["lastmod"] if url in self.state else None,
+                    "status": status,
+                    "content_hash": self.state[url].get("content_hash") if url in self.state else None,
+                }
+            for link in links:
+                if link not in seen:
+                    seen.add(link)
+                    queue.append(link)
+        return [articles[url] for url in sorted(articles)]
+
+
+def discover(sites=SITES, output_file=OUTPUT_FILE, state_file=STATE_FILE, delay=CRAWL_DELAY):
+    state = load_state(state_file)
+    url_list = []
+    for category, site in sites.items():
+        crawler = Crawler(category, site["start_url"], site["prefix"], state, delay=delay)
+        articles = crawler.crawl()
+        # Forget pages of this category that were not reached this time
+        reached = {item["url"] for item in articles} | {site["start_url"]}
+        for url in [u for u, s in state.items() if s.get("category") == category and u not in reached]:
+            del state[url]
+        counts = {status: sum(item["status"] == status for item in articles) for status in ("new", "changed", "unchanged")}
+        print(f"{category}: {len(articles)} articles ({counts['new']} new, {counts['changed']} changed, "
+              f"{counts['unchanged']} unchanged) in {crawler.requests} requests")
+        url_list += articles
+
+    save_json(output_file, url_list)
+    save_json(state_file, state)
+    print(f"Saved {len(url_list)} URLs to {output_file}")
+    return url_list
+
+
+def run_fixture():
+    """Crawl a copy of fixtures/help_site served locally, edit one page, crawl again, and check the results.
+
+    Checks that out-of-prefix pages (linked or listed in the sitemap) and
+    robots-disallowed pages are never requested, that the re-crawl downloads only the edited
+    page, and that scraper.py --changed-only still picks the edit up when
+    discovery runs a third time before the scraper.
+    """
+    from functools import partial
+    from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+    import scraper
+
+    workdir = tempfile.mkdtemp(prefix="discover_fixture_")
+    site_dir = os.path.join(workdir, "site")
+    shutil.copytree(FIXTURE_DIR, site_dir)
+    served = []  # (path, HTTP status) of every request the site answered
+
+    class RecordingHandler(SimpleHTTPRequestHandler):
+        def log_request(self, code="-", size="-"):
+            served.append((self.path, int(code)))
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(RecordingHandler, directory=site_dir))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    root = f"http://127.0.0.1:{server.server_address[1]}"
+    prefix = "/schemeweb/memberhelpcentre/"
+    sites = {"Member": {"start_url": f"{root}/schemeweb/memberhelpcentre.html", "prefix": prefix}}
+    output_file = os.path.join(workdir, "url_list.json")
+    state_file = os.path.join(workdir, "crawl_state.json")
+    scraped_file = os.path.join(workdir, "scraped_content.json")
+    articles = {
+        prefix + "opting-out/how-to-opt-out.html",
+        prefix + "logging-into-account/log-into-my-account.html",
+        prefix + "logging-into-account/reset-password.html",
+    }
+    edited = prefix + "logging-into-account/reset-password.html"
+
+    def crawl(title):
+        del served[:]
+        print(title)
+        items = discover(sites, output_file, state_file, delay=0)
+        for item in items:
+            print(f"  {item['status']:<9} {urlparse(item['url']).path}")
+        statuses = {urlparse(item["url"]).path: item["status"] for item in items}
+        downloaded = {path for path, code in served if code == 200 and path.startswith(prefix)}
+        print(f"  {len(served)} requests: {', '.join(f'{path} {code}' for path, code in served)}")
+        return statuses, downloaded
+
+    try:
+        statuses, downloaded = crawl("First crawl:")
+        assert set(statuses) == articles, f"Wrong articles found: {sorted(statuses)}"
+        assert set(statuses.values()) == {"new"}, statuses
+        assert downloaded == articles, f"Wrong pages downloaded: {sorted(downloaded)}"
+        requested = {path for path, _ in served}
+        assert not any("/employerhelpcentre/" in path for path in requested), "Fetched a page outside the prefix"
+        assert not any("/private/" in path for path in requested), "Fetched a page robots.txt disallows"
+        assert not any("?" in path or "#" in path for path in requested), "Fetched a URL with a query or fragment"
+        assert len(served) == 7, f"Expected robots, 2 sitemaps, index and 3 articles; got {len(served)} requests"
+
+        assert len(scraper.main(True, output_file, scraped_file, delay=0)) == 3
+
+        # Edit the page that is only reachable through an in-article link
+        page = os.path.join(site_dir, edited.lstrip("/"))
+        with open(page, "r", encoding="utf-8") as f:
+            html = f.read()
+        with open(page, "w", encoding="utf-8") as f:
+            f.write(html.replace("follow the steps.", "follow the steps in the email we send you."))
+        later = time.time() + 5
+        os.utime(page, (later, later))
+
+        statuses, downloaded = crawl("\nSecond crawl (reset-password.html edited):")
+        assert statuses == {path: "changed" if path == edited else "unchanged" for path in articles}, statuses
+        assert downloaded == {edited}, f"Re-crawl downloaded {sorted(downloaded)}, expected only the edited page"
+        # robots, 2 sitemaps, index (304), edited page; sitemap pages with the same lastmod aren't requested
+        assert len(served) == 5, f"Expected 5 requests on the re-crawl, got {len(served)}"
+
+        # Discovery again before the scraper: the page is "unchanged" now, but
+        # its hash still differs from the scraped copy, so it is re-scraped
+        statuses, downloaded = crawl("\nThird crawl (before scraping):")
+        assert set(statuses.values()) == {"unchanged"} and not downloaded, statuses
+        rescraped = scraper.main(True, output_file, scraped_file, delay=0)
+        assert set(urlparse(url).path for url in rescraped) == {edited}, f"Re-scraped {sorted(rescraped)}"
+        with open(scraped_file, "r", encoding="utf-8") as f:
+            record = next(item for item in json.load(f) if item["url"].endswith(edited))
+        assert "in the email we send you" in record["content"]
+        assert len(scraper.main(True, output_file, scraped_file, delay=0)) == 0
+        print("\nFixture checks passed.")
+    finally:
+        server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    if "--fixture" in sys.argv[1:]:
+        run_fixture()
+    else:
+        discover()
@@ -1,87 +1,190 @@
 import chromadb
 from chromadb.utils import embedding_functions
+import hashlib
 import json
 import sys
 import os
+from datetime import datetime
+
+from compression import copy_sentence_index, write_sentence_index
+from dedup import dedupe_corpus
+from index_versions import activate, new_version, resolve, version_path, write_manifest
+from mmap_index import MmapShard, export_collection, mmap_dir
+from retrieval import CATEGORIES, DB_PATH, EMBEDDING_MODEL, normalize_category, shard_name
 
 # Force unbuffered output for real-time logging
 sys.stdout.reconfigure(encoding='utf-8')
 
 INPUT_FILE = "data/scraped_content.json"
-DB_PATH = "data/chroma_db"
-COLLECTION_NAME = "rag_knowledge_base"
-
-def create_embeddings():
-    if not os.path.exists(INPUT_FILE):
-        print(f"Input file {INPUT_FILE} not found. Run scraper.py first.")
-        return
-
-    print("Loading scraped content...", flush=True)
-    with open(INPUT_FILE, "r", encoding="utf-8") as f:
-        data = json.load(f)
-
-    print(f"Loaded {len(data)} documents. Initializing ChromaDB...")
-    
-    # Initialize ChromaDB Client
-    client = chromadb.PersistentClient(path=DB_PATH)
-    
-    # Use generic Sentence Transformer embedding function
-    # This automatically downloads 'all-MiniLM-L6-v2' (approx 80MB)
-    ef = embedding_functions.SentenceTransformerEmbeddingFunction(model_name="all-MiniLM-L6-v2")
-    
-    # Get or Create Collection
-    # We delete existing to ensure a fresh start on re-run (modular)
-    try:
-        client.delete_collection(name=COLLECTION_NAME)
-        print("Deleted existing collection to rebuild.")
-    except Exception:
-        pass # Collection didn't exist or couldn't be deleted
+# Drop duplicate articles and factor out shared boilerplate before embedding (INGEST_DEDUP=0 to disable)
+DEDUP_ENABLED = os.environ.get("INGEST_DEDUP", "1") != "0"
 
-    collection = client.create_collection(name=COLLECTION_NAME, embedding_function=ef)
+def build_shard(client, ef, category, items):
+    """Build the collection holding a single category's articles (into a fresh index version)."""
+    name = shard_name(category)
+    collection = client.create_collection(name=name, embedding_function=ef)
     
     # Prepare Batches (Chroma likes batches)
     documents = []
     metadatas = []
     ids = []
     
-    print("Generating embeddings and indexing...")
-    member_count = 0
-    skipped_count = 0
-    
-    for idx, item in enumerate(data):
-        # Member-only validation
-        if item.get("category") != "Member":
-            print(f"⚠️  Skipping non-Member article: {item.get('header', 'Unknown')} (Category: {item.get('category')})")
-            skipped_count += 1
-            continue
-        
+    for idx, item in enumerate(items):
         # Combined text for embedding context
         text_content = f"Header: {item['header']}\n\n{item['content']}"
         
         documents.append(text_content)
-        metadatas.append({
+        metadata = {
             "url": item["url"],
             "category": item["category"],
             "header": item["header"]
-        })
-        ids.append(str(member_count))
-        member_count += 1
-    
-    print(f"\n✅ Member articles to embed: {member_count}")
-    print(f"⏭️  Non-Member articles skipped: {skipped_count}")
+        }
+        if item.get("duplicate_urls"):
+            metadata["duplicate_urls"] = " ".join(item["duplicate_urls"])
+        metadatas.append(metadata)
+        ids.append(str(idx))
     
     # Add in batches of 100 to avoid hitting limits or memory issues
     batch_size = 100
     for i in range(0, len(documents), batch_size):
         batch_end = i + batch_size
-        print(f"Processing batch {i} to {batch_end}...", flush=True)
+        print(f"[{category}] Processing batch {i} to {batch_end}...", flush=True)
         collection.add(
             documents=documents[i:batch_end],
             metadatas=metadatas[i:batch_end],
             ids=ids[i:batch_end]
         )
-        
-    print(f"Successfully embedded {len(documents)} documents into {DB_PATH}")
+    return len(documents)
+
+def copy_shard(source_client, client, ef, category):
+    """Carry a shard that isn't being rebuilt over from the serving index, without re-embedding."""
+    name = shard_name(category)
+    try:
+        source = source_client.get_collection(name=name)
+    except Exception:
+        return 0
+    stored = source.get(include=["embeddings", "documents", "metadatas"])
+    collection = client.create_collection(name=name, embedding_function=ef)
+    batch_size = 100
+    for i in range(0, len(stored["ids"]), batch_size):
+        batch_end = i + batch_size
+        collection.add(
+            ids=stored["ids"][i:batch_end],
+            embeddings=stored["embeddings"][i:batch_end],
+            documents=stored["documents"][i:batch_end],
+            metadatas=stored["metadatas"][i:batch_end]
+        )
+    return len(stored["ids"])
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def create_embeddings(categories=None):
+    if not os.path.exists(INPUT_FILE):
+        print(f"Input file {INPUT_FILE} not found. Run scraper.py first.")
+        return
+
+    print("Loading scraped content...", flush=True)
+    with open(INPUT_FILE, "r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    # Every build goes into a new, immutable index version; the app keeps
+    # serving the current one until the CURRENT pointer is switched below.
+    previous_version, previous_path = resolve(DB_PATH)
+    version = new_version()
+    print(f"Loaded {len(data)} documents. Building index version {version}...")
+    
+    # Initialize ChromaDB Client
+    client = chromadb.PersistentClient(path=version_path(version))
+    
+    # Use generic Sentence Transformer embedding function
+    # This automatically downloads 'all-MiniLM-L6-v2' (approx 80MB)
+    ef = embedding_functions.SentenceTransformerEmbeddingFunction(model_name=EMBEDDING_MODEL)
+    
+    # Shard by category: one collection per tenant so retrieval never needs a filtered scan
+    shards = {}
+    skipped_count = 0
+    for item in data:
+        category = item.get("category")
+        if category not in CATEGORIES:
+            print(f"⚠️  Skipping article with unknown category: {item.get('header', 'Unknown')} (Category: {category})")
+            skipped_count += 1
+            continue
+        shards.setdefault(category, []).append(item)
+
+    print("Generating embeddings and indexing...")
+    counts = {}
+    dedup_reports = {}
+    source_client = None
+    for category in CATEGORIES:
+        items = shards.get(category, [])
+        if items and (not categories or category in categories):
+            if DEDUP_ENABLED:
+                items, dedup_reports[category] = dedupe_corpus(items)
+                report = dedup_reports[category]
+                print(f"🧹 {category}: dropped {report['documents_dropped']} duplicate articles, factored out "
+                      f"{report['passages_factored']} boilerplate passages ({report['chars_in']} -> {report['chars_out']} chars)")
+            counts[category] = build_shard(client, ef, category, items)
+            print(f"✅ {category} articles embedded into '{shard_name(category)}': {counts[category]}")
+            continue
+        # Not rebuilt this time: keep the shard the app is serving now
+        if source_client is None:
+            source_client = chromadb.PersistentClient(path=previous_path)
+        counts[category] = copy_shard(source_client, client, ef, category)
+        if counts[category]:
+            print(f"⏭️  {category} shard carried over from {previous_version or DB_PATH}: {counts[category]}")
+        else:
+            print(f"⏭️  No {category} articles found, no shard built.")
+
+    if skipped_count:
+        print(f"⏭️  Articles skipped: {skipped_count}")
+
+    # Flat memory-mapped copy of every shard for RETRIEVAL_BACKEND=mmap
+    rebuilt = [c for c in CATEGORIES if shards.get(c) and (not categories or c in categories)]
+    export_dir = mmap_dir(version_path(version))
+    for category, count in counts.items():
+        if count:
+            export_collection(client.get_collection(name=shard_name(category)), export_dir, category)
+            # Sentence index for context compression (copied from the serving version if the shard wasn't rebuilt)
+            if category in rebuilt or not copy_sentence_index(mmap_dir(previous_path), export_dir, category):
+                shard = MmapShard(export_dir, category)
+                records = [shard.record(row) for row in range(len(shard))]
+                sentences = write_sentence_index(
+                    export_dir, category, [r["id"] for r in records], [r["document"] for r in records], ef
+                )
+                print(f"[{category}] Embedded {sentences} sentences for context compression")
+    print(f"Exported memory-mapped shards to {export_dir}")
+
+    write_manifest(version, {
+        "version": version,
+        "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "embedding_model": EMBEDDING_MODEL,
+        "chromadb_version": chromadb.__version__,
+        "corpus_file": INPUT_FILE,
+        "corpus_sha256": file_sha256(INPUT_FILE),
+        "documents": counts,
+        "rebuilt": rebuilt,
+        "previous_version": previous_version,
+        "dedup": dedup_reports,
+    })
+    # Footprint report and VACUUM while the new version isn't served yet
+    from chroma_gc import collect
+    collect(version_path(version), apply=True)
+    activate(version)
+    print(f"Successfully embedded {sum(counts.values())} documents into {version_path(version)}")
+
+    # Follow-up suggestions are precomputed from the fresh shards
+    from topic_graph import build_graph
+    build_graph()
+
+    # Precomputed FAQ answers citing articles that changed are regenerated
+    from faq_store import refresh as refresh_faq
+    refresh_faq()
 
 if __name__ == "__main__":
-    create_embeddings()
+    # Optional: python embedder.py Member Employer  (defaults to every category)
+    create_embeddings([normalize_category(c) for c in sys.argv[1:]] or None)
@@ -0,0 +1,552 @@
+"""
+FAQ Store - Reviewed answers to the questions members ask most, mined from chat logs.
+
+A small set of first questions ("How do I opt out?", "I forgot my password")
+makes up most of the traffic, and each one costs a retrieval and an LLM
+call. The offline build:
+  1. reads the first question of every chat logged by the category's bot
+     (data/chat_turns.jsonl, plus data/chat_logs.csv for chats logged before
+     it). Chats logged before the turn log recorded a category count as
+     DEFAULT_CATEGORY's, the only one served then, so other categories can
+     only be built once their own chats have been logged,
+  2. embeds them with the retrieval model and clusters them greedily: the
+     most asked question opens a cluster, and every question within
+     CLUSTER_SIMILARITY (cosine) of it joins. The opening question is the
+     canonical one,
+  3. answers each canonical question of a cluster asked at least
+     FAQ_MIN_COUNT times through the normal path (query_rag_batch +
+     rag_engine, as bulk_answer.py does) and stores the answer with its
+     sources and the sha256 of each source article's content.
+
+New answers are "pending" until someone approves them (`review`, `approve`).
+At runtime, match() embeds a member's first question and compares it with
+the approved canonical questions and their variants. Above
+FAQ_MATCH_THRESHOLD, the stored answer is streamed without retrieval or an
+LLM call. Later questions depend on the conversation, so they are always
+generated.
+
+When an article's content hash changes, the answers that cite it are no
+longer served. refresh() regenerates them (embedder.py runs it after every
+build when GROQ_API_KEY is set). A regenerated answer goes back to
+"pending", flagged as refreshed in `review`, and is served again only once
+someone approves it.
+
+Usage:
+    python faq_store.py build [--category Member] [--min-count 3] [--max 100] [--approve]
+    python faq_store.py review [--all]        # pending / refreshed answers (--all for every entry)
+    python faq_store.py approve ID...         # or: reject ID...
+    python faq_store.py refresh               # regenerate answers whose articles changed
+    python faq_store.py check "question"      # what match() would serve, and how fast
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+FAQ_FILE = "data/faq_store.json"
+FAQ_ENABLED = os.environ.get("FAQ_STORE", "1") != "0"
+FAQ_MATCH_THRESHOLD = float(os.environ.get("FAQ_MATCH_THRESHOLD", "0.9"))  # Cosine similarity
+FAQ_MIN_COUNT = int(os.environ.get("FAQ_MIN_COUNT", "3"))
+CLUSTER_SIMILARITY = 0.8
+MAX_FAQS = 100
+MAX_VARIANTS = 20  # Variant questions kept (and matched against) per FAQ
+EMBED_BATCH = 256
+
+_lock = threading.Lock()
+_store = None           # Parsed FAQ_FILE + its vectors
+_store_mtime = None
+_servable = None        # ((store, corpus mtime), row mask of servable entries)
+_hashes = None
+_hashes_mtime = None
+_stats = {"hits": 0, "misses": 0, "stale": 0}
+
+
+def _count(name):
+    with _lock:
+        _stats[name] += 1
+
+
+def get_faq_stats():
+    with _lock:
+        return dict(_stats)
+
+
+# -----------------------------------------------------------------------------
+# Article hashes
+# -----------------------------------------------------------------------------
+
+def article_hashes():
+    """{url: sha256 of its scraped content}, reloaded when scraped_content.json changes."""
+    global _hashes, _hashes_mtime
+    from topic_graph import INPUT_FILE
+    try:
+        mtime = os.path.getmtime(INPUT_FILE)
+    except OSError:
+        return {}
+    if _hashes is not None and mtime == _hashes_mtime:
+        return _hashes
+    with open(INPUT_FILE, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    contents = {}
+    for item in data:
+        contents.setdefault(item["url"], []).append(item["content"])
+    hashes = {
+        url: hashlib.sha256("\n".join(sorted(parts)).encode("utf-8")).hexdigest()
+        for url, parts in contents.items()
+    }
+    with _lock:
+        _hashes, _hashes_mtime = hashes, mtime
+    return hashes
+
+
+def is_fresh(entry, hashes=None):
+    """True if every article the answer cites is unchanged since it was generated."""
+    hashes = article_hashes() if hashes is None else hashes
+    return all(hashes.get(url) == digest for url, digest in entry["source_hashes"].items())
+
+
+# -----------------------------------------------------------------------------
+# Store file
+# -----------------------------------------------------------------------------
+
+def _vectors_path(stamp):
+    return os.path.splitext(FAQ_FILE)[0] + f".{stamp}.npy"
+
+
+def save_store(store, vectors):
+    """Write the vectors under a new name, then switch FAQ_FILE to them.
+
+    A reader that loads FAQ_FILE always finds the vectors it names, even
+    while a build is writing the next ones.
+    """
+    os.makedirs(os.path.dirname(FAQ_FILE), exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+    previous = load_store_file()
+    store["vectors_file"] = os.path.basename(_vectors_path(stamp))
+    np.save(_vectors_path(stamp), np.asarray(vectors, dtype=np.float32))
+    with open(FAQ_FILE + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(store, f, indent=2, ensure_ascii=False)
+    os.replace(FAQ_FILE + ".tmp", FAQ_FILE)
+    if previous and previous.get("vectors_file") and previous["vectors_file"] != store["vectors_file"]:
+        try:
+            os.remove(os.path.join(os.path.dirname(FAQ_FILE), previous["vectors_file"]))
+        except OSError:
+            pass
+
+
+def load_store_file():
+    try:
+        with open(FAQ_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def load_store():
+    """The store with its vector matrix, reloaded only when FAQ_FILE is rewritten."""
+    global _store, _store_mtime, _servable
+    try:
+        mtime = os.path.getmtime(FAQ_FILE)
+    except OSError:
+        return None
+    if _store is not None and mtime == _store_mtime:
+        return _store
+    with _lock:
+        if _store is None or mtime != _store_mtime:
+            store = load_store_file()
+            if store is None:
+                return None
+            store["matrix"] = np.load(os.path.join(os.path.dirname(FAQ_FILE), store["vectors_file"]))
+            store["by_id"] = {entry["id"]: entry for entry in store["entries"]}
+            from query_cache import normalize_query
+            store["by_text"] = {
+                (entry["category"], normalize_query(text)): entry["id"]
+                for entry in store["entries"] for text in [entry["question"]] + entry["variants"]
+            }
+            _store, _store_mtime, _servable = store, mtime, None
+            print(f"DEBUG: Loaded {len(store['entries'])} FAQ answers from {FAQ_FILE}", flush=True)
+    return _store
+
+
+def _servable_rows(store):
+    """Row mask of the approved, fresh entries (recomputed when the corpus changes)."""
+    global _servable
+    hashes = article_hashes()
+    key = (id(store), _hashes_mtime)
+    if _servable is not None and _servable[0] == key:
+        return _servable[1]
+    ok = {
+        entry["id"] for entry in store["entries"]
+        if entry["status"] == "approved" and is_fresh(entry, hashes)
+    }
+    stale = sum(1 for entry in store["entries"] if entry["status"] == "approved" and entry["id"] not in ok)
+    with _lock:
+        _stats["stale"] = stale
+    if stale:
+        print(f"DEBUG: {stale} approved FAQ answer(s) cite changed articles; not served until refreshed and approved again", flush=True)
+    mask = np.array([entry_id in ok for entry_id in store["row_ids"]], dtype=bool)
+    _servable = (key, mask)
+    return mask
+
+
+# -----------------------------------------------------------------------------
+# Runtime lookup
+# -----------------------------------------------------------------------------
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / (np.linalg.norm(vectors, axis=-1, keepdims=True) + 1e-12)
+
+
+def match(query, category):
+    """(entry, similarity) of the approved FAQ answer for a first question, or None."""
+    if not FAQ_ENABLED:
+        return None
+    store = load_store()
+    if not store or not store["entries"]:
+        return None
+    from query_cache import normalize_query
+    from retrieval import EMBEDDING_MODEL, embed_query
+
+    if store["embedding_model"] != EMBEDDING_MODEL:
+        return None
+    mask = _servable_rows(store)
+    # A question asked word for word before needs no embedding
+    entry_id = store["by_text"].get((category, normalize_query(query)))
+    if entry_id is not None:
+        entry = store["by_id"][entry_id]
+        if mask[store["row_ids"].index(entry_id)]:
+            _count("hits")
+            return entry, 1.0
+    similarity = store["matrix"] @ _normalize(embed_query(query))
+    similarity[~(mask & (np.asarray(store["row_categories"]) == category))] = -1.0
+    best = int(np.argmax(similarity))
+    if similarity[best] < FAQ_MATCH_THRESHOLD:
+        _count("misses")
+        return None
+    _count("hits")
+    return store["by_id"][store["row_ids"][best]], float(similarity[best])
+
+
+def as_results(entry):
+    """The entry's sources in query_rag's result layout (for follow-up suggestions)."""
+    sources = entry["sources"]
+    return {
+        "ids": [[source["url"] for source in sources]],
+        "documents": [["" for _ in sources]],
+        "metadatas": [[{"url": s["url"], "header": s["header"], "category": entry["category"]} for s in sources]],
+        "distances": [[0.0 for _ in sources]],
+    }
+
+
+# -----------------------------------------------------------------------------
+# Offline build
+# -----------------------------------------------------------------------------
+
+def first_questions(category):
+    """First question of every chat logged under `category` (turn log, then CSV-only chats).
+
+    Chats without a category (logged before it was recorded) belong to
+    DEFAULT_CATEGORY.
+    """
+    from feedback_manager import FEEDBACK_FILE, TURNS_LOG
+    from retrieval import DEFAULT_CATEGORY, normalize_category
+    from topic_graph import parse_user_turns
+
+    firsts = {}  # session_id -> (turn, question), or None for another category's chat
+    if os.path.exists(TURNS_LOG):
+        with open(TURNS_LOG, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get("role") != "user" or firsts.get(record["session_id"], ()) is None:
+                    continue
+                logged_as = record.get("category")
+                if (normalize_category(logged_as) if logged_as else DEFAULT_CATEGORY) != category:
+                    firsts[record["session_id"]] = None
+                    continue
+                current = firsts.get(record["session_id"])
+                if current is None or record["turn"] < current[0]:
+                    firsts[record["session_id"]] = (record["turn"], record["content"])
+    if os.path.exists(FEEDBACK_FILE) and category == DEFAULT_CATEGORY:
+        with open(FEEDBACK_FILE, "r", newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                if row.get("Unique ID") in firsts:
+                    continue
+                questions = parse_user_turns(row.get("Transcript") or "")
+                if questions:
+                    firsts[row.get("Unique ID")] = (0, questions[0])
+    return [first[1] for first in firsts.values() if first is not None and first[1].strip()]
+
+
+def embed_texts(texts):
+    from retrieval import get_embedding_function
+    embed = get_embedding_function()
+    vectors = [embed(texts[i:i + EMBED_BATCH]) for i in range(0, len(texts), EMBED_BATCH)]
+    return _normalize(np.concatenate([np.asarray(v, dtype=np.float32) for v in vectors])) if texts else \
+        np.zeros((0, 0), dtype=np.float32)
+
+
+def cluster_questions(questions, threshold=CLUSTER_SIMILARITY):
+    """[(canonical, count, [(variant, count)])], most asked first.
+
+    Questions are grouped by their normalised text, then clustered greedily
+    by embedding: each question joins the most similar existing cluster
+    leader within `threshold`, or leads a new cluster.
+    """
+    from query_cache import normalize_query
+
+    counts, spellings = {}, {}
+    for question in questions:
+        key = normalize_query(question)
+        counts[key] = counts.get(key, 0) + 1
+        forms = spellings.setdefault(key, {})
+        forms[question.strip()] = forms.get(question.strip(), 0) + 1
+    spelling = {key: max(forms, key=forms.get) for key, forms in spellings.items()}  # Most common spelling
+    keys = sorted(counts, key=lambda k: (-counts[k], k))
+    vectors = embed_texts([spelling[k] for k in keys])
+
+    leaders = np.zeros((len(keys), vectors.shape[1] if len(keys) else 0), dtype=np.float32)
+    clusters = []
+    for key, vector in zip(keys, vectors):
+        if clusters:
+            similarity = leaders[:len(clusters)] @ vector
+            best = int(np.argmax(similarity))
+            if similarity[best] >= threshold:
+                clusters[best][1] += counts[key]
+                clusters[best][2].append((key, counts[key]))
+                continue
+        leaders[len(clusters)] = vector
+        clusters.append([spelling[key], counts[key], [(key, counts[key])]])
+    clusters.sort(key=lambda c: -c[1])
+    return [(canonical, count, variants) for canonical, count, variants in clusters]
+
+
+def generate(client, items, max_tokens=512):
+    """Answer [{id, question, category}] through retrieval + rag_engine. Returns {id: record}."""
+    from bulk_answer import N_RESULTS, answer_one
+    from retrieval import query_rag_batch
+
+    records = {}
+    by_category = {}
+    for item in items:
+        by_category.setdefault(item["category"], []).append(item)
+    for category, batch in by_category.items():
+        start = time.perf_counter()
+        batch_results = query_rag_batch([item["question"] for item in batch], category, N_RESULTS)
+        retrieval_ms = (time.perf_counter() - start) * 1000 / len(batch)
+        for item, results in zip(batch, batch_results):
+            record = answer_one(client, item, results, retrieval_ms, max_tokens)
+            print(f"  {'FAILED ' + record['error'] if record['error'] else 'answered'}: {item['question']}")
+            records[item["id"]] = record
+    return records
+
+
+def _apply_answer(entry, record, hashes, approve=False):
+    """Store a generated answer. A new text replacing an answer waits for approval again."""
+    if entry.get("answer") is not None and entry["status"] == "approved" and not approve:
+        entry.update(status="pending", needs_review=True)
+    entry.update(
+        answer=record["answer"],
+        sources=record["sources"],
+        source_hashes={source["url"]: hashes.get(source["url"], "") for source in record["sources"]},
+        model=record["model"],
+        index_version=record["index_version"],
+        generated_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    )
+
+
+def _vectors_for(entries):
+    """One row per canonical question and variant: (row ids, row categories, matrix)."""
+    from query_cache import normalize_query
+    row_ids, row_categories, texts = [], [], []
+    for entry in entries:
+        for text in [entry["question"]] + [v for v in entry["variants"] if v != normalize_query(entry["question"])]:
+            row_ids.append(entry["id"])
+            row_categories.append(entry["category"])
+            texts.append(text)
+    return row_ids, row_categories, embed_texts(texts)
+
+
+def build(client, category, min_count=FAQ_MIN_COUNT, max_faqs=MAX_FAQS, approve=False):
+    from bulk_answer import question_id
+    from retrieval import EMBEDDING_MODEL, normalize_category
+
+    category = normalize_category(category)
+    questions = first_questions(category)
+    if not questions:
+        raise ValueError(f"No chats logged under the {category} category yet; nothing to build its FAQs from.")
+    clusters = [c for c in cluster_questions(questions) if c[1] >= min_count][:max_faqs]
+    print(f"{len(questions)} first questions -> {len(clusters)} FAQs asked at least {min_count} times")
+
+    previous = load_store_file() or {"entries": []}
+    old = {entry["id"]: entry for entry in previous["entries"]}
+    hashes = article_hashes()
+    entries, todo = [], []
+    for canonical, count, variants in clusters:
+        entry_id = question_id(category, canonical)
+        entry = dict(old.get(entry_id) or {"status": "approved" if approve else "pending", "needs_review": False})
+        entry.update(id=entry_id, category=category, question=canonical, asked=count,
+                     variants=[v for v, _ in variants[:MAX_VARIANTS]])
+        if entry.get("answer") is None or not is_fresh(entry, hashes):
+            todo.append({"id": entry_id, "question": canonical, "category": category})
+        entries.append(entry)
+    # Entries of other categories (or that dropped below min_count) are kept as they were
+    kept = [entry for entry in previous["entries"]
+            if entry["id"] not in {e["id"] for e in entries} and (entry["category"] != category or
+                                                                  entry["status"] != "pending")]
+
+    print(f"Generating {len(todo)} answers ({len(entries) - len(todo)} unchanged)")
+    for entry_id, record in generate(client, todo).items():
+        entry = next(e for e in entries if e["id"] == entry_id)
+        if record["error"]:
+            if entry.get("answer") is None:
+                entries.remove(entry)  # A stale answer that failed to refresh stays, unserved
+            continue
+        _apply_answer(entry, record, hashes, approve)
+    entries += kept
+
+    row_ids, row_categories, vectors = _vectors_for(entries)
+    save_store({
+        "built_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "embedding_model": EMBEDDING_MODEL,
+        "dimensions": int(vectors.shape[1]) if len(vectors) else 0,
+        "entries": entries,
+        "row_ids": row_ids,
+        "row_categories": row_categories,
+    }, vectors)
+    pending = sum(1 for e in entries if e["status"] == "pending")
+    print(f"FAQ store saved to {FAQ_FILE}: {len(entries)} answers, {pending} waiting for review")
+
+
+def refresh(client=None):
+    """Regenerate the answers whose articles changed. Returns how many were refreshed."""
+    store = load_store_file()
+    if not store:
+        return 0
+    hashes = article_hashes()
+    stale = [entry for entry in store["entries"] if entry["status"] != "rejected" and not is_fresh(entry, hashes)]
+    if not stale:
+        print("FAQ answers are up to date")
+        return 0
+    if client is None:
+        api_key = os.environ.get("GROQ_API_KEY")
+        if not api_key:
+            print(f"{len(stale)} FAQ answers cite changed articles; set GROQ_API_KEY and run "
+                  "`python faq_store.py refresh` (they are not served meanwhile)")
+            return 0
+        from llm_client import get_llm_client
+        client = get_llm_client(api_key)
+    print(f"Refreshing {len(stale)} FAQ answers")
+    records = generate(client, [{"id": e["id"], "question": e["question"], "category": e["category"]} for e in stale])
+    refreshed = 0
+    for entry in stale:
+        record = records.get(entry["id"])
+        if record and not record["error"]:
+            _apply_answer(entry, record, hashes)
+            refreshed += 1
+    save_store(store, np.load(os.path.join(os.path.dirname(FAQ_FILE), store["vectors_file"])))
+    print(f"Refreshed {refreshed} of {len(stale)} FAQ answers; they wait for review (`python faq_store.py review`)")
+    return refreshed
+
+
+def set_status(entry_ids, status):
+    store = load_store_file()
+    if not store:
+        sys.exit(f"{FAQ_FILE} not found. Run `python faq_store.py build` first.")
+    found = 0
+    for entry in store["entries"]:
+        if entry["id"] in entry_ids:
+            entry["status"] = status
+            entry["needs_review"] = False
+            entry["reviewed_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            found += 1
+    save_store(store, np.load(os.path.join(os.path.dirname(FAQ_FILE), store["vectors_file"])))
+    print(f"{status.capitalize()} {found} of {len(entry_ids)} FAQ answers")
+
+
+def review(show_all=False):
+    store = load_store_file()
+    if not store:
+        sys.exit(f"{FAQ_FILE} not found. Run `python faq_store.py build` first.")
+    hashes = article_hashes()
+    for entry in store["entries"]:
+        if not show_all and entry["status"] != "pending" and not entry.get("needs_review"):
+            continue
+        flags = [entry["status"]] + (["refreshed"] if entry.get("needs_review") else []) + \
+            ([] if is_fresh(entry, hashes) else ["stale"])
+        print(f"{entry['id']}  [{', '.join(flags)}]  asked {entry['asked']}x  ({entry['category']})")
+        print(f"  Q: {entry['question']}")
+        if len(entry["variants"]) > 1:
+            print(f"  also: {'; '.join(entry['variants'][1:6])}")
+        print("  A: " + entry["answer"].replace("\n", "\n     "))
+        print("  Sources: " + ", ".join(source["url"] for source in entry["sources"]) + "\n")
+
+
+def check(question, category):
+    start = time.perf_counter()
+    found = match(question, category)
+    cold_ms = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    match(question, category)
+    warm_ms = (time.perf_counter() - start) * 1000
+    if found is None:
+        print(f"No FAQ answer above {FAQ_MATCH_THRESHOLD} ({cold_ms:.1f} ms, then {warm_ms:.2f} ms)")
+        return
+    entry, similarity = found
+    print(f"Match {similarity:.3f}: {entry['question']} ({entry['id']}; {cold_ms:.1f} ms, then {warm_ms:.2f} ms)")
+    print(entry["answer"])
+
+
+def main(argv=None):
+    from retrieval import DEFAULT_CATEGORY
+
+    parser = argparse.ArgumentParser(description="Mine frequent questions and serve reviewed answers.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    mine = sub.add_parser("build", help="Cluster first questions from the chat logs and answer the frequent ones")
+    mine.add_argument("--category", default=DEFAULT_CATEGORY)
+    mine.add_argument("--min-count", type=int, default=FAQ_MIN_COUNT)
+    mine.add_argument("--max", type=int, default=MAX_FAQS)
+    mine.add_argument("--approve", action="store_true", help="Serve new answers without review")
+    show = sub.add_parser("review", help="Print answers waiting for review")
+    show.add_argument("--all", action="store_true")
+    for name in ("approve", "reject"):
+        sub.add_parser(name).add_argument("ids", nargs="+")
+    sub.add_parser("refresh", help="Regenerate answers whose articles changed")
+    probe = sub.add_parser("check", help="Show what a question would be served")
+    probe.add_argument("question")
+    probe.add_argument("--category", default=DEFAULT_CATEGORY)
+    args = parser.parse_args(argv)
+
+    if args.command in ("build", "refresh"):
+        api_key = os.environ.get("GROQ_API_KEY")
+        if not api_key:
+            sys.exit("Set GROQ_API_KEY (and LLM_BASE_URL to use another endpoint).")
+        from llm_client import get_llm_client
+        client = get_llm_client(api_key)
+        if args.command == "build":
+            try:
+                build(client, args.category, args.min_count, args.max, args.approve)
+            except ValueError as e:
+                sys.exit(str(e))
+        else:
+            refresh(client)
+    elif args.command == "review":
+        review(args.all)
+    elif args.command in ("approve", "reject"):
+        set_status(set(args.ids), "approved" if args.command == "approve" else "rejected")
+    elif args.command == "check":
+        check(args.question, args.category)
+
+
+if __name__ == "__main__":
+    main()
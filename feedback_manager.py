@@ -1,13 +1,49 @@
 """
 Feedback Manager - Handles user feedback collection and storage for the chatbot.
+
+Besides the CSV (one row per chat, transcript in one cell), every chat is
+appended turn by turn to data/chat_turns.jsonl and every rating to
+data/chat_feedback.jsonl. chat_analytics.py compacts those into Parquet.
+Chats and ratings are also added to the transcript search index
+(transcript_search.py) as they are logged.
 """
 import csv
+import json
 import os
 from datetime import datetime
 from pathlib import Path
 
+from transcript_search import index_chat, set_feedback
+
 FEEDBACK_FILE = "data/chat_logs.csv"
 HEADERS = ["Sr. no", "Date", "Unique ID", "Member Name", "Transcript", "Feedback Rating", "Feedback Text"]
+TURNS_LOG = "data/chat_turns.jsonl"
+FEEDBACK_LOG = "data/chat_feedback.jsonl"
+
+def append_jsonl(path, records):
+    """Append records as JSON lines in one write (each line is complete or absent)."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, mode="a", encoding="utf-8") as file:
+        file.write("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records))
+
+def log_turns(session_id, conversation_history, logged_at, category=None):
+    """Per-turn records for analytics; the greeting/name exchange is left out (it holds the member's name)."""
+    records = []
+    for turn, msg in enumerate(conversation_history):
+        if msg.get("onboarding") or msg["role"] == "system":
+            continue
+        records.append({
+            "session_id": session_id,
+            "category": category,
+            "turn": turn,
+            "role": msg["role"],
+            "content": msg["content"],
+            "time": msg.get("time") or logged_at,
+            "sources": list(msg.get("sources") or []),
+            "logged_at": logged_at,
+        })
+    if records:
+        append_jsonl(TURNS_LOG, records)
 
 def init_chat_logs():
     """Initialize the CSV file with headers if it doesn't exist."""
@@ -33,8 +69,8 @@ def get_next_sr_no():
     except Exception:
         return 1
 
-def log_chat(user_name, session_id, conversation_history, feedback_rating=None, feedback_text=None):
-    """Log the chat session to CSV."""
+def log_chat(user_name, session_id, conversation_history, feedback_rating=None, feedback_text=None, category=None):
+    """Log the chat session to CSV (the turn log also records the bot's category)."""
     init_chat_logs()
     
     # Get current date and time
@@ -70,8 +106,32 @@ def log_chat(user_name, session_id, conversation_history, feedback_rating=None,
     except Exception as e:
         print(f"Error logging chat: {e}")
 
+    try:
+        log_turns(session_id, conversation_history, now.isoformat(timespec="seconds"), category)
+        if feedback_rating:
+            append_jsonl(FEEDBACK_LOG, [{"session_id": session_id, "rating": int(feedback_rating),
+                                         "text": feedback_text or "", "time": now.isoformat(timespec="seconds")}])
+    except Exception as e:
+        print(f"Error logging chat turns: {e}")
+
+    try:
+        index_chat(session_id, user_name, conversation_history, chat_date, feedback_rating or None,
+                   feedback_text or None)
+    except Exception as e:
+        print(f"Error indexing chat transcript: {e}")
+
 def update_feedback_log(session_id, rating, text):
     """Update an existing chat log with feedback."""
+    try:
+        append_jsonl(FEEDBACK_LOG, [{"session_id": session_id, "rating": int(rating), "text": text or "",
+                                     "time": datetime.now().isoformat(timespec="seconds")}])
+    except Exception as e:
+        print(f"Error logging feedback: {e}")
+    try:
+        set_feedback(session_id, rating, text)
+    except Exception as e:
+        print(f"Error indexing feedback: {e}")
+
     if not os.path.exists(FEEDBACK_FILE):
         return False
         
@@ -0,0 +1,165 @@
+"""
+Index Versions - Immutable, versioned index builds with an atomic pointer.
+
+embedder.py never rebuilds the index the app is reading. Each build goes
+into a fresh directory, data/indexes/v<timestamp>/, and is finished by
+writing its manifest.json (embedding model, corpus hash, document counts).
+Only then is data/indexes/CURRENT switched to the new version, with an
+atomic os.replace. retrieval.py notices the new pointer and hot-swaps to it.
+Older versions are left untouched, so queries that are still running
+against them finish normally, and a rollback is just moving the pointer
+back.
+
+Usage:
+    python index_versions.py list
+    python index_versions.py activate <version>
+    python index_versions.py rollback          # previous complete version
+    python index_versions.py prune [keep]      # delete old versions (default keep 3)
+"""
+import json
+import os
+import shutil
+import sys
+from datetime import datetime
+
+INDEXES_DIR = "data/indexes"
+CURRENT_FILE = os.path.join(INDEXES_DIR, "CURRENT")
+MANIFEST_NAME = "manifest.json"
+DEFAULT_KEEP = 3
+
+
+def version_path(version):
+    return os.path.join(INDEXES_DIR, version)
+
+
+def new_version():
+    """Create and return a new, empty version directory name (v<timestamp>)."""
+    os.makedirs(INDEXES_DIR, exist_ok=True)
+    version = datetime.now().strftime("v%Y%m%d-%H%M%S")
+    suffix = 1
+    while os.path.exists(version_path(version)):
+        suffix += 1
+        version = datetime.now().strftime("v%Y%m%d-%H%M%S") + f"-{suffix}"
+    os.makedirs(version_path(version))
+    return version
+
+
+def write_manifest(version, manifest):
+    """Mark a build complete. Written last, so a crashed build has no manifest."""
+    path = os.path.join(version_path(version), MANIFEST_NAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def read_manifest(version):
+    try:
+        with open(os.path.join(version_path(version), MANIFEST_NAME), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def list_versions():
+    """Complete versions (with a manifest), oldest first."""
+    if not os.path.isdir(INDEXES_DIR):
+        return []
+    return sorted(
+        name for name in os.listdir(INDEXES_DIR)
+        if name.startswith("v") and read_manifest(name) is not None
+    )
+
+
+def current_version():
+    """The version CURRENT points at, or None if there is no usable pointer."""
+    try:
+        with open(CURRENT_FILE, "r", encoding="utf-8") as f:
+            version = f.read().strip()
+    except OSError:
+        return None
+    if not version or read_manifest(version) is None:
+        return None
+    return version
+
+
+def resolve(default_path):
+    """(version, path) of the index to serve; (None, default_path) before the first versioned build."""
+    version = current_version()
+    if version is None:
+        return None, default_path
+    return version, version_path(version)
+
+
+def activate(version):
+    """Atomically point CURRENT at a complete version."""
+    if read_manifest(version) is None:
+        raise ValueError(f"Index version {version} is missing or incomplete")
+    tmp_path = CURRENT_FILE + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(version + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, CURRENT_FILE)
+    print(f"Index CURRENT -> {version}")
+
+
+def rollback():
+    """Point CURRENT at the complete version before the current one."""
+    versions = list_versions()
+    current = current_version()
+    older = [v for v in versions if current is None or v < current]
+    if not older:
+        raise ValueError("No earlier index version to roll back to")
+    activate(older[-1])
+    return older[-1]
+
+
+def prune(keep=DEFAULT_KEEP):
+    """Delete old versions, keeping the newest `keep` plus the current one.
+
+    Incomplete builds (no manifest) older than the newest complete version
+    are removed too.
+    """
+    versions = list_versions()
+    current = current_version()
+    keep_set = set(versions[-keep:]) if keep > 0 else set()
+    if current:
+        keep_set.add(current)
+    newest = versions[-1] if versions else ""
+    removed = []
+    for name in sorted(os.listdir(INDEXES_DIR)) if os.path.isdir(INDEXES_DIR) else []:
+        path = version_path(name)
+        if not name.startswith("v") or not os.path.isdir(path) or name in keep_set:
+            continue
+        if name in versions or name < newest:
+            shutil.rmtree(path)
+            removed.append(name)
+    return removed
+
+
+def main(args):
+    command = args[0] if args else "list"
+    if command == "list":
+        current = current_version()
+        for version in list_versions():
+            manifest = read_manifest(version)
+            marker = "*" if version == current else " "
+            docs = sum(manifest.get("documents", {}).values())
+            print(f"{marker} {version}  {manifest.get('embedding_model')}  "
+                  f"{docs} docs  corpus {manifest.get('corpus_sha256', '')[:12]}")
+        if current is None:
+            print("No CURRENT version: the app is serving the legacy data/chroma_db.")
+    elif command == "activate" and len(args) > 1:
+        activate(args[1])
+    elif command == "rollback":
+        rollback()
+    elif command == "prune":
+        removed = prune(int(args[1]) if len(args) > 1 else DEFAULT_KEEP)
+        print(f"Removed {len(removed)} old version(s): {', '.join(removed) or '-'}")
+    else:
+        print(__doc__)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,166 @@
+"""
+LLM Client - One pooled Groq client per process.
+
+Streamlit re-executes chatbot.py on every interaction, so building Groq()
+at the top of the script created a fresh HTTP connection pool (and new TLS
+handshakes) on every click. This module keeps a single, thread-safe client
+with keep-alive connections (HTTP/2 when the 'h2' package is installed),
+configurable pool size and timeouts, and tracks the health of every request
+it sends. Token usage reported by the backend (including prompt tokens
+served from the provider's prompt cache) is totalled as well.
+
+Settings (environment variables):
+    LLM_POOL_SIZE          max connections kept open        (default 20)
+    LLM_CONNECT_TIMEOUT    seconds to establish a connection (default 5)
+    LLM_READ_TIMEOUT       seconds between response bytes  (default 60)
+    LLM_KEEPALIVE_EXPIRY   seconds an idle connection lives (default 120)
+    LLM_MAX_RETRIES        SDK retries on transient errors  (default 2)
+    LLM_BASE_URL           override the API endpoint (e.g. a local mock)
+"""
+import importlib.util
+import os
+import threading
+import time
+
+import httpx
+from groq import Groq
+
+POOL_SIZE = int(os.environ.get("LLM_POOL_SIZE", "20"))
+CONNECT_TIMEOUT = float(os.environ.get("LLM_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.environ.get("LLM_READ_TIMEOUT", "60"))
+KEEPALIVE_EXPIRY = float(os.environ.get("LLM_KEEPALIVE_EXPIRY", "120"))
+MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "2"))
+BASE_URL = os.environ.get("LLM_BASE_URL") or None
+# Consecutive failed requests before the client is reported unhealthy
+UNHEALTHY_AFTER = 3
+
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+_lock = threading.Lock()
+_client = None
+_http_client = None
+_health = {
+    "requests": 0,
+    "failures": 0,
+    "rate_limited": 0,
+    "consecutive_failures": 0,
+    "last_error": "",
+    "last_status": None,
+    "last_success_at": None,
+    "total_ms": 0.0,
+}
+_usage = {
+    "responses": 0,
+    "prompt_tokens": 0,
+    "cached_prompt_tokens": 0,
+    "completion_tokens": 0,
+}
+
+
+def _record(status=None, error=None, elapsed_ms=0.0):
+    with _lock:
+        _health["requests"] += 1
+        _health["total_ms"] += elapsed_ms
+        _health["last_status"] = status
+        if error is not None or (status is not None and status >= 500):
+            _health["failures"] += 1
+            _health["consecutive_failures"] += 1
+            _health["last_error"] = str(error) if error is not None else f"HTTP {status}"
+        elif status == 429:
+            _health["rate_limited"] += 1
+        else:
+            _health["consecutive_failures"] = 0
+            _health["last_success_at"] = time.time()
+
+
+class HealthTrackingTransport(httpx.HTTPTransport):
+    """HTTP transport that records status and latency of every request."""
+
+    def handle_request(self, request):
+        start = time.perf_counter()
+        try:
+            response = super().handle_request(request)
+        except Exception as e:
+            _record(error=e, elapsed_ms=(time.perf_counter() - start) * 1000)
+            raise
+        # Time to response headers; streamed bodies continue after this
+        _record(status=response.status_code, elapsed_ms=(time.perf_counter() - start) * 1000)
+        return response
+
+
+def build_http_client(pool_size=POOL_SIZE):
+    """httpx client with a persistent keep-alive pool."""
+    limits = httpx.Limits(
+        max_connections=pool_size,
+        max_keepalive_connections=pool_size,
+        keepalive_expiry=KEEPALIVE_EXPIRY,
+    )
+    timeout = httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT)
+    transport = HealthTrackingTransport(limits=limits, http2=HTTP2_AVAILABLE)
+    return httpx.Client(transport=transport, timeout=timeout)
+
+
+def get_llm_client(api_key=None):
+    """Return the process-wide Groq client, creating it on first use.
+
+    The client is thread-safe and shared by every session and background
+    worker (response streaming, follow-up prediction, query condensation).
+    """
+    global _client, _http_client
+    if _client is not None:
+        return _client
+    with _lock:
+        if _client is None:
+            _http_client = build_http_client()
+            _client = Groq(
+                api_key=api_key,
+                base_url=BASE_URL,
+                max_retries=MAX_RETRIES,
+                timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+                http_client=_http_client,
+            )
+            print(f"LLM client created (pool={POOL_SIZE}, http2={HTTP2_AVAILABLE})", flush=True)
+        return _client
+
+
+def reset_llm_client():
+    """Close the pool so the next get_llm_client() reconnects from scratch."""
+    global _client, _http_client
+    with _lock:
+        if _http_client is not None:
+            _http_client.close()
+        _client = None
+        _http_client = None
+
+
+def record_usage(usage):
+    """Add one response's token usage (a Groq CompletionUsage) to the totals."""
+    if usage is None:
+        return
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = (getattr(details, "cached_tokens", 0) or 0) if details else 0
+    with _lock:
+        _usage["responses"] += 1
+        _usage["prompt_tokens"] += usage.prompt_tokens or 0
+        _usage["cached_prompt_tokens"] += cached
+        _usage["completion_tokens"] += usage.completion_tokens or 0
+    print(f"DEBUG: Prompt tokens {usage.prompt_tokens} ({cached} cached), "
+          f"completion tokens {usage.completion_tokens}", flush=True)
+
+
+def get_prompt_cache_stats():
+    """Prompt tokens sent vs served from the provider's prompt cache."""
+    with _lock:
+        stats = dict(_usage)
+    stats["uncached_prompt_tokens"] = stats["prompt_tokens"] - stats["cached_prompt_tokens"]
+    stats["cached_ratio"] = stats["cached_prompt_tokens"] / stats["prompt_tokens"] if stats["prompt_tokens"] else 0.0
+    return stats
+
+
+def get_llm_health():
+    """Snapshot of request counts, errors and latency for the shared client."""
+    with _lock:
+        health = dict(_health)
+    health["healthy"] = health["consecutive_failures"] < UNHEALTHY_AFTER
+    health["avg_ms"] = health["total_ms"] / health["requests"] if health["requests"] else 0.0
+    return health
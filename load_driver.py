@@ -0,0 +1,136 @@
+"""
+Load Driver - Simulated chat sessions for measuring per-session costs.
+
+Drives many synthetic conversations (questions are article headers, answers
+are article bodies from scraped_content.json) through the same session
+structures the app uses, without Streamlit or an LLM.
+
+Usage:
+    python load_driver.py memory [sessions] [turns]
+    python load_driver.py stream [sessions] [turns] [tokens_per_second]
+"""
+import json
+import random
+import re
+import sys
+import time
+import tracemalloc
+
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+from conversation_store import ConversationStore
+from stream_batcher import batch_stream
+
+INPUT_FILE = "data/scraped_content.json"
+ANSWER_CHARS = 1200
+# Roughly one LLM token per delta, as the Groq stream sends them
+TOKEN_PATTERN = re.compile(r"\s*\S{1,4}")
+
+
+def load_turns():
+    """(question, answer) pairs to replay (copied per use, like real answers)."""
+    with open(INPUT_FILE, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return [(item["header"], item["content"][:ANSWER_CHARS]) for item in data]
+
+
+def unbounded_session(turns, n_turns, rng):
+    """The previous behaviour: a plain message list plus the End Chat strings."""
+    messages = [{"role": "assistant", "content": "Hello!", "timestamp": "00:00:00"}]
+    for _ in range(n_turns):
+        question, answer = (text + " " for text in rng.choice(turns))
+        messages.append({"role": "user", "content": question, "timestamp": "00:00:00"})
+        messages.append({"role": "assistant", "content": answer, "timestamp": "00:00:00"})
+    sheet_transcript = str(messages)
+    download = "".join(f"{m['role']}: {m['content']}\n\n" for m in messages)
+    return messages, sheet_transcript, download
+
+
+def bounded_session(turns, n_turns, rng):
+    conversation = ConversationStore("Hello!")
+    for _ in range(n_turns):
+        question, answer = (text + " " for text in rng.choice(turns))
+        conversation.append("user", question)
+        conversation.append("assistant", answer)
+    conversation.log_text()
+    conversation.transcript_text("Member")
+    return conversation
+
+
+def measure_memory(n_sessions=200, n_turns=100):
+    """Print retained memory per session for both session models."""
+    turns = load_turns()
+    print(f"{n_sessions} sessions x {n_turns} turns")
+    for name, build in (("unbounded list", unbounded_session), ("ConversationStore", bounded_session)):
+        rng = random.Random(42)
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        sessions = [build(turns, n_turns, rng) for _ in range(n_sessions)]
+        after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        retained = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+        print(f"  {name:<18} {retained / n_sessions / 1024:8.1f} KiB/session")
+        del sessions
+
+
+class SimulatedClock:
+    """Stands in for time.monotonic: advances one token interval per delta."""
+
+    def __init__(self, tokens_per_second):
+        self.now = 0.0
+        self.step = 1.0 / tokens_per_second
+
+    def __call__(self):
+        return self.now
+
+    def deltas(self, answer):
+        for token in TOKEN_PATTERN.findall(answer):
+            self.now += self.step
+            yield token
+
+
+def render_stream(chunks):
+    """Server-side work st.write_stream does per chunk: re-send the full
+    markdown so far as a websocket message. Returns the message count."""
+    text = ""
+    messages = 0
+    for chunk in chunks:
+        text += chunk
+        msg = ForwardMsg()
+        msg.delta.new_element.markdown.body = text
+        msg.SerializeToString()
+        messages += 1
+    return messages
+
+
+def measure_stream(n_sessions=200, n_turns=5, tokens_per_second=300):
+    """Print websocket messages per answer and CPU per session, unbatched vs batched."""
+    turns = load_turns()
+    print(f"{n_sessions} sessions x {n_turns} answers, {tokens_per_second} tokens/s")
+    modes = (
+        ("per-token deltas", lambda deltas, clock: deltas),
+        ("batch_stream", lambda deltas, clock: batch_stream(deltas, clock=clock)),
+    )
+    for name, adapt in modes:
+        rng = random.Random(42)
+        messages = 0
+        start = time.process_time()
+        for _ in range(n_sessions):
+            for _ in range(n_turns):
+                clock = SimulatedClock(tokens_per_second)
+                _, answer = rng.choice(turns)
+                messages += render_stream(adapt(clock.deltas(answer), clock))
+        cpu = time.process_time() - start
+        answers = n_sessions * n_turns
+        print(f"  {name:<18} {messages / answers:8.1f} msgs/answer {cpu / n_sessions * 1000:8.2f} ms CPU/session")
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "memory"
+    args = [int(a) for a in sys.argv[2:]]
+    if command == "memory":
+        measure_memory(*args)
+    elif command == "stream":
+        measure_stream(*args)
+    else:
+        print(__doc__)
@@ -0,0 +1,214 @@
+"""
+Mmap Index - Flat, memory-mapped export of a shard for read-only serving.
+
+At build time each category shard is exported next to the Chroma store of
+its index version (data/indexes/<version>/mmap/):
+    <category>.vectors.npy   float32 (N x dim) embeddings
+    <category>.sqnorms.npy   float32 (N,) squared norms, for L2 distances
+    <category>.offsets.npy   int64 (N + 1) byte offsets into records.bin
+    <category>.records.bin   one UTF-8 JSON record {id, document, metadata} per row
+    <category>.int8.npy      int8 (N x dim) codes, scaled per row
+    <category>.scales.npy    float32 (N,) per-row scale of the int8 codes
+    <category>.bits.npy      uint8 (N x dim/8) packed sign bits (binary codes)
+    <category>.center.npy    float32 (dim,) mean vector the sign bits are taken around
+
+Workers open these with mmap, so every process on the host shares the same
+page-cache pages instead of each loading its own copy of the HNSW index
+and documents. A query is one matrix-vector product over the mapped
+vectors and only the top-k records are decoded. Results have the same
+shape and distances (squared L2) as Chroma's collection.query.
+
+For large shards the first pass can run over the quantized codes instead
+(quantization="int8": 4x smaller, "binary": 32x smaller, Hamming distance).
+The best RESCORE_FACTOR x n_results candidates are then rescored exactly
+against the float32 vectors, which are only paged in for those rows.
+"""
+import json
+import os
+
+import numpy as np
+
+MMAP_DIR_NAME = "mmap"
+BATCH_SIZE = 1000
+QUANTIZATIONS = ("none", "int8", "binary")
+RESCORE_FACTOR = 10
+MIN_SHORTLIST = 50
+SCAN_BLOCK_ROWS = 4096  # Rows decoded per block in the int8 pass (bounds temporary memory)
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def mmap_dir(index_path):
+    return os.path.join(index_path, MMAP_DIR_NAME)
+
+
+def _file(directory, category, suffix):
+    return os.path.join(directory, f"{category.lower()}.{suffix}")
+
+
+def quantize_int8(vectors):
+    """Symmetric per-row int8 codes: vector ~= codes * scale."""
+    scales = np.abs(vectors).max(axis=1) / 127.0 if len(vectors) else np.zeros(0)
+    scales = np.where(scales > 0, scales, 1.0).astype(np.float32)
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales
+
+
+def binary_center(vectors):
+    """Mean vector; signs are taken around it so the bits split the data evenly."""
+    return vectors.mean(axis=0).astype(np.float32) if len(vectors) else np.zeros(vectors.shape[1], np.float32)
+
+
+def quantize_binary(vectors, center):
+    """One sign bit per dimension (relative to `center`), packed 8 to a byte."""
+    return np.packbits((vectors - center) > 0, axis=1)
+
+
+def hamming(bits, query_bits):
+    """Hamming distance from the packed query to every packed row."""
+    xor = np.bitwise_xor(bits, query_bits)
+    if hasattr(np, "bitwise_count") and xor.shape[1] % 8 == 0:
+        return np.bitwise_count(xor.view(np.uint64)).sum(axis=1, dtype=np.int32)
+    return _POPCOUNT[xor].sum(axis=1, dtype=np.int32)
+
+
+def write_shard(directory, category, ids, embeddings, documents, metadatas):
+    """Write one shard's rows in the mmap format (temp files, then rename)."""
+    os.makedirs(directory, exist_ok=True)
+    vectors = np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1)
+
+    offsets = np.zeros(len(ids) + 1, dtype=np.int64)
+    records_path = _file(directory, category, "records.bin")
+    with open(records_path + ".tmp", "wb") as f:
+        for i, (doc_id, document, metadata) in enumerate(zip(ids, documents, metadatas)):
+            record = json.dumps({"id": doc_id, "document": document, "metadata": metadata}, ensure_ascii=False)
+            data = record.encode("utf-8")
+            f.write(data)
+            offsets[i + 1] = offsets[i] + len(data)
+
+    codes, scales = quantize_int8(vectors)
+    center = binary_center(vectors)
+    arrays = {
+        "vectors.npy": vectors,
+        "sqnorms.npy": np.einsum("ij,ij->i", vectors, vectors).astype(np.float32),
+        "offsets.npy": offsets,
+        "int8.npy": codes,
+        "scales.npy": scales,
+        "bits.npy": quantize_binary(vectors, center),
+        "center.npy": center,
+    }
+    for suffix, array in arrays.items():
+        with open(_file(directory, category, suffix) + ".tmp", "wb") as f:
+            np.save(f, array)
+    for suffix in list(arrays) + ["records.bin"]:
+        path = _file(directory, category, suffix)
+        os.replace(path + ".tmp", path)
+    return len(ids)
+
+
+def export_collection(collection, directory, category):
+    """Export a Chroma collection (with its stored embeddings) to the mmap format."""
+    ids, embeddings, documents, metadatas = [], [], [], []
+    total = collection.count()
+    for offset in range(0, total, BATCH_SIZE):
+        batch = collection.get(
+            include=["embeddings", "documents", "metadatas"], limit=BATCH_SIZE, offset=offset
+        )
+        ids += batch["ids"]
+        embeddings += list(batch["embeddings"])
+        documents += batch["documents"]
+        metadatas += batch["metadatas"]
+    return write_shard(directory, category, ids, embeddings, documents, metadatas)
+
+
+def has_shard(directory, category):
+    return os.path.exists(_file(directory, category, "records.bin"))
+
+
+class MmapShard:
+    """Read-only view of an exported shard, backed by memory-mapped files."""
+
+    def __init__(self, directory, category):
+        self.category = category
+        self.vectors = np.load(_file(directory, category, "vectors.npy"), mmap_mode="r")
+        self.sqnorms = np.load(_file(directory, category, "sqnorms.npy"), mmap_mode="r")
+        self.offsets = np.load(_file(directory, category, "offsets.npy"), mmap_mode="r")
+        records_path = _file(directory, category, "records.bin")
+        self.records = (
+            np.memmap(records_path, dtype=np.uint8, mode="r") if os.path.getsize(records_path) else b""
+        )
+        self.directory = directory
+        self._codes = {}
+
+    def codes(self, quantization):
+        """Quantized arrays for a first pass, or None if the export predates them."""
+        if quantization not in self._codes:
+            names = {"int8": ("int8.npy", "scales.npy"), "binary": ("bits.npy", "center.npy")}.get(quantization, ())
+            paths = [_file(self.directory, self.category, name) for name in names]
+            if paths and all(os.path.exists(path) for path in paths):
+                self._codes[quantization] = [np.load(path, mmap_mode="r") for path in paths]
+            else:
+                self._codes[quantization] = None
+        return self._codes[quantization]
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def record(self, row):
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        return json.loads(bytes(self.records[start:end]).decode("utf-8"))
+
+    def distances(self, query_vector):
+        """Squared L2 distance from the query to every row."""
+        query = np.asarray(query_vector, dtype=np.float32)
+        return self.sqnorms - 2.0 * (self.vectors @ query) + float(query @ query)
+
+    def top_rows(self, distances, n_results):
+        n_results = min(n_results, len(distances))
+        if n_results <= 0:
+            return np.empty(0, dtype=np.int64)
+        rows = np.argpartition(distances, n_results - 1)[:n_results]
+        return rows[np.argsort(distances[rows])]
+
+    def results(self, rows, distances, include_embeddings=False):
+        """Chroma-style query result for the given rows (best first)."""
+        records = [self.record(int(row)) for row in rows]
+        results = {
+            "ids": [[r["id"] for r in records]],
+            "documents": [[r["document"] for r in records]],
+            "metadatas": [[r["metadata"] for r in records]],
+            "distances": [[float(d) for d in distances]],
+        }
+        if include_embeddings:
+            results["embeddings"] = [np.array(self.vectors[np.asarray(rows, dtype=np.int64)])]
+        return results
+
+    def shortlist(self, query, quantization, size):
+        """Candidate rows from a first pass over the quantized codes."""
+        codes = self.codes(quantization)
+        if quantization == "int8":
+            int8_codes, scales = codes
+            approx = np.empty(len(self), dtype=np.float32)
+            for start in range(0, len(self), SCAN_BLOCK_ROWS):
+                block = slice(start, start + SCAN_BLOCK_ROWS)
+                # Widen one block at a time so numpy can use BLAS
+                approx[block] = (int8_codes[block].astype(np.float32) @ query) * scales[block]
+            scores = self.sqnorms - 2.0 * approx
+        else:
+            bits, center = codes
+            scores = hamming(bits, quantize_binary(query[None, :], center)[0])
+        return self.top_rows(scores, size)
+
+    def query(self, query_vector, n_results=3, quantization="none", include_embeddings=False):
+        query = np.asarray(query_vector, dtype=np.float32)
+        size = max(n_results * RESCORE_FACTOR, MIN_SHORTLIST)
+        if quantization == "none" or size >= len(self) or self.codes(quantization) is None:
+            distances = self.distances(query)
+            rows = self.top_rows(distances, n_results)
+            return self.results(rows, distances[rows], include_embeddings)
+
+        # Rescore the shortlist exactly; only these rows of the float32 file are read
+        candidates = np.sort(self.shortlist(query, quantization, size))
+        vectors = self.vectors[candidates]
+        exact = self.sqnorms[candidates] - 2.0 * (vectors @ query) + float(query @ query)
+        best = self.top_rows(exact, n_results)
+        return self.results(candidates[best], exact[best], include_embeddings)
@@ -0,0 +1,359 @@
+"""
+Output Guard - Streaming checks on the answer as it is generated.
+
+The system prompt asks the model never to ask for a NEST ID, National
+Insurance number or date of birth, and to link only to pages in the
+CONTEXT. guard_stream() enforces both on the stream from
+rag_engine.generate_answer_stream without waiting for the whole answer:
+
+  - Text is released as soon as it arrives, except for the few characters
+    that could still turn into a violation:
+      * an open markdown link, from "[" until its ")" (or until it clearly
+        isn't a link);
+      * a solicitation lead-in ("could you", "please provide", "what is",
+        "I'll need", ...), from its first word until the sentence shows
+        whether "your <personal detail>" follows (FILLER_WORDS only in
+        between). Lead-ins are matched
+        word by word against a small trie (LEAD_PHRASES), so "You can opt
+        out" is released as soon as "opt" arrives.
+  - A complete link whose URL isn't in the corpus (article URLs, links
+    inside articles and the help-centre home pages, loaded once from
+    scraped_content.json) is rewritten to its plain link text.
+  - A sentence that asks for a personal detail (PII_PATTERN, unless
+    negated: "never share your ...") is replaced from the lead-in to the
+    end of the sentence by PII_NOTICE.
+
+Every violation is logged and counted (get_guard_stats()). Set
+OUTPUT_GUARD=0 to stream the model output unchecked.
+
+Usage:
+    python output_guard.py bench     # per-chunk cost and first-chunk latency on replayed answers
+"""
+import json
+import os
+import re
+import threading
+import time
+from urllib.parse import urldefrag, urlparse
+
+GUARD_ENABLED = os.environ.get("OUTPUT_GUARD", "1") == "1"
+CORPUS_FILE = "data/scraped_content.json"
+
+PII_NOTICE = (
+    "I can't take personal details like your NEST ID, National Insurance number or date of birth here, "
+    "and you don't need to share them. To see your own account, please log in on the Nest website."
+)
+REMOVED_LINK_TEXT = "(link removed)"
+
+# First words of phrases that ask the reader for something; "your <detail>" must follow within the sentence
+LEAD_PHRASES = (
+    "please provide", "please share", "please send", "please give", "please tell", "please confirm",
+    "please reply", "please let me know",
+    "can you", "could you", "would you", "will you", "may i have", "may i ask", "can i have", "can i get",
+    "i need", "i'll need", "i will need", "i would need", "i'd need", "we need", "we'll need",
+    "send me", "send us", "give me", "give us", "tell me", "tell us", "share with me", "let me know",
+    "provide me", "provide us", "what is", "what's", "what are",
+)
+# Words allowed between a lead-in and "your" ("could you please tell me your"); "could you reset your password" is fine
+FILLER_WORDS = (
+    "please", "kindly", "also", "just", "first", "quickly", "me", "us", "with", "provide", "share", "send",
+    "give", "tell", "confirm", "let", "know", "have", "get", "type", "ask", "for", "i", "can", "again",
+)
+PII_TERMS = (
+    r"nest\s+(?:id|number|member\s+number)", r"member\s+(?:id|number)",
+    r"national\s+insurance(?:\s+number)?", r"ni\s+number", r"nino", r"nni",
+    r"date\s+of\s+birth", r"dob", r"birthday", r"password", r"passcode", r"pin(?:\s+number)?",
+    r"bank\s+(?:details|account(?:\s+number)?)", r"sort\s+code", r"account\s+number",
+)
+# What follows a lead-in when it asks for a personal detail; the lookahead needs the term to be complete
+PII_PATTERN = re.compile(
+    r"(?:,?\s+(?:" + "|".join(FILLER_WORDS) + r")\b)*\s+your\s+(?:" + "|".join(PII_TERMS) + r")(?=[^\w-])",
+    re.IGNORECASE,
+)
+NEGATION = re.compile(
+    r"\b(?:never|not|don't|do not|won't|will not|cannot|can't|shouldn't|should not|no need|without)\b", re.IGNORECASE
+)
+LINK = re.compile(r"\[([^\]\n]*)\]\(([^)\s]*)\)")
+# Text that can still become a complete link (kept back while streaming)
+OPEN_LINK = re.compile(r"\[[^\]\n]{0,300}(?:\](?:\([^)\s]{0,500})?)?")
+WORD = re.compile(r"[A-Za-z'’]+")
+SENTENCE_END = re.compile(r"[.?!](?=\s|$)|\n")
+MAX_HELD_CHARS = 200
+
+
+def _build_trie(phrases):
+    trie = {}
+    for phrase in phrases:
+        node = trie
+        for word in phrase.split():
+            node = node.setdefault(word, {})
+        node[None] = True  # Phrase ends here
+    return trie
+
+
+LEAD_TRIE = _build_trie(LEAD_PHRASES)
+# Every prefix of a first word, so a half-streamed "Coul" is held for one more chunk
+LEAD_PREFIXES = {word[:i] for word in LEAD_TRIE for i in range(1, len(word) + 1)}
+
+_lock = threading.Lock()
+_stats = {"answers": 0, "chunks": 0, "links_checked": 0, "links_removed": 0, "pii_rewritten": 0}
+_known_urls = {"mtime": None, "urls": frozenset()}
+
+
+def normalize_url(url):
+    """Comparable form of a link target: no fragment, lowercase scheme/host, no trailing slash."""
+    url, _ = urldefrag(url.strip())
+    parsed = urlparse(url)
+    path = parsed.path.rstrip("/")
+    return parsed._replace(scheme=parsed.scheme.lower(), netloc=parsed.netloc.lower(), path=path).geturl()
+
+
+def load_known_urls(path=CORPUS_FILE):
+    """Every URL in the corpus, normalized. Reloaded only when the file changes."""
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return _known_urls["urls"]
+    if mtime == _known_urls["mtime"]:
+        return _known_urls["urls"]
+    with open(path, "r", encoding="utf-8") as f:
+        items = json.load(f)
+    urls = set()
+    for item in items:
+        for url in [item["url"]] + list(item.get("duplicate_urls", [])) + LINK.findall(item["content"]):
+            url = url[1] if isinstance(url, tuple) else url
+            if url.startswith(("http://", "https://")):
+                urls.add(normalize_url(url))
+                parsed = urlparse(url)
+                urls.add(normalize_url(f"{parsed.scheme}://{parsed.netloc}/"))  # "log in on the website"
+    with _lock:
+        _known_urls.update(mtime=mtime, urls=frozenset(urls))
+    return _known_urls["urls"]
+
+
+def _count(key, n=1):
+    with _lock:
+        _stats[key] += n
+
+
+def get_guard_stats():
+    with _lock:
+        return dict(_stats)
+
+
+class OutputGuard:
+    """Incremental filter: feed() chunks in, get the text that is safe to show out."""
+
+    def __init__(self, known_urls):
+        self.known_urls = known_urls
+        self.pending = ""       # Held back, not shown yet
+        self.sentence = ""      # Shown part of the current sentence (for negations)
+        self.dropping = False   # Inside a rewritten sentence: drop until it ends
+        self.violations = []
+
+    def feed(self, chunk):
+        self.pending += chunk
+        return self._drain(final=False)
+
+    def finish(self):
+        return self._drain(final=True)
+
+    def _release(self, out, text):
+        out.append(text)
+        end = None
+        for end in SENTENCE_END.finditer(text):
+            pass
+        self.sentence = text[end.end():] if end else (self.sentence + text)[-MAX_HELD_CHARS:]
+
+    def _drain(self, final):
+        out = []
+        while self.pending:
+            if self.dropping:
+                end = SENTENCE_END.search(self.pending)
+                if not end:
+                    self.pending = ""
+                    break
+                self.dropping = False
+                self.pending = self.pending[end.end():]
+                if end.group() == "\n":
+                    self._release(out, "\n")
+                continue
+
+            start = self._hold_start(self.pending, final)
+            if start is None:
+                self._release(out, self.pending)
+                self.pending = ""
+                break
+            if start:
+                self._release(out, self.pending[:start])
+                self.pending = self.pending[start:]
+
+            if self.pending[0] == "[":
+                done = self._check_link(out, final)
+            else:
+                done = self._check_lead(out, final)
+            if not done:
+                break
+        return "".join(out)
+
+    def _hold_start(self, text, final):
+        """Index of the first character that can't be released yet (None if all can)."""
+        bracket = text.find("[")
+        for word in WORD.finditer(text):
+            if bracket != -1 and word.start() > bracket:
+                break
+            key = word.group().lower().replace("’", "'")
+            at_end = word.end() == len(text) and not final
+            if key in LEAD_TRIE or (at_end and key in LEAD_PREFIXES):
+                if word.start() == 0 or not text[word.start() - 1].isalnum():
+                    return word.start()
+        return bracket if bracket != -1 else None
+
+    def _check_link(self, out, final):
+        """Handle the "[" at the start of pending. False if more text is needed."""
+        text = self.pending
+        link = LINK.match(text)
+        if link:
+            label, url = link.groups()
+            _count("links_checked")
+            if normalize_url(url) in self.known_urls:
+                self._release(out, link.group())
+            else:
+                self.violations.append(("link", url))
+                _count("links_removed")
+                self._release(out, REMOVED_LINK_TEXT if label.startswith(("http://", "https://")) else label)
+            self.pending = text[link.end():]
+            return True
+        if not final and OPEN_LINK.fullmatch(text):
+            return False
+        # Not a link after all ("[1]", "[note] text"): show the bracket and carry on
+        self._release(out, "[")
+        self.pending = text[1:]
+        return True
+
+    def _check_lead(self, out, final):
+        """Handle the lead-in word at the start of pending. False if more text is needed."""
+        text = self.pending
+        words = list(WORD.finditer(text))
+        node, lead_end = LEAD_TRIE, None
+        for i, word in enumerate(words):
+            if i and text[words[i - 1].end():word.start()].strip():
+                break  # Punctuation between the words
+            key = word.group().lower().replace("’", "'")
+            if word.end() == len(text) and not final:
+                if any(k is not None and k.startswith(key) for k in node):
+                    return False  # Word still streaming
+            if key not in node:
+                break
+            node = node[key]
+            if None in node:
+                lead_end = word.end()
+                if len(node) == 1:
+                    break
+        else:
+            if not final and len(node) > (None in node) and not text[words[-1].end():].strip():
+                return False  # The next word decides
+        if lead_end is None:
+            self._release(out, text[:words[0].end()])
+            self.pending = text[words[0].end():]
+            return True
+
+        request = PII_PATTERN.match(text, lead_end) or (final and PII_PATTERN.match(text + " ", lead_end))
+        if request and not NEGATION.search(self.sentence + text[:request.end()]):
+            self.violations.append(("pii", text[:request.end()]))
+            _count("pii_rewritten")
+            self._release(out, PII_NOTICE)
+            self.pending = text[request.end():]
+            self.dropping = True
+            return True
+        rest = text[lead_end:]
+        if not final and not SENTENCE_END.search(rest) and len(rest) < MAX_HELD_CHARS:
+            return False
+        self._release(out, text[:lead_end])
+        self.pending = rest
+        return True
+
+
+def guard_stream(chunks, known_urls=None):
+    """Yield `chunks` with unknown links and requests for personal details rewritten."""
+    if not GUARD_ENABLED:
+        yield from chunks
+        return
+    guard = OutputGuard(load_known_urls() if known_urls is None else known_urls)
+    _count("answers")
+    try:
+        for chunk in chunks:
+            if not chunk:
+                continue
+            _count("chunks")
+            text = guard.feed(chunk)
+            if text:
+                yield text
+    except Exception:
+        # Show what was held back (checked) before the error reaches the caller
+        text = guard.finish()
+        if text:
+            yield text
+        raise
+    text = guard.finish()
+    for kind, found in guard.violations:
+        print(f"DEBUG: Output guard rewrote {'an unknown link' if kind == 'link' else 'a request for personal details'}: "
+              f"{found!r}", flush=True)
+    if text:
+        yield text
+
+
+# -----------------------------------------------------------------------------
+# Benchmark
+# -----------------------------------------------------------------------------
+
+SAMPLE_ANSWERS = (
+    "You can opt out within one month of being enrolled. Log in to your account and select "
+    "[opt out](https://www.nestpensions.org.uk/schemeweb/memberhelpcentre/opting-out/how-to-opt-out.html). "
+    "If you can't log in, see [forgotten password](https://www.nestpensions.org.uk/schemeweb/memberhelpcentre/"
+    "logging-into-account/forgotten-password.html).",
+    "Could you please tell me your NEST ID and date of birth so I can check? Then I'll look into your balance. "
+    "Meanwhile, read [this guide](https://example.com/made-up-guide).",
+    "I will never ask for your National Insurance number. What is the best way to reach you? "
+    "You can find the form at [https://www.nestpensions.org.uk/fake-page](https://www.nestpensions.org.uk/fake-page).",
+)
+
+
+def _chunks(text, size=4):
+    """Split text into token-sized pieces, as the API streams it."""
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def bench(rounds=2000):
+    known = load_known_urls()
+    print(f"{len(known)} known URLs\n")
+    for answer in SAMPLE_ANSWERS:
+        guard = OutputGuard(known)
+        shown = "".join(guard.feed(c) for c in _chunks(answer)) + guard.finish()
+        print(f"IN:  {answer}\nOUT: {shown}\n     {len(guard.violations)} violation(s)\n")
+
+    chunks = [_chunks(answer) for answer in SAMPLE_ANSWERS]
+    total = sum(len(c) for c in chunks) * rounds
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for pieces in chunks:
+            guard = OutputGuard(known)
+            for piece in pieces:
+                guard.feed(piece)
+            guard.finish()
+    elapsed = time.perf_counter() - start
+    print(f"{total} chunks: {elapsed / total * 1e6:.1f} us per chunk")
+
+    # Time to first token in chunks: 1 means the first chunk is shown as it arrives
+    for answer, pieces in zip(SAMPLE_ANSWERS, chunks):
+        guard = OutputGuard(known)
+        first = next((i + 1 for i, piece in enumerate(pieces) if guard.feed(piece)), len(pieces))
+        print(f"  first text shown after chunk {first}: {answer[:40]!r}...")
+
+if __name__ == "__main__":
+    import sys
+
+    if sys.argv[1:2] == ["bench"]:
+        bench()
+    else:
+        print(__doc__)
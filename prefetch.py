@@ -0,0 +1,155 @@
+"""
+Prefetch - Speculative retrieval for the predicted follow-up topic.
+
+Once a follow-up topic is suggested, the retrieval for "Tell me more about
+<topic>" (and optionally a draft answer) runs in the background, so clicking
+"Yes, tell me more" can stream straight away. Entries are held in a
+process-wide store bounded by entry count and approximate size; unused
+prefetches are dropped as soon as the session moves on or the bound is hit.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+MAX_ENTRIES = int(os.environ.get("PREFETCH_MAX_ENTRIES", "64"))
+MAX_BYTES = int(os.environ.get("PREFETCH_MAX_BYTES", str(4 * 1024 * 1024)))
+# How long a click waits for an in-flight prefetch before doing the work itself
+TAKE_TIMEOUT_SECONDS = 5.0
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="prefetch")
+_lock = threading.Lock()
+_entries = OrderedDict()  # session_id -> entry
+_stats = {"started": 0, "hits": 0, "misses": 0, "evicted": 0, "discarded": 0}
+
+
+def _results_size(results):
+    """Rough byte size of a Chroma result set (documents dominate)."""
+    if not results:
+        return 0
+    return sum(len(doc) for doc in results["documents"][0]) + 512
+
+
+def _finished(future):
+    return future is not None and future.done() and not future.cancelled() and future.exception() is None
+
+
+def _entry_size(entry):
+    size = 0
+    if _finished(entry["retrieval"]):
+        size += _results_size(entry["retrieval"].result()[0])
+    if _finished(entry["draft"]):
+        size += len(entry["draft"].result() or "")
+    return size
+
+
+def _enforce_bounds():
+    """Evict the oldest sessions' prefetches until the store is within bounds.
+
+    Cancelling runs future callbacks synchronously, so it happens after the
+    lock is released.
+    """
+    evicted = []
+    with _lock:
+        total = sum(_entry_size(entry) for entry in _entries.values())
+        while _entries and (len(_entries) > MAX_ENTRIES or total > MAX_BYTES):
+            _, entry = _entries.popitem(last=False)
+            total -= _entry_size(entry)
+            evicted.append(entry)
+            _stats["evicted"] += 1
+    for entry in evicted:
+        _cancel(entry)
+
+
+def _cancel(entry):
+    entry["retrieval"].cancel()
+    if entry["draft"] is not None:
+        entry["draft"].cancel()
+
+
+def start_prefetch(session_id, query, retrieve_fn, draft_fn=None):
+    """Start background work for a likely next query.
+
+    `retrieve_fn(query)` returns (results, retrieval_query); `draft_fn(query,
+    results)` optionally returns a complete draft answer built from them.
+    Any earlier prefetch for the session is replaced.
+    """
+    discard(session_id)
+
+    retrieval = _executor.submit(retrieve_fn, query)
+    draft = Future() if draft_fn is not None else None
+
+    def run_draft(results):
+        try:
+            draft.set_result(draft_fn(query, results))
+        except Exception as e:
+            draft.set_exception(e)
+
+    def chain_draft(done):
+        # The draft is only queued once retrieval finishes, so it never ties up
+        # a worker waiting on another task.
+        if not _finished(done):
+            draft.cancel()
+        elif draft.set_running_or_notify_cancel():
+            _executor.submit(run_draft, done.result()[0])
+
+    entry = {"query": query, "retrieval": retrieval, "draft": draft, "created": time.time()}
+    with _lock:
+        _entries[session_id] = entry
+        _stats["started"] += 1
+    _enforce_bounds()
+    if draft is not None:
+        retrieval.add_done_callback(chain_draft)
+        draft.add_done_callback(lambda _: _enforce_bounds())
+    # Re-check the size bound once the results are in memory
+    retrieval.add_done_callback(lambda _: _enforce_bounds())
+
+
+def take_prefetch(session_id, query, timeout=TAKE_TIMEOUT_SECONDS):
+    """Claim the session's prefetch if it was for `query`.
+
+    Returns (results, retrieval_query, draft_text_or_None), or None on a miss.
+    The entry is removed either way, so a prefetch is used at most once.
+    """
+    with _lock:
+        entry = _entries.pop(session_id, None)
+    if entry is None or entry["query"] != query:
+        if entry is not None:
+            _cancel(entry)
+        _stats["misses"] += 1
+        return None
+
+    try:
+        results, retrieval_query = entry["retrieval"].result(timeout=timeout)
+    except Exception as e:
+        print(f"DEBUG: Prefetch retrieval unavailable: {e}", flush=True)
+        _cancel(entry)
+        _stats["misses"] += 1
+        return None
+
+    draft_text = None
+    if _finished(entry["draft"]):
+        draft_text = entry["draft"].result() or None
+    elif entry["draft"] is not None:
+        # Don't make the user wait for a draft; the live answer is streamed instead
+        entry["draft"].cancel()
+
+    _stats["hits"] += 1
+    return results, retrieval_query, draft_text
+
+
+def discard(session_id):
+    """Drop any unused prefetch for the session (e.g. the user clicked 'No')."""
+    with _lock:
+        entry = _entries.pop(session_id, None)
+    if entry is not None:
+        _cancel(entry)
+        _stats["discarded"] += 1
+
+
+def get_prefetch_stats():
+    with _lock:
+        stats = dict(_stats)
+        stats["entries"] = len(_entries)
+    return stats
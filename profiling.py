@@ -0,0 +1,245 @@
+"""
+Profiling - Opt-in sampling profiler for single script runs and turns.
+
+When one turn is slow in production, the time could be anywhere in the
+Streamlit script run: rendering, retrieval, dateparser, CSV logging.
+chatbot.py marks three units of work:
+    rerun      a full script run (begin() after the session id is known, finish() at the end;
+               a run cut short by st.stop or a rerun is finished by the next run)
+    turn       answering one question (also on fragment reruns, where only the chat area runs)
+    end_chat   the End Chat callback (CSV and Google Sheets logging)
+
+A unit is profiled when:
+  - PROFILE_SAMPLE_RATE > 0 and a random draw falls under it (e.g. 0.01 = 1% of runs), or
+  - PROFILE_ADMIN_TOKEN is set and the page was opened with ?profile=<token>.
+    That session is then profiled on every run until it ends.
+
+While profiling, a background thread looks at the script thread's stack
+every PROFILE_INTERVAL_MS (sys._current_frames()). When the unit ends, the
+stacks are written in collapsed format, one "frame;frame;frame count" line
+per distinct stack. flamegraph.pl, inferno or speedscope turn this into a
+flame graph. Every stack starts with "<label> <session id>", so files from
+several sessions can be merged and still told apart:
+    data/profiles/<YYYYmmdd-HHMMSSmmm>_<session>_<label>.collapsed
+
+Only the script thread is sampled (not prefetch or admission threads), and
+C code that holds the GIL shows up as one long sample of its Python caller.
+When profiling is off, begin() costs a float comparison, plus a dict
+lookup when given a session state (about a microsecond).
+
+Usage:
+    python profiling.py report FILE...   # inclusive and self time per function
+    python profiling.py overhead         # cost of begin()/finish() when off, and of sampling when on
+"""
+import hmac
+import os
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_ADMIN_TOKEN = os.environ.get("PROFILE_ADMIN_TOKEN", "")
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", "5"))
+# A run that stops early and is never followed by another one: its sampler stops by itself
+PROFILE_MAX_SECONDS = float(os.environ.get("PROFILE_MAX_SECONDS", "120"))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "data/profiles")
+STATE_KEY = "running_profile"  # Where begin(state=...) keeps the unit's profile between runs
+
+_active = threading.local()  # The profile running on this thread (so nested units join it)
+
+
+def admin_requested(token):
+    """True if a ?profile=<token> value matches PROFILE_ADMIN_TOKEN."""
+    return bool(PROFILE_ADMIN_TOKEN and token) and hmac.compare_digest(str(token), PROFILE_ADMIN_TOKEN)
+
+
+def _frame_name(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ":")
+
+
+class SamplingProfiler:
+    """Counts the distinct stacks of one thread, sampled from a background thread."""
+
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL_MS / 1000, max_seconds=PROFILE_MAX_SECONDS):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.counts = {}
+        self.samples = 0
+        self.started = self.stopped = None
+        self._stop = threading.Event()
+        self._names = {}  # code object -> frame name
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not threading.current_thread():
+            self._thread.join()
+        return self
+
+    def _run(self):
+        deadline = self.started + self.max_seconds
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None or time.perf_counter() > deadline:
+                break
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                name = self._names.get(code)
+                if name is None:
+                    name = self._names[code] = _frame_name(code)
+                stack.append(name)
+                frame = frame.f_back
+            key = tuple(reversed(stack))
+            self.counts[key] = self.counts.get(key, 0) + 1
+            self.samples += 1
+        self.stopped = time.perf_counter()
+
+    def collapsed(self, root=()):
+        """Lines of "frame;frame;... count", heaviest first."""
+        return [
+            ";".join(tuple(root) + stack) + f" {count}"
+            for stack, count in sorted(self.counts.items(), key=lambda item: -item[1])
+        ]
+
+
+class Profile:
+    """One profiled unit of work; finish() writes the collapsed stacks."""
+
+    def __init__(self, session_id, label):
+        self.session_id = session_id or "anonymous"
+        self.label = label
+        self.sampler = SamplingProfiler(threading.get_ident()).start()
+        self.path = None
+
+    def finish(self):
+        if self.path is not None or self.sampler is None:
+            return self.path
+        if getattr(_active, "profile", None) is self:
+            _active.profile = None
+        sampler, self.sampler = self.sampler.stop(), None
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        now = time.time()
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(now)) + f"{int(now * 1000) % 1000:03d}"
+        self.path = os.path.join(PROFILE_DIR, f"{stamp}_{self.session_id[:8]}_{self.label}.collapsed")
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write("\n".join(sampler.collapsed(root=(f"{self.label} {self.session_id[:8]}",))) + "\n")
+        elapsed = (sampler.stopped or time.perf_counter()) - sampler.started
+        leaves = {}
+        for stack, count in sampler.counts.items():
+            leaves[stack[-1]] = leaves.get(stack[-1], 0) + count
+        top = ", ".join(f"{name} {count}" for name, count in sorted(leaves.items(), key=lambda i: -i[1])[:3])
+        print(f"DEBUG: Profiled {self.label} ({elapsed:.2f} s, {sampler.samples} samples) -> {self.path}"
+              f"{'; top: ' + top if top else ''}", flush=True)
+        return self.path
+
+
+def begin(session_id, label, requested=False, state=None):
+    """Start profiling this thread if the run is sampled or requested; else None.
+
+    For a full script run, which has no `with` block to hang on: call at
+    the top, finish() at the bottom. Streamlit starts every run on a new
+    thread, so pass st.session_state as `state`: the profile is kept there,
+    and one that an earlier run left running (st.stop, a rerun, an
+    exception) is finished first, with the samples it has.
+    """
+    if state is not None:
+        previous = state.pop(STATE_KEY, None)
+        if previous is not None:
+            previous.finish()
+    if not requested and not (PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE):
+        return None
+    profile = _active.profile = Profile(session_id, label)
+    if state is not None:
+        state[STATE_KEY] = profile
+    return profile
+
+
+@contextmanager
+def profile_run(session_id, label, requested=False):
+    """Profile the enclosed block, unless it is already part of a running profile."""
+    if getattr(_active, "profile", None) is not None:
+        yield None
+        return
+    profile = begin(session_id, label, requested)
+    try:
+        yield profile
+    finally:
+        if profile is not None:
+            profile.finish()
+
+
+# -----------------------------------------------------------------------------
+# Reports
+# -----------------------------------------------------------------------------
+
+def read_collapsed(path):
+    """{stack tuple: count} from a collapsed-stack file."""
+    counts = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if not line:
+                continue
+            stack, _, count = line.rpartition(" ")
+            key = tuple(stack.split(";"))
+            counts[key] = counts.get(key, 0) + int(count)
+    return counts
+
+
+def report(paths):
+    counts = {}
+    for path in paths:
+        for stack, count in read_collapsed(path).items():
+            counts[stack] = counts.get(stack, 0) + count
+    total = sum(counts.values()) or 1
+    inclusive, own = {}, {}
+    for stack, count in counts.items():
+        for name in set(stack[1:]):  # The first frame is the "<label> <session>" tag
+            inclusive[name] = inclusive.get(name, 0) + count
+        own[stack[-1]] = own.get(stack[-1], 0) + count
+    print(f"{total} samples from {len(paths)} file(s)\n")
+    for title, table in (("Inclusive", inclusive), ("Self", own)):
+        print(f"{title:<10} {'%':>6}  Function")
+        for name, count in sorted(table.items(), key=lambda i: -i[1])[:15]:
+            print(f"{count:>10} {100 * count / total:>5.1f}%  {name}")
+        print()
+
+
+def overhead(rounds=200000):
+    """begin() when profiling is off, and the slowdown of a CPU-bound loop while sampled."""
+    global PROFILE_SAMPLE_RATE
+    PROFILE_SAMPLE_RATE = 0.0
+    start = time.perf_counter()
+    for _ in range(rounds):
+        begin("overhead", "rerun")
+    print(f"Profiling off: {(time.perf_counter() - start) / rounds * 1e9:.0f} ns per begin()")
+
+    def work():
+        start = time.perf_counter()
+        sum(i * i for i in range(5_000_000))
+        return time.perf_counter() - start
+
+    work()  # Warm up
+    plain = min(work() for _ in range(3))
+    sampler = SamplingProfiler(threading.get_ident()).start()
+    sampled = min(work() for _ in range(3))
+    sampler.stop()
+    print(f"Profiling on:  {plain * 1000:.0f} ms -> {sampled * 1000:.0f} ms "
+          f"({100 * (sampled / plain - 1):+.1f}%, {sampler.samples} samples every {PROFILE_INTERVAL_MS:g} ms)")
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["report"] and sys.argv[2:]:
+        report(sys.argv[2:])
+    elif sys.argv[1:2] == ["overhead"]:
+        overhead()
+    else:
+        print(__doc__)
@@ -0,0 +1,77 @@
+"""
+Prompts - Answer prompt laid out for provider-side prompt caching.
+
+LLM providers reuse the work done for the longest prefix of a request that
+they have already seen. The answer prompt used to start with TODAY'S DATE
+and run the per-question context, date result and history into the same
+system message as the instructions. As a result, no two requests shared
+a prefix, though ~1.5k characters of instructions never change.
+
+Messages are now laid out as:
+  1. system  ANSWER_INSTRUCTIONS, a constant: byte-identical in every request
+  2. system  reference material, sections always in this order (empty ones left out):
+             CONTEXT, DATE CALCULATION RESULT, EARLIER CONVERSATION,
+             RECENT CONVERSATION, TODAY'S DATE (last, it changes at midnight)
+  3. user    the question
+
+Cached vs uncached prompt tokens reported by the backend are counted in
+llm_client.get_prompt_cache_stats(). bench_prompts.py checks the layout
+against a mock backend.
+"""
+import hashlib
+from datetime import datetime
+
+ANSWER_INSTRUCTIONS = (
+    "You are a helpful and strict assistant for a Help Center.\n"
+    "INSTRUCTIONS:\n"
+    "1. **Greetings & Pleasantries**: If the user says 'Hello', 'Good morning', 'Thanks', or 'Thank you', respond politely and naturally. You do NOT need context for this.\n"
+    "2. **Information Queries**: For questions about NEST, pensions, or account details, you must answer based **ONLY** on the provided CONTEXT in the next message. "
+    "3. **Privacy & Security**: You are a public help bot. You do **NOT** have access to member accounts. **NEVER** ask for personal details like NEST ID, NNI, or Date of Birth. If a user asks about their specific account (e.g., 'What is my balance?'), explain that you cannot access their account and guide them to log in to the website.\n"
+    "If the context contains instructions, options, or steps (e.g., 'Website', 'Phone', 'Post'), you MUST summarize them clearly for the user. "
+    "ADVANCED REASONING: If the DATE CALCULATION RESULT is available, use it to answer specific date questions perfectly. "
+    "Do NOT try to do the math yourself if the result is provided. Trust the 'DATE CALCULATION RESULT'. "
+    "Do NOT simply say 'check the link' if the content is available in the text. "
+    "Do NOT fabricate information. "
+    "Do NOT mention external resources or say '(link provided)' unless the link path is explicitly present in the CONTEXT. "
+    "Always format links as Markdown: `[Link Text](url)`. "
+    "Be conversational but do NOT ask identifying questions. "
+    "If the answer is not in the context, say 'I cannot find that information in the help articles provided.'\n"
+    "Use TODAY'S DATE (at the end of the next message) for anything relative to today."
+)
+
+RECENT_MESSAGES = 6  # Last 3 exchanges
+RECENT_MESSAGE_CHARS = 150
+
+
+def format_recent(history):
+    """RECENT CONVERSATION lines, or "" for a first question."""
+    if len(history) <= 1:
+        return ""
+    return "".join(
+        f"{msg['role'].upper()}: {msg['content'][:RECENT_MESSAGE_CHARS]}...\n" for msg in history[-RECENT_MESSAGES:]
+    )
+
+
+def answer_messages(query, context_text, date_result="", summary="", history=(), today=None):
+    """Chat messages for one answer: static instructions, then the variable parts in a fixed order."""
+    today = today or datetime.now()
+    sections = [("CONTEXT", context_text)]
+    if date_result:
+        sections.append(("DATE CALCULATION RESULT", date_result))
+    if summary:
+        sections.append(("EARLIER CONVERSATION (summary)", summary))
+    recent = format_recent(list(history))
+    if recent:
+        sections.append(("RECENT CONVERSATION", recent))
+    sections.append(("TODAY'S DATE", today.strftime("%d %B %Y")))
+    reference = "\n\n".join(f"{title}:\n{body.strip()}" for title, body in sections)
+    return [
+        {"role": "system", "content": ANSWER_INSTRUCTIONS},
+        {"role": "system", "content": reference},
+        {"role": "user", "content": query},
+    ]
+
+
+def prefix_fingerprint(messages):
+    """Short hash of the static first message (the same value on every request if the prefix is stable)."""
+    return hashlib.sha256(messages[0]["content"].encode("utf-8")).hexdigest()[:12]
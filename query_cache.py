@@ -0,0 +1,229 @@
+"""
+Query Cache - Shared memo of query embeddings and retrieval results.
+
+Members ask the same questions in slightly different forms ("How do I opt
+out?", "how do i opt out"), and each session used to embed and search
+them again. Queries are normalised (case, whitespace, apostrophes and
+trailing punctuation) and two process-wide LRU caches are kept:
+  - query vectors, keyed by embedding model + normalised query;
+  - top-k results, keyed by index version + category + normalised query +
+    n_results + backend, so a re-index never serves stale results.
+
+Set QUERY_CACHE_DB to a SQLite file path to share both caches between
+worker processes on the same host. The local LRU is checked first and the
+shared store on a miss.
+
+Settings (environment variables):
+    QUERY_CACHE_VECTORS     query vectors kept in memory      (default 2048)
+    QUERY_CACHE_RESULTS     result sets kept in memory        (default 1024)
+    QUERY_CACHE_DB          optional SQLite file shared by processes
+    QUERY_CACHE_DB_ROWS     rows kept in the shared store     (default 20000)
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+MAX_VECTORS = int(os.environ.get("QUERY_CACHE_VECTORS", "2048"))
+MAX_RESULTS = int(os.environ.get("QUERY_CACHE_RESULTS", "1024"))
+DB_PATH = os.environ.get("QUERY_CACHE_DB") or None
+DB_MAX_ROWS = int(os.environ.get("QUERY_CACHE_DB_ROWS", "20000"))
+# Prune the shared store every this many writes
+DB_PRUNE_EVERY = 500
+RESULT_FIELDS = ("ids", "documents", "metadatas", "distances")
+
+_lock = threading.Lock()
+_vectors = OrderedDict()
+_results = OrderedDict()
+_stats = {
+    "vector_hits": 0, "vector_misses": 0,
+    "result_hits": 0, "result_misses": 0,
+    "shared_hits": 0, "evicted": 0,
+}
+_db_local = threading.local()
+_db_writes = 0
+
+
+def normalize_query(query):
+    """Canonical form used in cache keys: 'How do I opt out?' -> 'how do i opt out'."""
+    text = str(query).lower().replace("’", "'").replace("‘", "'")
+    text = " ".join(text.split())
+    return re.sub(r"[\s?!.,;:]+$", "", text)
+
+
+def vector_key(model, query):
+    return f"v|{model}|{normalize_query(query)}"
+
+
+def result_key(version, category, query, n_results, backend):
+    return f"r|{version or 'legacy'}|{category}|{backend}|{n_results}|{normalize_query(query)}"
+
+
+# -- Shared SQLite store ---------------------------------------------------------
+
+def _db():
+    """Per-thread connection to the shared store (None if not configured)."""
+    if DB_PATH is None:
+        return None
+    conn = getattr(_db_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH, timeout=1.0)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS query_cache (key TEXT PRIMARY KEY, value BLOB)")
+        _db_local.conn = conn
+    return conn
+
+
+def _db_get(key):
+    try:
+        conn = _db()
+        row = conn.execute("SELECT value FROM query_cache WHERE key = ?", (key,)).fetchone() if conn else None
+    except sqlite3.Error as e:
+        print(f"DEBUG: Query cache store read failed: {e}", flush=True)
+        return None
+    return row[0] if row else None
+
+
+def _db_put(key, value):
+    global _db_writes
+    try:
+        conn = _db()
+        if conn is None:
+            return
+        with _lock:
+            _db_writes += 1
+            prune = _db_writes % DB_PRUNE_EVERY == 0
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO query_cache (key, value) VALUES (?, ?)", (key, value))
+            if prune:
+                # Oldest rows first (REPLACE moves a key to a new rowid)
+                conn.execute(
+                    "DELETE FROM query_cache WHERE rowid <= (SELECT MAX(rowid) FROM query_cache) - ?",
+                    (DB_MAX_ROWS,)
+                )
+    except sqlite3.Error as e:
+        print(f"DEBUG: Query cache store write failed: {e}", flush=True)
+
+
+# -- In-process LRU -------------------------------------------------------------
+
+def _lru_get(cache, key):
+    with _lock:
+        value = cache.get(key)
+        if value is not None:
+            cache.move_to_end(key)
+        return value
+
+
+def _lru_put(cache, key, value, limit):
+    with _lock:
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > limit:
+            cache.popitem(last=False)
+            _stats["evicted"] += 1
+
+
+def _count(name):
+    with _lock:
+        _stats[name] += 1
+
+
+def get_vector(model, query, embed):
+    """Query embedding from the cache, computing it with `embed(query)` on a miss."""
+    key = vector_key(model, query)
+    vector = _lru_get(_vectors, key)
+    if vector is None:
+        blob = _db_get(key)
+        if blob is not None:
+            vector = np.frombuffer(blob, dtype=np.float32)
+            _count("shared_hits")
+    if vector is not None:
+        _count("vector_hits")
+        _lru_put(_vectors, key, vector, MAX_VECTORS)
+        return vector
+
+    _count("vector_misses")
+    vector = np.asarray(embed(query), dtype=np.float32)
+    vector.flags.writeable = False  # Shared between callers
+    _lru_put(_vectors, key, vector, MAX_VECTORS)
+    _db_put(key, vector.tobytes())
+    return vector
+
+
+def get_vectors(model, queries, embed_many):
+    """Embeddings of several queries; the misses are computed in one `embed_many(texts)` call."""
+    vectors, missing = [], {}
+    for query in queries:
+        key = vector_key(model, query)
+        vector = _lru_get(_vectors, key)
+        if vector is None:
+            blob = _db_get(key)
+            if blob is not None:
+                vector = np.frombuffer(blob, dtype=np.float32)
+                _count("shared_hits")
+        if vector is not None:
+            _count("vector_hits")
+            _lru_put(_vectors, key, vector, MAX_VECTORS)
+        else:
+            missing.setdefault(key, []).append(len(vectors))
+        vectors.append(vector)
+    if missing:
+        texts = [queries[positions[0]] for positions in missing.values()]
+        for (key, positions), vector in zip(missing.items(), embed_many(texts)):
+            _count("vector_misses")
+            vector = np.asarray(vector, dtype=np.float32)
+            vector.flags.writeable = False
+            _lru_put(_vectors, key, vector, MAX_VECTORS)
+            _db_put(key, vector.tobytes())
+            for position in positions:
+                vectors[position] = vector
+    return vectors
+
+
+def _copy_results(results):
+    return {field: [list(row) for row in results[field]] for field in RESULT_FIELDS if results.get(field) is not None}
+
+
+def get_results(key):
+    """Cached result set (a copy callers may modify), or None."""
+    results = _lru_get(_results, key)
+    if results is None:
+        blob = _db_get(key)
+        if blob is not None:
+            results = json.loads(blob)
+            _lru_put(_results, key, results, MAX_RESULTS)
+            _count("shared_hits")
+    if results is None:
+        _count("result_misses")
+        return None
+    _count("result_hits")
+    return _copy_results(results)
+
+
+def put_results(key, results):
+    stored = _copy_results(results)
+    _lru_put(_results, key, stored, MAX_RESULTS)
+    _db_put(key, json.dumps(stored))
+
+
+def clear():
+    with _lock:
+        _vectors.clear()
+        _results.clear()
+
+
+def get_cache_stats():
+    """Hit/miss counters and current sizes."""
+    with _lock:
+        stats = dict(_stats)
+        stats["vectors"] = len(_vectors)
+        stats["results"] = len(_results)
+    lookups = stats["result_hits"] + stats["result_misses"]
+    stats["result_hit_rate"] = stats["result_hits"] / lookups if lookups else 0.0
+    stats["shared_store"] = DB_PATH
+    return stats
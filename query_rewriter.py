@@ -0,0 +1,158 @@
+"""
+Query Rewriter - Turns follow-up messages into standalone retrieval queries.
+
+Follow-ups such as "what about by post?" or "Tell me more about Opting Out"
+only make sense next to the earlier turns, so they are condensed before
+retrieval: a cheap local heuristic first, and a short LLM call only for
+ambiguous references. Condensation runs in parallel with retrieval for the
+original wording, so a query that is already standalone never waits on it.
+"""
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from admission import complete_chat
+from retrieval import query_rag
+
+MAX_MEMO_ENTRIES = 64
+CONDENSE_MAX_TOKENS = 48
+
+STOPWORDS = {
+    "a", "an", "the", "i", "me", "my", "we", "our", "you", "your", "is", "are", "am", "was",
+    "be", "do", "does", "did", "can", "could", "should", "would", "will", "how", "what", "when",
+    "where", "why", "who", "which", "to", "of", "in", "on", "for", "with", "by", "about", "and",
+    "or", "if", "it", "that", "this", "these", "those", "them", "they", "there", "one", "please",
+    "tell", "more", "also", "so", "then", "ok", "okay", "thanks", "any", "some", "get", "have", "has",
+}
+
+# Conversational lead-ins that carry no retrieval signal of their own
+LEAD_IN = re.compile(
+    r"^\s*(?:and\s+|so\s+|ok(?:ay)?,?\s+)?(?:what|how)\s+about\s+|^\s*tell\s+me\s+more(?:\s+about)?\s*|^\s*(?:and|also)\s+",
+    re.IGNORECASE,
+)
+# References that can only be resolved from earlier turns
+ANAPHORA = re.compile(r"\b(?:it|that|this|these|those|them|they|one)\b", re.IGNORECASE)
+
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="condense")
+
+
+def content_words(text):
+    """Lower-cased words that carry meaning for retrieval."""
+    return [w for w in re.findall(r"[a-z0-9'-]+", text.lower()) if w not in STOPWORDS]
+
+
+def last_user_topic(history):
+    """Content words of the most recent earlier user question."""
+    for msg in reversed(history):
+        if msg["role"] == "user":
+            words = content_words(msg["content"])
+            if words:
+                return words
+    return []
+
+
+def needs_condensation(query, history):
+    """Cheap check: does this turn lean on earlier context?"""
+    if not any(msg["role"] == "user" for msg in history):
+        return False
+    if LEAD_IN.search(query) or ANAPHORA.search(query):
+        return True
+    return len(content_words(query)) <= 2
+
+
+def heuristic_condense(query, history):
+    """Strip lead-ins and borrow the previous topic's keywords.
+
+    Returns (standalone_query, confident). Pronoun-style references are
+    reported as not confident so the caller can ask the LLM instead.
+    """
+    core = LEAD_IN.sub("", query).strip(" ?.!")
+    core_words = content_words(core)
+    topic = [w for w in last_user_topic(history) if w not in core_words]
+
+    if len(core_words) >= 3 or not topic:
+        rewritten = core or query
+    else:
+        rewritten = f"{core} {' '.join(topic)}".strip()
+
+    confident = not ANAPHORA.search(core)
+    return rewritten, confident
+
+
+def llm_condense(query, history, client, model):
+    """Short LLM call that rewrites the turn as a standalone question."""
+    recent = "\n".join(
+        f"{msg['role'].upper()}: {msg['content'][:200]}" for msg in history[-4:]
+    )
+    prompt = (
+        "Rewrite the latest user message as ONE standalone search query for a pension help centre, "
+        "using the conversation only to resolve what it refers to. "
+        "Output ONLY the query.\n\n"
+        f"CONVERSATION:\n{recent}\n\nLATEST MESSAGE: {query}"
+    )
+    response = complete_chat(
+        client,
+        model=model,
+        messages=[{"role": "user", "content": prompt}],
+        temperature=0,
+        max_tokens=CONDENSE_MAX_TOKENS
+    )
+    return response.choices[0].message.content.strip().strip('"')
+
+
+def condense_query(query, history, client=None, model=None, memo=None):
+    """Return a standalone version of `query` (or `query` itself if already standalone).
+
+    `memo` is a per-session dict so repeated turns never pay for a second LLM call.
+    """
+    if not needs_condensation(query, history):
+        return query
+
+    key = (" ".join(last_user_topic(history)), query.strip().lower())
+    if memo is not None and key in memo:
+        return memo[key]
+
+    rewritten, confident = heuristic_condense(query, history)
+    if not confident and client is not None:
+        try:
+            rewritten = llm_condense(query, history, client, model) or rewritten
+        except Exception as e:
+            print(f"DEBUG: Query condensation failed, using heuristic: {e}", flush=True)
+
+    if memo is not None:
+        if len(memo) >= MAX_MEMO_ENTRIES:
+            memo.pop(next(iter(memo)))
+        memo[key] = rewritten
+    return rewritten
+
+
+def merge_results(primary, secondary, n_results):
+    """Merge two Chroma result sets, primary hits first, de-duplicated by id."""
+    merged = {"ids": [[]], "documents": [[]], "metadatas": [[]], "distances": [[]]}
+    for results in (primary, secondary):
+        for i, doc_id in enumerate(results["ids"][0]):
+            if doc_id in merged["ids"][0] or len(merged["ids"][0]) >= n_results:
+                continue
+            for field in merged:
+                values = results.get(field)
+                merged[field][0].append(values[0][i] if values else None)
+    return merged
+
+
+def retrieve_for_turn(query, history, category, client=None, model=None, memo=None, n_results=3):
+    """Retrieve context for a chat turn, condensing follow-ups into standalone queries.
+
+    Returns (results, standalone_query).
+    """
+    if not needs_condensation(query, history):
+        return query_rag(query, category, n_results=n_results), query
+
+    # Original-wording retrieval runs while we work out the standalone query
+    original_future = _executor.submit(query_rag, query, category, n_results)
+    standalone = condense_query(query, history, client=client, model=model, memo=memo)
+    original = original_future.result()
+
+    if standalone.strip().lower() == query.strip().lower():
+        return original, query
+
+    condensed = query_rag(standalone, category, n_results=n_results)
+    return merge_results(condensed, original, n_results), standalone
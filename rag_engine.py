@@ -0,0 +1,97 @@
+"""
+RAG Engine - Context building and answer generation, without the UI.
+
+chatbot.py used to hold these inline, so the only way to run the real
+pipeline was the Streamlit app. They live here so offline tools
+(bulk_answer.py) answer exactly as the app does: the same context layout
+and compression, date logic, prompt, admission layer and output guard.
+chatbot.py wraps them with its own client and category.
+"""
+from admission import stream_chat
+from dedup import drop_repeated_passages
+from output_guard import guard_stream
+from prompts import answer_messages
+from retrieval import DEFAULT_CATEGORY, compress_results
+
+# MODEL_NAME = "llama3.2:3b"
+MODEL_NAME = "llama-3.1-8b-instant" # Groq Llama 3 model
+
+
+def conversation_history(messages):
+    """Chat turns that matter for retrieval and prompting (drops the greeting/name exchange).
+
+    Leaving out the personalised onboarding turns also keeps first questions
+    byte-identical across members, so identical requests can be coalesced.
+    """
+    return [msg for msg in messages if not msg.get("onboarding")]
+
+
+def build_context(results, query=None, category=DEFAULT_CATEGORY):
+    """Format retrieved documents as the CONTEXT block of the prompt.
+
+    With a query, each article is cut down to its sentences most relevant
+    to it (retrieval.compress_results); otherwise articles are sent whole.
+    """
+    docs = results['documents'][0]
+    metadatas = results['metadatas'][0]
+    if not docs:
+        return "No relevant documents found."
+    if query:
+        try:
+            docs = compress_results(results, query, category) or docs
+        except Exception as e:
+            print(f"DEBUG: Context compression skipped: {e}", flush=True)
+    # Sentences repeated across the retrieved articles are only sent once
+    docs = drop_repeated_passages(docs)
+    context_parts = []
+    for doc, meta in zip(docs, metadatas):
+        context_parts.append(f"Source ({meta['category']}): {meta['header']}\n{doc}")
+    return "\n---\n".join(context_parts)
+
+
+def generate_answer_stream(client, query, context_text, messages, summary="", max_tokens=512,
+                           on_queue_position=None, on_usage=None, background=False):
+    """Generate the answer with streaming.
+
+    `messages` is the recent chat history (ending with the current user turn)
+    and `summary` the rolling summary of older turns; both are passed in
+    rather than read from st.session_state so drafts can be generated from
+    background threads. The request goes through the admission layer, which
+    calls `on_queue_position(n)` while it waits for a slot and `on_usage(usage)`
+    with the backend's token counts at the end. `background=True` (drafts)
+    skips the request rather than queueing behind members' turns.
+    """
+    # --- INTELLIGENT LAYER: Check for Date logic ---
+    date_result = ""
+    try:
+        from date_logic import calculate_opt_out_dates
+        # We try to see if the user mentioned a date relevant to enrollment
+        # Heuristic: If parsing returns a date, we inject the math.
+        # Ideally we only do this if the query seems relevant, but for "Advanced Reasoning" demo we can be eager.
+        calc_result = calculate_opt_out_dates(query)
+        if calc_result:
+            date_result = calc_result['summary']
+    except Exception as e:
+        print(f"Date logic error: {e}")
+    # -----------------------------------------------
+
+    # Static instructions first (cacheable by the provider), then context,
+    # date result, conversation and today's date in a fixed order
+    prompt_messages = answer_messages(
+        query, context_text, date_result=date_result, summary=summary,
+        history=conversation_history(messages)
+    )
+
+    # Enable Streaming with optimized parameters
+    print("DEBUG: Starting Stream...", flush=True)
+    # Unknown links and requests for personal details are rewritten as the answer streams
+    yield from guard_stream(stream_chat(
+        client,
+        on_queue_position=on_queue_position,
+        on_usage=on_usage,
+        background=background,
+        model=MODEL_NAME,
+        messages=prompt_messages,
+        temperature=0.3,
+        max_tokens=max_tokens
+    ))
@@ -0,0 +1,447 @@
+"""
+Retrieval - Category-sharded ChromaDB collections for the chatbot.
+
+Every help-centre category (Member, Employer, Connector) is embedded into its
+own collection by embedder.py, so a query only searches its own tenant's
+vectors instead of running a filtered scan over one shared collection.
+Each shard is loaded, warmed and measured independently.
+
+Shards are read from the index version that data/indexes/CURRENT points at
+(see index_versions.py). Every INDEX_CHECK_INTERVAL seconds the pointer is
+re-read; when it has moved, the new version is opened and the shards in use
+are warmed in a background thread, then swapped in. Requests already
+running keep the old collections, and old versions are never modified.
+Queries hold a reference on the version they use; the old version's
+Chroma client and mapped files are released when the last one finishes.
+
+With RETRIEVAL_BACKEND=mmap, shards are served from the flat memory-mapped
+export written next to each index version (see mmap_index.py) instead of
+Chroma, so worker processes share the vectors through the page cache.
+Query vectors and results are memoised across sessions by query_cache.py.
+query_rag_batch() embeds the uncached queries of a batch in one model call
+and searches them in one Chroma call (used by bulk_answer.py).
+Call preload() before forking workers so the embedding model is loaded
+once and shared copy-on-write. RETRIEVAL_QUANTIZATION=int8|binary makes
+the mmap backend scan quantized codes first and rescore a shortlist.
+
+Articles that share text can crowd out everything else in the top k, so
+query_rag fetches MMR_CANDIDATES x n_results candidates and picks n_results
+of them by maximal marginal relevance (dedup.mmr). RETRIEVAL_MMR_LAMBDA
+trades relevance against diversity; 1.0 gives plain top-k.
+compress_results() cuts the retrieved articles down to their most relevant
+sentences using the sentence index of the same version (compression.py).
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import chromadb
+from chromadb.utils import embedding_functions
+
+import index_versions
+import query_cache
+from compression import CONTEXT_BUDGET_TOKENS, SentenceIndex, has_sentence_index
+from dedup import mmr
+from mmap_index import MmapShard, has_shard, mmap_dir
+
+DB_PATH = "data/chroma_db"  # Legacy unversioned index, used until the first versioned build
+COLLECTION_NAME = "rag_knowledge_base"  # Legacy single collection (pre-sharding)
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+CATEGORIES = ["Member", "Employer", "Connector"]
+DEFAULT_CATEGORY = "Member"
+INDEX_CHECK_INTERVAL = float(os.environ.get("INDEX_CHECK_INTERVAL", "10"))
+# "chroma" (default) or "mmap" (falls back to Chroma for shards without an export)
+RETRIEVAL_BACKEND = os.environ.get("RETRIEVAL_BACKEND", "chroma")
+# First pass of the mmap backend: "none" (exact float32), "int8" or "binary" (then rescored in float32)
+RETRIEVAL_QUANTIZATION = os.environ.get("RETRIEVAL_QUANTIZATION", "none")
+# Maximal marginal relevance: 1.0 = plain top-k, lower favours results unlike those already picked
+MMR_LAMBDA = float(os.environ.get("RETRIEVAL_MMR_LAMBDA", "0.7"))
+MMR_CANDIDATES = 3  # Candidates fetched per result before diversifying
+
+_lock = threading.Lock()
+_embedding_fn = None
+_active = None        # _LoadedIndex being served
+_next_check = 0.0
+_swapping = None      # Version being loaded in the background
+_metrics = {}
+
+
+def shard_name(category):
+    """Collection name for a category shard, e.g. 'rag_knowledge_base_member'."""
+    return f"{COLLECTION_NAME}_{category.lower()}"
+
+
+def normalize_category(category):
+    """Map free text (query param, CLI arg) onto a known category."""
+    for known in CATEGORIES:
+        if str(category).strip().lower() == known.lower():
+            return known
+    return DEFAULT_CATEGORY
+
+
+def get_embedding_function():
+    """Load the sentence-transformer once; every shard uses the same model."""
+    global _embedding_fn
+    with _lock:
+        if _embedding_fn is None:
+            _embedding_fn = embedding_functions.SentenceTransformerEmbeddingFunction(model_name=EMBEDDING_MODEL)
+        return _embedding_fn
+
+
+def _new_metrics():
+    return {
+        "loaded": False,
+        "sharded": False,
+        "version": None,
+        "documents": 0,
+        "load_ms": 0.0,
+        "queries": 0,
+        "cache_hits": 0,
+        "errors": 0,
+        "total_ms": 0.0,
+        "last_ms": 0.0,
+        "max_ms": 0.0,
+    }
+
+
+class _LoadedIndex:
+    """One index version: its client and the shards loaded from it so far."""
+
+    def __init__(self, version, path):
+        self.version = version
+        self.path = path
+        self.client = chromadb.PersistentClient(path=path)
+        self.shards = {}
+        self.mmap_shards = {}
+        self.sentence_indexes = {}
+        self.shard_locks = {}
+        self.users = 0        # Queries running on this version (changed under _lock)
+        self.retired = False  # Replaced by a newer version; closed once users drops to 0
+
+    def close(self):
+        """Release the Chroma client and the mapped shard files."""
+        self.shards.clear()
+        self.mmap_shards.clear()  # numpy unmaps the files once the arrays are unreferenced
+        self.sentence_indexes.clear()
+        close = getattr(self.client, "close", None)  # chromadb >= 1.1
+        if close is not None:
+            try:
+                close()
+            except Exception as e:
+                print(f"DEBUG: Closing index {self.version or DB_PATH} failed: {e}", flush=True)
+        print(f"DEBUG: Released index {self.version or DB_PATH}", flush=True)
+
+    def _shard_lock(self, category):
+        # One lock per shard so loading a new tenant never blocks queries on another.
+        with _lock:
+            if category not in self.shard_locks:
+                self.shard_locks[category] = threading.Lock()
+            _metrics.setdefault(category, _new_metrics())
+            return self.shard_locks[category]
+
+    def get_shard(self, category):
+        if category in self.shards:
+            return self.shards[category]
+
+        with self._shard_lock(category):
+            if category in self.shards:
+                return self.shards[category]
+
+            start = time.perf_counter()
+            ef = get_embedding_function()
+            try:
+                collection = self.client.get_collection(name=shard_name(category), embedding_function=ef)
+                where = None
+            except Exception:
+                print(f"Shard {shard_name(category)} not found. Falling back to filtered '{COLLECTION_NAME}'.")
+                collection = self.client.get_collection(name=COLLECTION_NAME, embedding_function=ef)
+                where = {"category": category}
+
+            # Warm the shard: the first query loads the HNSW index into memory
+            # so the first real user doesn't pay for it.
+            if collection.count() > 0:
+                collection.query(query_texts=["help"], n_results=1, where=where)
+
+            metrics = _metrics[category]
+            metrics["loaded"] = True
+            metrics["sharded"] = where is None
+            metrics["version"] = self.version
+            metrics["documents"] = collection.count()
+            metrics["load_ms"] = (time.perf_counter() - start) * 1000
+
+            print(f"Loaded shard {category} ({self.version or DB_PATH}): {metrics['documents']} docs "
+                  f"in {metrics['load_ms']:.0f} ms (sharded={metrics['sharded']})")
+            self.shards[category] = (collection, where)
+            return self.shards[category]
+
+    def get_mmap_shard(self, category):
+        """The memory-mapped export of a shard, or None if this version has none."""
+        if category in self.mmap_shards:
+            return self.mmap_shards[category]
+
+        with self._shard_lock(category):
+            if category in self.mmap_shards:
+                return self.mmap_shards[category]
+            directory = mmap_dir(self.path)
+            shard = None
+            if has_shard(directory, category):
+                start = time.perf_counter()
+                shard = MmapShard(directory, category)
+                metrics = _metrics[category]
+                metrics["loaded"] = True
+                metrics["sharded"] = True
+                metrics["version"] = self.version
+                metrics["documents"] = len(shard)
+                metrics["load_ms"] = (time.perf_counter() - start) * 1000
+                print(f"Mapped shard {category} ({self.version or DB_PATH}): {len(shard)} docs "
+                      f"in {metrics['load_ms']:.0f} ms")
+            self.mmap_shards[category] = shard
+            return shard
+
+    def get_sentence_index(self, category):
+        """The sentence index of a shard, or None if this version has none."""
+        if category in self.sentence_indexes:
+            return self.sentence_indexes[category]
+
+        with self._shard_lock(category):
+            if category not in self.sentence_indexes:
+                directory = mmap_dir(self.path)
+                self.sentence_indexes[category] = (
+                    SentenceIndex(directory, category) if has_sentence_index(directory, category) else None
+                )
+            return self.sentence_indexes[category]
+
+
+def _swap_to(version, path, previous):
+    """Open a new version, warm the shards the old one was serving, then switch."""
+    global _active, _swapping
+    try:
+        index = _LoadedIndex(version, path)
+        for category in list(previous.shards):
+            index.get_shard(category)
+        for category in list(previous.mmap_shards):
+            index.get_mmap_shard(category)
+        for category in list(previous.sentence_indexes):
+            index.get_sentence_index(category)
+        with _lock:
+            _active = index
+            previous.retired = True
+            idle = previous.users == 0
+        print(f"Index switched: {previous.version or DB_PATH} -> {version or DB_PATH}", flush=True)
+        if idle:
+            previous.close()
+    except Exception as e:
+        # Keep serving the old version; the pointer is re-checked on the next interval
+        print(f"Index switch to {version} failed: {e}", flush=True)
+    finally:
+        with _lock:
+            _swapping = None
+
+
+def _active_index():
+    """The index being served, checking the CURRENT pointer at most every INDEX_CHECK_INTERVAL."""
+    global _active, _next_check, _swapping
+    index = _active
+    if index is None:
+        with _lock:
+            if _active is None:
+                _active = _LoadedIndex(*index_versions.resolve(DB_PATH))
+                _next_check = time.monotonic() + INDEX_CHECK_INTERVAL
+            return _active
+
+    if time.monotonic() < _next_check:
+        return index
+    with _lock:
+        if time.monotonic() < _next_check:
+            return _active
+        _next_check = time.monotonic() + INDEX_CHECK_INTERVAL
+        version, path = index_versions.resolve(DB_PATH)
+        if version == index.version or _swapping is not None:
+            return index
+        _swapping = version
+    threading.Thread(target=_swap_to, args=(version, path, index), daemon=True).start()
+    return index
+
+
+@contextmanager
+def _serving():
+    """The index being served, held open until the block ends (even if a switch happens meanwhile)."""
+    _active_index()
+    with _lock:
+        index = _active
+        index.users += 1
+    try:
+        yield index
+    finally:
+        with _lock:
+            index.users -= 1
+            idle = index.retired and index.users == 0
+        if idle:
+            index.close()
+
+
+def get_client():
+    """ChromaDB client of the index version being served."""
+    return _active_index().client
+
+
+def get_index_version():
+    """Version being served (None while serving the legacy DB_PATH)."""
+    return _active_index().version
+
+
+def get_shard(category):
+    """Return (collection, where_filter) for a category, loading and warming it once.
+
+    Falls back to the legacy shared collection with a category filter if the
+    database was built before sharding, so old deployments keep working until
+    embedder.py is re-run. The collection belongs to the version being served
+    and is closed after the next switch; offline tools use it straight away.
+    """
+    return _active_index().get_shard(normalize_category(category))
+
+
+def preload(categories=None):
+    """Load the embedding model and every shard up front.
+
+    Call in the parent process before forking workers: the model weights and
+    mapped vectors are then shared copy-on-write instead of loaded per worker.
+    """
+    ef = get_embedding_function()
+    ef(["help"])  # Run the model once so lazy initialisation happens here too
+    with _serving() as index:
+        for category in CATEGORIES if categories is None else categories:
+            try:
+                if RETRIEVAL_BACKEND == "mmap" and index.get_mmap_shard(category) is not None:
+                    continue
+                index.get_shard(category)
+            except Exception as e:
+                print(f"Preload skipped {category}: {e}")
+
+
+def embed_query(query):
+    """Query embedding, shared across sessions through the query cache."""
+    return query_cache.get_vector(EMBEDDING_MODEL, query, lambda text: get_embedding_function()([text])[0])
+
+
+def embed_queries(queries):
+    """Embeddings of several queries, the uncached ones in one model call."""
+    return query_cache.get_vectors(EMBEDDING_MODEL, queries, get_embedding_function())
+
+
+def diversify(results, query_vector, n_results, lambda_=MMR_LAMBDA):
+    """Keep n_results of a candidate result set, chosen by MMR over their embeddings."""
+    embeddings = results.get("embeddings")
+    if embeddings is None or len(results["ids"][0]) <= n_results:
+        picked = list(range(min(n_results, len(results["ids"][0]))))
+    else:
+        picked = mmr(query_vector, embeddings[0], n_results, lambda_)
+    return {
+        field: [[results[field][0][i] for i in picked]]
+        for field in query_cache.RESULT_FIELDS if results.get(field) is not None
+    }
+
+
+def query_rag(query, category, n_results=3):
+    """Retrieve relevant documents from the category's own shard.
+
+    Performance: Using n_results=3 provides better context while maintaining speed.
+    Results are cached per index version, so repeated questions skip both
+    the embedding and the search.
+    """
+    return query_rag_batch([query], category, n_results)[0]
+
+
+def query_rag_batch(queries, category, n_results=3):
+    """query_rag for several queries of one category, in one embedding call and one search call.
+
+    Cached queries are answered from the cache; the rest are embedded
+    together and searched with a single Chroma query (one row per query).
+    """
+    with _serving() as index:
+        return _query_batch(index, queries, normalize_category(category), n_results)
+
+
+def _query_batch(index, queries, category, n_results):
+    mmap_shard = index.get_mmap_shard(category) if RETRIEVAL_BACKEND == "mmap" else None
+    if mmap_shard is None:
+        collection, where = index.get_shard(category)
+    metrics = _metrics[category]
+
+    backend = f"mmap-{RETRIEVAL_QUANTIZATION}" if mmap_shard is not None else "chroma"
+    if MMR_LAMBDA < 1.0:
+        backend += f"-mmr{MMR_LAMBDA}"
+    results, keys, missing = [], [], []
+    for query in queries:
+        keys.append(query_cache.result_key(index.version, category, query, n_results, backend))
+        results.append(query_cache.get_results(keys[-1]))
+        if results[-1] is not None:
+            metrics["cache_hits"] += 1
+        else:
+            missing.append(len(results) - 1)
+    if not missing:
+        return results
+
+    start = time.perf_counter()
+    try:
+        query_vectors = embed_queries([queries[i] for i in missing])
+        diverse = MMR_LAMBDA < 1.0
+        n_candidates = n_results * MMR_CANDIDATES if diverse else n_results
+        if mmap_shard is not None:
+            found = [
+                mmap_shard.query(vector, n_candidates, quantization=RETRIEVAL_QUANTIZATION, include_embeddings=diverse)
+                for vector in query_vectors
+            ]
+        else:
+            batch = collection.query(
+                query_embeddings=list(query_vectors),
+                n_results=n_candidates,
+                where=where,
+                include=["documents", "metadatas", "distances"] + (["embeddings"] if diverse else [])
+            )
+            fields = query_cache.RESULT_FIELDS + (("embeddings",) if diverse else ())
+            found = [
+                {field: [batch[field][row]] for field in fields if batch.get(field) is not None}
+                for row in range(len(missing))
+            ]
+        if diverse:
+            found = [diversify(item, vector, n_results) for item, vector in zip(found, query_vectors)]
+    except Exception:
+        metrics["errors"] += 1
+        raise
+
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    metrics["queries"] += len(missing)
+    metrics["total_ms"] += elapsed_ms
+    metrics["last_ms"] = elapsed_ms / len(missing)
+    metrics["max_ms"] = max(metrics["max_ms"], elapsed_ms / len(missing))
+    for i, item in zip(missing, found):
+        query_cache.put_results(keys[i], item)
+        results[i] = item
+    return results
+
+
+def compress_results(results, query, category, budget=CONTEXT_BUDGET_TOKENS):
+    """The retrieved documents cut down to their sentences most relevant to `query`.
+
+    Returns None (send the documents whole) when compression is off or the
+    served version has no sentence index for these documents.
+    """
+    if budget <= 0 or not results["ids"][0]:
+        return None
+    with _serving() as served:
+        index = served.get_sentence_index(normalize_category(category))
+        if index is None:
+            return None
+        return index.compress(embed_query(query), results["ids"][0], results["documents"][0], budget)
+
+
+def get_shard_metrics():
+    """Snapshot of per-shard load and query metrics."""
+    snapshot = {}
+    for category, metrics in list(_metrics.items()):
+        stats = dict(metrics)
+        stats["avg_ms"] = stats["total_ms"] / stats["queries"] if stats["queries"] else 0.0
+        snapshot[category] = stats
+    return snapshot
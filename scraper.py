@@ -1,7 +1,9 @@
+import hashlib
 import requests
 from bs4 import BeautifulSoup
 import json
 import os
+import sys
 import time
 from urllib.parse import urljoin
 
@@ -20,115 +22,153 @@ HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
 }
 
+def extract_article(html, url):
+    """Header and markdown-ish content of one help article page."""
+    soup = BeautifulSoup(html, "html.parser")
+
+    # 1. Extract Header
+    header_tag = soup.find("h1")
+    header = header_tag.get_text(strip=True) if header_tag else "No Header Found"
+    
+    # 2. Extract Content
+    content_parts = []
+    start_node = soup.find("div", class_="article-help-heading")
+    if not start_node and header_tag:
+        # Fallback for pages without the specific heading class
+        print(f"Fallback: Using h1 as start node for {url}")
+        start_node = header_tag
+    
+    if start_node:
+        current = start_node.next_sibling
+        while current:
+            if current.name: # If it's a tag
+                # Check stop classes
+                classes = current.get("class", [])
+                if any(cls in STOP_CLASSES for cls in classes):
+                    break 
+                
+                # --- NEW: Preserve Links ---
+                # We iterate through all <a> tags in this element and replace them
+                # with markdown syntax [text](url) so the LLM sees the link.
+                for a_tag in current.find_all("a", href=True):
+                    href = a_tag["href"]
+                    # Filter out javascript: links
+                    if href.lower().startswith("javascript:") or href.strip() == "#":
+                        continue
+                        
+                    # Resolve relative links
+                    full_link = urljoin(url, href)
+                    link_text = a_tag.get_text(strip=True)
+                    
+                    # Replace <a> with string representation
+                    # We don't add extra spaces here because get_text(separator=' ') will handle it
+                    replacement = f"[{link_text}]({full_link})"
+                    a_tag.replace_with(replacement)
+                # ---------------------------
+
+                # Append text (now containing markdown links)
+                # IMPORTANT: Use separator=' ' to prevent "word1word2" merging across tags
+                text = current.get_text(separator=' ', strip=True)
+                
+                # Clean up multiple spaces potentially created by separator
+                text = ' '.join(text.split())
+                
+                if text:
+                    content_parts.append(text)
+            
+            current = current.next_sibling
+    else:
+        # Fallback or alternative structure if start node missing?
+        # For now, just log and skip
+        print(f"Warning: Start node 'div.article-help-heading' not found for {url}")
+        # we might want to try to grab the body or something, but strict rules say "starts at 1 tag"
+    
+    full_content = "\n".join(content_parts)
+    
+    return {"header": header, "content": full_content}
+
+
+def article_hash(article):
+    """Hash of an article's extracted text (discovery compares the same value)."""
+    return hashlib.sha256((article["header"] + "\n" + article["content"]).encode("utf-8")).hexdigest()
+
+
 def scrape_url(url):
     try:
         response = requests.get(url, headers=HEADERS, timeout=10)
         response.raise_for_status()
-        soup = BeautifulSoup(response.content, "html.parser")
-        
-        # 1. Extract Header
-        header_tag = soup.find("h1")
-        header = header_tag.get_text(strip=True) if header_tag else "No Header Found"
-        
-        # 2. Extract Content
-        content_parts = []
-        start_node = soup.find("div", class_="article-help-heading")
-        if not start_node and header_tag:
-            # Fallback for pages without the specific heading class
-            print(f"Fallback: Using h1 as start node for {url}")
-            start_node = header_tag
-        
-        if start_node:
-            current = start_node.next_sibling
-            while current:
-                if current.name: # If it's a tag
-                    # Check stop classes
-                    classes = current.get("class", [])
-                    if any(cls in STOP_CLASSES for cls in classes):
-                        break 
-                    
-                    # --- NEW: Preserve Links ---
-                    # We iterate through all <a> tags in this element and replace them
-                    # with markdown syntax [text](url) so the LLM sees the link.
-                    for a_tag in current.find_all("a", href=True):
-                        href = a_tag["href"]
-                        # Filter out javascript: links
-                        if href.lower().startswith("javascript:") or href.strip() == "#":
-                            continue
-                            
-                        # Resolve relative links
-                        full_link = urljoin(url, href)
-                        link_text = a_tag.get_text(strip=True)
-                        
-                        # Replace <a> with string representation
-                        # We don't add extra spaces here because get_text(separator=' ') will handle it
-                        replacement = f"[{link_text}]({full_link})"
-                        a_tag.replace_with(replacement)
-                    # ---------------------------
-
-                    # Append text (now containing markdown links)
-                    # IMPORTANT: Use separator=' ' to prevent "word1word2" merging across tags
-                    text = current.get_text(separator=' ', strip=True)
-                    
-                    # Clean up multiple spaces potentially created by separator
-                    text = ' '.join(text.split())
-                    
-                    if text:
-                        content_parts.append(text)
-                
-                current = current.next_sibling
-        else:
-            # Fallback or alternative structure if start node missing?
-            # For now, just log and skip
-            print(f"Warning: Start node 'div.article-help-heading' not found for {url}")
-            # we might want to try to grab the body or something, but strict rules say "starts at 1 tag"
-        
-        full_content = "\n".join(content_parts)
-        
-        return {
-            "header": header,
-            "content": full_content,
-            "success": True
-        }
+        article = extract_article(response.content, url)
+        return {"header": article["header"], "content": article["content"], "success": True}
 
     except Exception as e:
         print(f"Error scraping {url}: {e}")
         return {"success": False, "error": str(e)}
 
-def main():
-    if not os.path.exists(INPUT_FILE):
-        print(f"Input file {INPUT_FILE} not found. Run ingest_urls.py first.")
+def load_existing(output_file=OUTPUT_FILE):
+    """Previously scraped records keyed by URL (empty if there are none)."""
+    if not os.path.exists(output_file):
+        return {}
+    with open(output_file, "r", encoding="utf-8") as f:
+        return {item["url"]: item for item in json.load(f)}
+
+
+def main(changed_only=False, input_file=INPUT_FILE, output_file=OUTPUT_FILE, delay=0.5):
+    if not os.path.exists(input_file):
+        print(f"Input file {input_file} not found. Run discover_urls.py first.")
         return
 
-    with open(INPUT_FILE, "r", encoding="utf-8") as f:
+    with open(input_file, "r", encoding="utf-8") as f:
         url_list = json.load(f)
+
+    # --changed-only: keep a record whose stored hash matches the hash
+    # discovery saw for the page, fetch the rest. Comparing hashes (not the
+    # run's "changed" flag) means an edit is still picked up after a second
+    # discovery run or a failed scrape. URLs no longer in the list drop out.
+    existing = load_existing(output_file) if changed_only else {}
+    to_scrape = [
+        item for item in url_list
+        if not item.get("content_hash")
+        or existing.get(item["url"], {}).get("content_hash") != item["content_hash"]
+    ]
+
+    scraped = {}
     
-    scraped_data = []
-    
-    print(f"Starting scrape for {len(url_list)} URLs...")
+    print(f"Starting scrape for {len(to_scrape)} of {len(url_list)} URLs...")
     
-    for i, item in enumerate(url_list):
+    for i, item in enumerate(to_scrape):
         url = item["url"]
         category = item["category"]
         
-        print(f"[{i+1}/{len(url_list)}] Scraping {url}...")
+        print(f"[{i+1}/{len(to_scrape)}] Scraping {url}...")
         result = scrape_url(url)
         
         if result["success"]:
-            scraped_data.append({
+            scraped[url] = {
                 "url": url,
                 "category": category,
                 "header": result["header"],
-                "content": result["content"]
-            })
+                "content": result["content"],
+                "content_hash": article_hash(result)
+            }
+        elif url in existing:
+            # Keep the last good copy rather than losing the article
+            scraped[url] = existing[url]
             
         # Be nice to the server
-        time.sleep(0.5)
+        time.sleep(delay)
+
+    scraped_data = []
+    for item in url_list:
+        record = scraped.get(item["url"]) or existing.get(item["url"])
+        if record:
+            scraped_data.append(dict(record, category=item["category"]))
 
-    with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
+    with open(output_file, "w", encoding="utf-8") as f:
         json.dump(scraped_data, f, indent=4)
         
-    print(f"Scraping complete. Saved {len(scraped_data)} records to {OUTPUT_FILE}")
+    print(f"Scraping complete. Saved {len(scraped_data)} records to {output_file} "
+          f"({len(scraped)} fetched, {len(scraped_data) - len(scraped)} kept)")
+    return scraped
 
 if __name__ == "__main__":
-    main()
+    main(changed_only="--changed-only" in sys.argv[1:])
@@ -0,0 +1,460 @@
+"""
+Session Store - Conversation state that outlives a Streamlit session.
+
+st.session_state lives in one server process and is gone when the browser
+reconnects to another worker (or the same worker after a restart), so
+load-balanced deployments needed sticky sessions. The state a chat needs
+(session_id, conversation, conversation_step, user_name, last_prediction,
+chat_ended) is also saved here, keyed by the session id. The id is kept in
+the page URL as ?sid=, so a reconnect, page refresh or another worker picks
+the chat up where it was.
+
+  - Records are compact: JSON (the conversation via ConversationStore.to_dict,
+    which stores each message's text once) compressed with zlib.
+  - Writes are write-behind: save() serializes the state in the calling
+    thread (a run that changed nothing writes nothing). A background thread
+    writes the latest record per session every SESSION_FLUSH_MS in one
+    transaction. Loads on the same worker are served from the pending
+    records, and flush() runs at exit.
+  - Each save extends the record's life to SESSION_TTL seconds. A save
+    that changed nothing re-queues the same record (at most every
+    TTL_REFRESH seconds) just to move its expiry. Expired records are never
+    loaded and are purged by the flusher.
+  - A record belongs to the bot category it was saved under (?category=).
+    Opening its ?sid= link under another category starts a new chat instead
+    of restoring one bot's conversation into another.
+
+Backends (SESSION_STORE):
+    sqlite        SQLite file at SESSION_DB (default data/sessions.db). Shared
+                  by every worker process on one host (WAL mode).
+    memory        this process only (the old behaviour, e.g. for a single worker)
+    module:Class  any class implementing SessionBackend. A networked backend
+                  (e.g. Redis with SET ... EX ttl) only needs get / put_many /
+                  delete / purge_expired, and makes workers on several hosts
+                  interchangeable without sticky sessions.
+
+The session id in the URL is what gives access to a chat, like a session
+cookie. Ids are random UUID4s.
+
+Usage:
+    python session_store.py stats        # sessions stored, expired, size
+    python session_store.py purge        # delete expired records now
+    python session_store.py bench        # record size, save / flush / load latency
+"""
+import atexit
+import importlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from conversation_store import ConversationStore
+
+SESSION_STORE = os.environ.get("SESSION_STORE", "sqlite")
+SESSION_DB = os.environ.get("SESSION_DB", "data/sessions.db")
+SESSION_TTL = float(os.environ.get("SESSION_TTL", str(24 * 3600)))
+SESSION_FLUSH_MS = float(os.environ.get("SESSION_FLUSH_MS", "500"))
+PURGE_EVERY = 600  # Seconds between purges of expired records
+RECORD_VERSION = 2  # 2: records carry their bot category
+STATE_KEYS = ("conversation_step", "user_name", "last_prediction", "chat_ended")
+MAX_TRACKED = 10000  # Sessions whose last written record is remembered (to skip unchanged saves)
+TTL_REFRESH = 60  # Seconds an unchanged session's expiry may lag before the record is re-queued
+
+
+# -----------------------------------------------------------------------------
+# Records
+# -----------------------------------------------------------------------------
+
+def encode(record):
+    return zlib.compress(json.dumps(record, separators=(",", ":"), ensure_ascii=False).encode("utf-8"), 6)
+
+
+def decode(blob):
+    return json.loads(zlib.decompress(blob).decode("utf-8"))
+
+
+def session_record(state, category):
+    """The persisted part of a session's state (st.session_state or any mapping)."""
+    record = {"v": RECORD_VERSION, "session_id": state["session_id"], "category": category}
+    for key in STATE_KEYS:
+        if key in state:
+            record[key] = state[key]
+    record["conversation"] = state["conversation"].to_dict()
+    return record
+
+
+def apply_record(state, record):
+    """Put a loaded record back into a session's state."""
+    for key in STATE_KEYS:
+        if key in record:
+            state[key] = record[key]
+        elif key in state:
+            del state[key]
+    state["conversation"] = ConversationStore.from_dict(record["conversation"])
+    state["session_id"] = record["session_id"]
+
+
+# -----------------------------------------------------------------------------
+# Backends
+# -----------------------------------------------------------------------------
+
+class SessionBackend:
+    """Where session records live. Blobs are opaque; expires_at is a Unix time."""
+
+    def get(self, session_id):
+        """The blob stored for session_id, or None if missing or expired."""
+        raise NotImplementedError
+
+    def put_many(self, items):
+        """Store [(session_id, blob, expires_at)] (replacing earlier records)."""
+        raise NotImplementedError
+
+    def delete(self, session_id):
+        raise NotImplementedError
+
+    def purge_expired(self):
+        """Delete expired records; returns how many were deleted."""
+        return 0
+
+    def stats(self):
+        return {}
+
+
+class MemoryBackend(SessionBackend):
+    """Records held in this process only."""
+
+    def __init__(self):
+        self.records = {}
+        self.lock = threading.Lock()
+
+    def get(self, session_id):
+        with self.lock:
+            item = self.records.get(session_id)
+        if item is None or item[1] < time.time():
+            return None
+        return item[0]
+
+    def put_many(self, items):
+        with self.lock:
+            for session_id, blob, expires_at in items:
+                self.records[session_id] = (blob, expires_at)
+
+    def delete(self, session_id):
+        with self.lock:
+            self.records.pop(session_id, None)
+
+    def purge_expired(self):
+        now = time.time()
+        with self.lock:
+            expired = [sid for sid, (_, expires_at) in self.records.items() if expires_at < now]
+            for sid in expired:
+                del self.records[sid]
+        return len(expired)
+
+    def stats(self):
+        with self.lock:
+            return {"sessions": len(self.records), "bytes": sum(len(b) for b, _ in self.records.values())}
+
+
+class SQLiteBackend(SessionBackend):
+    """Records in a SQLite file, shared by the worker processes on one host."""
+
+    def __init__(self, path=SESSION_DB):
+        self.path = path
+        self.local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._db() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions "
+                "(session_id TEXT PRIMARY KEY, data BLOB NOT NULL, expires_at REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions (expires_at)")
+
+    def _db(self):
+        """Per-thread connection (the flusher thread has its own)."""
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def get(self, session_id):
+        row = self._db().execute(
+            "SELECT data FROM sessions WHERE session_id = ? AND expires_at >= ?", (session_id, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def put_many(self, items):
+        now = time.time()
+        with self._db() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO sessions (session_id, data, expires_at, updated_at) VALUES (?, ?, ?, ?)",
+                [(session_id, blob, expires_at, now) for session_id, blob, expires_at in items],
+            )
+
+    def delete(self, session_id):
+        with self._db() as conn:
+            conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def purge_expired(self):
+        with self._db() as conn:
+            return conn.execute("DELETE FROM sessions WHERE expires_at < ?", (time.time(),)).rowcount
+
+    def stats(self):
+        sessions, expired, size = self._db().execute(
+            "SELECT count(*), sum(expires_at < ?), coalesce(sum(length(data)), 0) FROM sessions", (time.time(),)
+        ).fetchone()
+        return {"sessions": sessions, "expired": expired or 0, "bytes": size,
+                "file_bytes": os.path.getsize(self.path)}
+
+
+def make_backend(name=SESSION_STORE):
+    if name == "sqlite":
+        return SQLiteBackend()
+    if name == "memory":
+        return MemoryBackend()
+    module, _, cls = name.partition(":")
+    return getattr(importlib.import_module(module), cls)()
+
+
+# -----------------------------------------------------------------------------
+# Write-behind cache
+# -----------------------------------------------------------------------------
+
+class SessionStore:
+    """Write-behind cache in front of a backend (one per process)."""
+
+    def __init__(self, backend, ttl=SESSION_TTL, flush_ms=SESSION_FLUSH_MS):
+        self.backend = backend
+        self.ttl = ttl
+        self.interval = flush_ms / 1000
+        self.lock = threading.Lock()
+        self.pending = {}             # session_id -> (blob, expires_at), not yet written
+        self.written = OrderedDict()  # session_id -> (last blob saved, its expires_at), to skip unchanged saves
+        self.wake = threading.Event()
+        self.thread = None
+        self.last_purge = time.time()
+        self.stats = {"saves": 0, "unchanged": 0, "refreshes": 0, "flushes": 0, "records_written": 0,
+                      "loads": 0, "load_misses": 0, "flush_errors": 0}
+
+    def _count(self, name, n=1):
+        with self.lock:
+            self.stats[name] += n
+
+    def save(self, state, category):
+        """Queue the session's current record (serialized now, written by the flusher)."""
+        record = session_record(state, category)
+        blob = encode(record)
+        session_id = record["session_id"]
+        now = time.time()
+        with self.lock:
+            last = self.written.get(session_id)
+            if last is not None and last[0] == blob:
+                self.stats["unchanged"] += 1
+                if last[1] - now > self.ttl - TTL_REFRESH:
+                    return False
+                self.stats["refreshes"] += 1  # Same record, written again only to move its expiry
+            else:
+                self.stats["saves"] += 1
+            self.written[session_id] = (blob, now + self.ttl)
+            self.written.move_to_end(session_id)
+            while len(self.written) > MAX_TRACKED:
+                self.written.popitem(last=False)
+            self.pending[session_id] = (blob, now + self.ttl)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="session-flush", daemon=True)
+                self.thread.start()
+        return True
+
+    def load(self, session_id):
+        """The saved record for session_id, or None."""
+        if not session_id:
+            return None
+        with self.lock:
+            item = self.pending.get(session_id)
+        blob = item[0] if item else self.backend.get(session_id)
+        if blob is None:
+            self._count("load_misses")
+            return None
+        self._count("loads")
+        try:
+            record = decode(blob)
+        except (zlib.error, ValueError) as e:
+            print(f"DEBUG: Unreadable session record {session_id[:8]}: {e}", flush=True)
+            return None
+        if record.get("v") != RECORD_VERSION:
+            return None
+        with self.lock:
+            self.written[session_id] = (blob, 0.0)  # Expiry unknown: the next save re-queues it
+        return record
+
+    def delete(self, session_id):
+        with self.lock:
+            self.pending.pop(session_id, None)
+            self.written.pop(session_id, None)
+        self.backend.delete(session_id)
+
+    def flush(self):
+        """Write every pending record now."""
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        if not pending:
+            return 0
+        try:
+            self.backend.put_many([(sid, blob, expires_at) for sid, (blob, expires_at) in pending.items()])
+        except Exception as e:
+            print(f"DEBUG: Session store write failed ({len(pending)} records): {e}", flush=True)
+            with self.lock:
+                for sid, item in pending.items():
+                    self.pending.setdefault(sid, item)  # Retried next flush unless a newer record arrived
+                self.stats["flush_errors"] += 1
+            return 0
+        with self.lock:
+            self.stats["flushes"] += 1
+            self.stats["records_written"] += len(pending)
+        return len(pending)
+
+    def _run(self):
+        while True:
+            self.wake.wait(self.interval)
+            self.wake.clear()
+            self.flush()
+            if time.time() - self.last_purge > PURGE_EVERY:
+                self.last_purge = time.time()
+                try:
+                    purged = self.backend.purge_expired()
+                    if purged:
+                        print(f"DEBUG: Purged {purged} expired session records", flush=True)
+                except Exception as e:
+                    print(f"DEBUG: Session purge failed: {e}", flush=True)
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats, pending=len(self.pending))
+        return stats
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """The process-wide SessionStore (created on first use)."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = SessionStore(make_backend())
+                atexit.register(_store.flush)
+    return _store
+
+
+def restore(state, session_id, category):
+    """Fill a new Streamlit session's state from the store. Returns True if found (under `category`)."""
+    try:
+        record = get_store().load(session_id)
+    except Exception as e:
+        print(f"DEBUG: Session restore failed: {e}", flush=True)
+        return False
+    if record is None:
+        return False
+    if record.get("category") != category:
+        print(f"DEBUG: Session {session_id[:8]} belongs to the {record.get('category')} bot, not restored", flush=True)
+        return False
+    apply_record(state, record)
+    print(f"DEBUG: Restored session {session_id[:8]} ({len(record['conversation']['transcript'])} messages)",
+          flush=True)
+    return True
+
+
+def persist(state, category):
+    """Queue the session's state for writing (no-op if nothing changed)."""
+    try:
+        return get_store().save(state, category)
+    except Exception as e:
+        print(f"DEBUG: Session save failed: {e}", flush=True)
+        return False
+
+
+# -----------------------------------------------------------------------------
+# CLI
+# -----------------------------------------------------------------------------
+
+def bench(turns=20, sessions=2000):
+    """Record size, and the cost of save / flush / load for a chat of `turns` questions."""
+    import pickle
+    import tempfile
+
+    conversation = ConversationStore("Hello! Welcome to the Member Help Center. To get started, please tell me your name.")
+    conversation.append("user", "Alex", onboarding=True)
+    conversation.append("assistant", "How can I help you, Alex?", onboarding=True)
+    answer = ("To opt out of Nest, log in to your account and select 'Opt out' from the menu. You need to do "
+              "this within the opt-out period, which is one month from your enrolment date. ") * 4
+    for i in range(turns):
+        conversation.append("user", f"Question {i}: how do I opt out of my pension after being enrolled?")
+        conversation.append("assistant", f"({i}) {answer}", sources=["https://www.nestpensions.org.uk/opting-out.html"])
+    state = {"session_id": "0" * 36, "conversation": conversation, "conversation_step": "READY",
+             "user_name": "Alex", "last_prediction": "Opt-out refunds", "chat_ended": False}
+    record = session_record(state, "Member")
+    raw = json.dumps(record, separators=(",", ":")).encode("utf-8")
+    blob = encode(record)
+    print(f"Record for {turns} questions: pickle of the objects {len(pickle.dumps(state))} B, "
+          f"JSON {len(raw)} B, JSON+zlib {len(blob)} B")
+
+    directory = tempfile.mkdtemp(prefix="session_store_")
+    path = os.path.join(directory, "sessions.db")
+    store = SessionStore(SQLiteBackend(path), flush_ms=10**9)  # Flushed by hand below
+    start = time.perf_counter()
+    for n in range(sessions):
+        state["session_id"] = f"{n:08d}-bench"
+        store.save(state, "Member")
+    save_ms = (time.perf_counter() - start) * 1000 / sessions
+    start = time.perf_counter()
+    store.save(state, "Member")
+    unchanged_ms = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    store.flush()
+    flush_ms = (time.perf_counter() - start) * 1000
+
+    synchronous = SQLiteBackend(path)
+    start = time.perf_counter()
+    for n in range(200):
+        synchronous.put_many([(f"{n:08d}-sync", blob, time.time() + 60)])
+    sync_ms = (time.perf_counter() - start) * 1000 / 200
+
+    cold = SessionStore(SQLiteBackend(path))  # Another worker: nothing pending or cached
+    start = time.perf_counter()
+    for n in range(sessions):
+        restored = {}
+        apply_record(restored, cold.load(f"{n:08d}-bench"))
+    load_ms = (time.perf_counter() - start) * 1000 / sessions
+    assert restored["conversation"].transcript == conversation.transcript
+    assert restored["conversation"].messages == conversation.messages
+
+    print(f"save(), write-behind:     {save_ms:.3f} ms per run (serialize + queue)")
+    print(f"save(), nothing changed:  {unchanged_ms:.3f} ms")
+    print(f"flush of {sessions} sessions:  {flush_ms:.1f} ms ({flush_ms / sessions:.3f} ms per record, one transaction)")
+    print(f"write per save, no cache: {sync_ms:.3f} ms (one transaction per save)")
+    print(f"load + restore, other worker: {load_ms:.3f} ms")
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    os.rmdir(directory)
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command == "stats":
+        print(make_backend().stats())
+    elif command == "purge":
+        print(f"Purged {make_backend().purge_expired()} expired session records")
+    elif command == "bench":
+        bench()
+    else:
+        print(__doc__)
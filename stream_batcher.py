@@ -0,0 +1,66 @@
+"""
+Stream Batcher - Coalesce LLM deltas before they reach st.write_stream.
+
+st.write_stream re-renders the whole answer as markdown and sends a
+websocket message to the browser for every chunk it receives. Groq streams
+a delta every token or two, so a 300-token answer costs hundreds of full
+re-renders. batch_stream() groups the deltas so the UI updates a few times
+per second instead:
+  - the first chunk is passed through immediately (time-to-first-token is
+    unchanged);
+  - after that, text is buffered and flushed once the buffer ends a
+    sentence (and holds at least MIN_FLUSH_CHARS), grows past
+    MAX_FLUSH_CHARS, or is older than FLUSH_INTERVAL_SECONDS;
+  - whatever is left is flushed when the upstream stream ends or fails.
+
+Settings (environment variables):
+    STREAM_FLUSH_INTERVAL   seconds between UI updates at most   (default 0.15)
+    STREAM_FLUSH_CHARS      flush once this many chars buffered   (default 400)
+"""
+import os
+import re
+import time
+
+FLUSH_INTERVAL_SECONDS = float(os.environ.get("STREAM_FLUSH_INTERVAL", "0.15"))
+MAX_FLUSH_CHARS = int(os.environ.get("STREAM_FLUSH_CHARS", "400"))
+MIN_FLUSH_CHARS = 40
+# End of a sentence, list item or paragraph (optionally followed by whitespace)
+SENTENCE_END = re.compile(r"(?:[.!?:](?:[\"')\]*]*)|\n)\s*$")
+
+
+def batch_stream(chunks, interval=FLUSH_INTERVAL_SECONDS, max_chars=MAX_FLUSH_CHARS,
+                 min_chars=MIN_FLUSH_CHARS, clock=time.monotonic):
+    """Yield the text of `chunks` regrouped into fewer, larger pieces.
+
+    The concatenation of what is yielded always equals the concatenation of
+    the input. Flush decisions are made as chunks arrive, so a batch is
+    never held back waiting on a timer.
+    """
+    buffer = []
+    buffered = 0
+    first = True
+    last_flush = clock()
+    try:
+        for chunk in chunks:
+            if not chunk:
+                continue
+            if first:
+                first = False
+                last_flush = clock()
+                yield chunk
+                continue
+            buffer.append(chunk)
+            buffered += len(chunk)
+            now = clock()
+            if (buffered >= max_chars
+                    or now - last_flush >= interval
+                    or (buffered >= min_chars and SENTENCE_END.search(chunk))):
+                yield "".join(buffer)
+                buffer, buffered, last_flush = [], 0, now
+    except Exception:
+        # Show what already arrived before the error reaches the caller
+        if buffer:
+            yield "".join(buffer)
+        raise
+    if buffer:
+        yield "".join(buffer)
@@ -0,0 +1,43 @@
+"""
+Tests for chat_analytics.py: compacting part files keeps the latest row per key.
+
+Usage:
+    python -m pytest -q test_chat_analytics.py
+"""
+import glob
+import os
+
+import chat_analytics as ca
+
+
+def _turn(session_id, turn, content):
+    return {"session_id": session_id, "turn": turn, "role": "user", "content": content,
+            "time": "2026-01-01T10:00:00", "sources": []}
+
+
+def _rating(session_id, rating):
+    return {"session_id": session_id, "rating": rating, "text": "", "time": "2026-01-01T10:05:00"}
+
+
+def test_compact_keeps_latest_row_per_key(tmp_path):
+    root = str(tmp_path)
+    ca._write_part(ca.feedback_table([_rating("a", 2), _rating("b", 3)]), "feedback", root)
+    ca._write_part(ca.feedback_table([_rating("a", 9), _rating("c", 10)]), "feedback", root)
+    ca._write_part(ca.turns_table([_turn("a", 0, "old"), _turn("b", 0, "hi")]), "turns", root)
+    ca._write_part(ca.turns_table([_turn("a", 0, "new"), _turn("c", 0, "hey")]), "turns", root)
+
+    _, feedback = ca.load_tables(root)
+    before = ca.rating_summary(feedback)
+    ca.compact(root)
+
+    assert len(glob.glob(os.path.join(root, "feedback", "*.parquet"))) == 1
+    turns, feedback = ca.load_tables(root)
+    assert sorted(zip(feedback["session_id"].to_pylist(), feedback["rating"].to_pylist())) == \
+        [("a", 9), ("b", 3), ("c", 10)]
+    assert sorted(zip(turns["session_id"].to_pylist(), turns["content"].to_pylist())) == \
+        [("a", "new"), ("b", "hi"), ("c", "hey")]
+
+    summary = ca.rating_summary(feedback)
+    assert summary == before
+    assert summary["rated_sessions"] == 3
+    assert abs(summary["average_rating"] - 22 / 3) < 1e-9
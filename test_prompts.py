@@ -0,0 +1,37 @@
+"""
+Tests for prompts.py: the answer prompt's first message is a stable, cacheable prefix.
+
+Usage:
+    python -m pytest -q test_prompts.py
+"""
+import os
+from datetime import datetime, timedelta
+
+import bench_prompts
+import llm_client
+from prompts import ANSWER_INSTRUCTIONS, answer_messages
+
+
+def test_first_message_is_identical_across_turns():
+    history, first = [], set()
+    for turn in range(6):
+        query = f"Question {turn}"
+        history.append({"role": "user", "content": query})
+        messages = answer_messages(
+            query, f"Source (Member): article {turn}\ncontent {turn}",
+            date_result="Your opt-out period ends on 5 March 2026." if turn % 2 else "",
+            summary="Member asked about opting out." if turn >= 3 else "",
+            history=history, today=datetime(2026, 1, 31, 22) + timedelta(hours=turn),
+        )
+        first.add(messages[0]["content"].encode("utf-8"))
+        history.append({"role": "assistant", "content": f"Answer {turn}"})
+    assert first == {ANSWER_INSTRUCTIONS.encode("utf-8")}
+
+
+def test_mock_backend_reuses_prefix(monkeypatch):
+    monkeypatch.chdir(os.path.dirname(os.path.abspath(__file__)))
+    monkeypatch.setattr(llm_client, "BASE_URL", llm_client.BASE_URL)  # check() points it at the mock
+    try:
+        bench_prompts.check(4)
+    finally:
+        llm_client.reset_llm_client()
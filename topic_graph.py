@@ -0,0 +1,300 @@
+"""
+Topic Graph - Precomputed follow-up suggestions between help articles.
+
+An offline build links every article in scraped_content.json to its most
+related neighbours using three signals:
+  - embedding similarity between articles (from the category shard),
+  - markdown links one article makes to another,
+  - articles asked about one after the other in chat_logs.csv transcripts.
+At runtime the follow-up topic is a dictionary lookup on the retrieved
+article URLs instead of an extra LLM round trip.
+
+Usage:
+    python topic_graph.py build             # writes data/topic_graph.json
+    python topic_graph.py compare           # graph vs LLM on the benchmark queries
+"""
+import csv
+import json
+import os
+import re
+import sys
+import threading
+import time
+from datetime import datetime
+
+INPUT_FILE = "data/scraped_content.json"
+CHAT_LOGS_FILE = "data/chat_logs.csv"
+BENCHMARK_FILE = "data/benchmark_queries.json"
+GRAPH_FILE = "data/topic_graph.json"
+
+NEIGHBOURS_PER_ARTICLE = 5
+MAX_EDGES_PER_ARTICLE = 8
+EMBED_WEIGHT = 1.0
+LINK_WEIGHT = 0.5
+CHAT_WEIGHT = 0.75
+# Chat turns further than this (Chroma squared-L2 distance on normalised vectors)
+# from every article are not mapped to one
+CHAT_MATCH_MAX_DISTANCE = 0.8
+
+LINK_PATTERN = re.compile(r"\]\((https?://[^)\s]+)\)")
+
+_lock = threading.Lock()
+_graph = None
+_graph_mtime = None
+
+
+# -----------------------------------------------------------------------------
+# Offline build
+# -----------------------------------------------------------------------------
+
+def load_articles():
+    """One node per article URL (the scraped data can contain repeats)."""
+    with open(INPUT_FILE, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    articles = {}
+    for item in data:
+        articles.setdefault(item["url"], item)
+    return articles
+
+
+def add_edge(edges, a, b, weight):
+    if a == b:
+        return
+    edges.setdefault(a, {})
+    edges[a][b] = edges[a].get(b, 0.0) + weight
+
+
+def embedding_edges(articles, edges):
+    """Link each article to its nearest neighbours in embedding space."""
+    import numpy as np
+    from retrieval import get_shard
+
+    for category in sorted({item["category"] for item in articles.values()}):
+        collection, where = get_shard(category)
+        stored = collection.get(where=where, include=["embeddings", "metadatas"])
+
+        urls, vectors = [], []
+        for meta, vector in zip(stored["metadatas"], stored["embeddings"]):
+            if meta["url"] in articles and meta["url"] not in urls:
+                urls.append(meta["url"])
+                vectors.append(vector)
+        if len(urls) < 2:
+            continue
+
+        matrix = np.asarray(vectors, dtype=np.float32)
+        matrix /= np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-12
+        similarity = matrix @ matrix.T
+        np.fill_diagonal(similarity, -1.0)
+
+        k = min(NEIGHBOURS_PER_ARTICLE, len(urls) - 1)
+        for i, url in enumerate(urls):
+            for j in np.argsort(-similarity[i])[:k]:
+                add_edge(edges, url, urls[j], EMBED_WEIGHT * float(similarity[i, j]))
+        print(f"[{category}] Embedding neighbours for {len(urls)} articles")
+
+
+def link_edges(articles, edges):
+    """Link articles that point at each other in their content."""
+    count = 0
+    for url, item in articles.items():
+        for target in set(LINK_PATTERN.findall(item["content"])):
+            target = target.split("#")[0]
+            if target in articles and target != url:
+                add_edge(edges, url, target, LINK_WEIGHT)
+                add_edge(edges, target, url, LINK_WEIGHT / 2)
+                count += 1
+    print(f"Shared links: {count}")
+
+
+def parse_user_turns(transcript):
+    """User messages from a chat_logs.csv transcript, skipping the name turn."""
+    turns = []
+    current = None
+    for line in transcript.splitlines():
+        if line.startswith("User: "):
+            current = [line[len("User: "):]]
+            turns.append(current)
+        elif line.startswith("Assistant: "):
+            current = None
+        elif current is not None:
+            current.append(line)
+    return [" ".join(parts).strip() for parts in turns[1:]]
+
+
+def chat_edges(articles, edges):
+    """Link articles that members asked about one after the other."""
+    if not os.path.exists(CHAT_LOGS_FILE):
+        print(f"{CHAT_LOGS_FILE} not found, skipping chat co-occurrence.")
+        return
+    from retrieval import DEFAULT_CATEGORY, query_rag
+
+    # Transcripts don't record a category; the chat logs come from the Member bot
+    pairs = 0
+    with open(CHAT_LOGS_FILE, mode="r", newline="", encoding="utf-8") as file:
+        for row in csv.DictReader(file):
+            previous = None
+            for question in parse_user_turns(row.get("Transcript") or ""):
+                results = query_rag(question, DEFAULT_CATEGORY, n_results=1)
+                if not results["ids"][0] or results["distances"][0][0] > CHAT_MATCH_MAX_DISTANCE:
+                    continue
+                url = results["metadatas"][0][0]["url"]
+                if previous and previous != url and url in articles:
+                    add_edge(edges, previous, url, CHAT_WEIGHT)
+                    pairs += 1
+                previous = url
+    print(f"Chat co-occurrence pairs: {pairs}")
+
+
+def topic_label(item):
+    """Short topic text shown to the user for an article."""
+    return item["header"].strip().rstrip("?").strip()
+
+
+def build_graph():
+    if not os.path.exists(INPUT_FILE):
+        print(f"Input file {INPUT_FILE} not found. Run scraper.py first.")
+        return None
+
+    articles = load_articles()
+    edges = {}
+    embedding_edges(articles, edges)
+    link_edges(articles, edges)
+    chat_edges(articles, edges)
+
+    graph = {
+        "built_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "nodes": {
+            url: {"label": topic_label(item), "category": item["category"]}
+            for url, item in articles.items()
+        },
+        "edges": {
+            url: [
+                [target, round(weight, 4)]
+                for target, weight in sorted(targets.items(), key=lambda kv: -kv[1])[:MAX_EDGES_PER_ARTICLE]
+            ]
+            for url, targets in edges.items()
+        },
+    }
+    with open(GRAPH_FILE, "w", encoding="utf-8") as f:
+        json.dump(graph, f, indent=2)
+    print(f"Topic graph saved to {GRAPH_FILE}: {len(graph['nodes'])} nodes")
+    return graph
+
+
+# -----------------------------------------------------------------------------
+# Runtime lookup
+# -----------------------------------------------------------------------------
+
+def load_graph():
+    """Load the graph once, reloading only if the file is rebuilt."""
+    global _graph, _graph_mtime
+    try:
+        mtime = os.path.getmtime(GRAPH_FILE)
+    except OSError:
+        return None
+    if _graph is not None and mtime == _graph_mtime:
+        return _graph
+    with _lock:
+        if _graph is None or mtime != _graph_mtime:
+            with open(GRAPH_FILE, "r", encoding="utf-8") as f:
+                _graph = json.load(f)
+            _graph_mtime = mtime
+    return _graph
+
+
+def suggest_follow_up(retrieved_urls, exclude_labels=()):
+    """Best follow-up topic for the retrieved articles, or "" if the graph has none.
+
+    Neighbours of higher-ranked hits count more; articles already retrieved
+    (and topics already suggested) are never suggested again.
+    """
+    graph = load_graph()
+    if not graph:
+        return ""
+
+    retrieved = set(retrieved_urls)
+    scores = {}
+    for rank, url in enumerate(retrieved_urls):
+        for target, weight in graph["edges"].get(url, []):
+            if target not in retrieved:
+                scores[target] = scores.get(target, 0.0) + weight / (rank + 1)
+
+    for target in sorted(scores, key=scores.get, reverse=True):
+        label = graph["nodes"][target]["label"]
+        if label not in exclude_labels:
+            return label
+    return ""
+
+
+# -----------------------------------------------------------------------------
+# Graph vs LLM comparison
+# -----------------------------------------------------------------------------
+
+def compare_with_llm(category="Member"):
+    """Score graph and LLM suggestions on the benchmark queries.
+
+    A suggestion is 'grounded' if asking about it retrieves an article close
+    enough to answer, and 'novel' if that article wasn't already retrieved.
+    """
+    from groq import Groq
+    from retrieval import query_rag
+
+    model = os.environ.get("GROQ_MODEL", "llama-3.1-8b-instant")
+    client = Groq(api_key=os.environ["GROQ_API_KEY"])
+    with open(BENCHMARK_FILE, "r", encoding="utf-8") as f:
+        queries = [item["query"] for item in json.load(f)]
+
+    def score(suggestion, retrieved_urls):
+        if not suggestion:
+            return False, False
+        results = query_rag(f"Tell me more about {suggestion}", category, n_results=1)
+        if not results["ids"][0]:
+            return False, False
+        grounded = results["distances"][0][0] <= CHAT_MATCH_MAX_DISTANCE
+        novel = results["metadatas"][0][0]["url"] not in retrieved_urls
+        return grounded, grounded and novel
+
+    totals = {"graph": [0, 0, 0.0], "llm": [0, 0, 0.0]}
+    for query in queries:
+        results = query_rag(query, category)
+        urls = [meta["url"] for meta in results["metadatas"][0]]
+        context = "\n".join(doc[:300] for doc in results["documents"][0])
+
+        start = time.perf_counter()
+        graph_topic = suggest_follow_up(urls)
+        graph_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        response = client.chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": (
+                f"Based on the user's question: '{query}' and your answer: '{context}', "
+                "predict ONE likely follow-up topic keywords based on the context. "
+                "Output ONLY the topic keywords (e.g. 'Opting Out', 'Pension Transfer'). "
+            )}],
+            stream=False
+        )
+        llm_topic = response.choices[0].message.content.strip()
+        llm_ms = (time.perf_counter() - start) * 1000
+
+        for name, topic, elapsed in (("graph", graph_topic, graph_ms), ("llm", llm_topic, llm_ms)):
+            grounded, novel = score(topic, urls)
+            totals[name][0] += grounded
+            totals[name][1] += novel
+            totals[name][2] += elapsed
+        print(f"{query}\n  graph ({graph_ms:.3f} ms): {graph_topic}\n  llm   ({llm_ms:.0f} ms): {llm_topic}")
+
+    n = len(queries)
+    print("\nSource  Grounded  Novel+Grounded  Avg latency")
+    for name, (grounded, novel, elapsed) in totals.items():
+        print(f"{name:<7} {grounded}/{n:<7} {novel}/{n:<13} {elapsed / n:.3f} ms")
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "build"
+    if command == "build":
+        build_graph()
+    elif command == "compare":
+        compare_with_llm()
+    else:
+        print(__doc__)
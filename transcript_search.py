@@ -0,0 +1,399 @@
+"""
+Transcript Search - Full-text index over chat transcripts for support lookups.
+
+Support staff look up past chats by member name, session id or a phrase.
+Until now that meant scanning data/chat_logs.csv (or the Google Sheet)
+row by row. feedback_manager.log_chat also writes each chat here when it
+ends, and update_feedback_log adds the rating. The index is a SQLite file
+(TRANSCRIPT_DB, default data/transcripts.db):
+
+    chats       one row per chat: session_id, member_name, logged_at, rating, feedback_text
+    turns       one row per message: session_id, turn, role, content, time
+    turns_fts   FTS5 index over turns.content (external content, kept in step by triggers)
+
+Searches go through the FTS5 index and the chats table's indexes, so their
+cost depends on the number of hits, not on the size of the log. Results
+are newest first. A phrase search alone walks the FTS5 rowids backwards
+and stops at the limit. With a name, session or end date it walks those
+chats (newest first, by index) and probes the FTS5 index once per chat
+for its range of turn ids instead. --rank orders by BM25, which reads every match.
+
+Query syntax: words must all appear (any order), "quoted words" must
+appear as a phrase, word* matches a prefix. Case and accents are ignored.
+
+Usage:
+    python transcript_search.py search "opt out" refund* [--name niraj] [--since 2026-01-01]
+                                       [--until 2026-01-31] [--min-rating 1] [--max-rating 4] [--rank]
+    python transcript_search.py search --session c31ae4a3      # chats only, no phrase
+    python transcript_search.py show SESSION_ID
+    python transcript_search.py import [data/chat_logs.csv]     # backfill chats logged before the index
+    python transcript_search.py bench [--turns 2000000]         # latency as the log grows
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import re
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+DB_PATH = os.environ.get("TRANSCRIPT_DB", "data/transcripts.db")
+DEFAULT_LIMIT = 20
+SNIPPET_TOKENS = 12
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chats (
+    session_id TEXT PRIMARY KEY,
+    member_name TEXT COLLATE NOCASE,
+    logged_at TEXT,
+    rating INTEGER,
+    feedback_text TEXT
+);
+CREATE INDEX IF NOT EXISTS chats_logged_at ON chats (logged_at);
+CREATE INDEX IF NOT EXISTS chats_member_name ON chats (member_name);
+CREATE TABLE IF NOT EXISTS turns (
+    id INTEGER PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    turn INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    time TEXT
+);
+CREATE INDEX IF NOT EXISTS turns_session ON turns (session_id, turn);
+CREATE VIRTUAL TABLE IF NOT EXISTS turns_fts USING fts5(
+    content, content='turns', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+);
+CREATE TRIGGER IF NOT EXISTS turns_ai AFTER INSERT ON turns BEGIN
+    INSERT INTO turns_fts (rowid, content) VALUES (new.id, new.content);
+END;
+CREATE TRIGGER IF NOT EXISTS turns_ad AFTER DELETE ON turns BEGIN
+    INSERT INTO turns_fts (turns_fts, rowid, content) VALUES ('delete', old.id, old.content);
+END;
+"""
+TRANSCRIPT_LINE = re.compile(r"^(User|Assistant|System): ", re.MULTILINE)
+QUERY_TERM = re.compile(r'"[^"]*"?|\S+')
+
+_db_local = threading.local()
+
+
+def connect(path=None):
+    """Per-thread connection to the index (created on first use)."""
+    path = path or DB_PATH
+    conns = getattr(_db_local, "conns", None)
+    if conns is None:
+        conns = _db_local.conns = {}
+    conn = conns.get(path)
+    if conn is None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        conn = sqlite3.connect(path, timeout=5.0)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        conns[path] = conn
+    return conn
+
+
+def _now():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _turn_rows(session_id, messages, logged_at):
+    return [
+        (session_id, turn, msg["role"], msg["content"], msg.get("time") or logged_at)
+        for turn, msg in enumerate(messages)
+        if msg["role"] != "system" and msg.get("content")
+    ]
+
+
+def index_chat(session_id, member_name, conversation_history, logged_at=None, rating=None, feedback_text=None,
+               path=None):
+    """Add (or replace) one chat. Called by feedback_manager.log_chat when a chat ends."""
+    logged_at = logged_at or _now()
+    conn = connect(path)
+    with conn:
+        conn.execute(
+            "INSERT INTO chats (session_id, member_name, logged_at, rating, feedback_text) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (session_id) DO UPDATE SET member_name = excluded.member_name, "
+            "logged_at = excluded.logged_at, rating = COALESCE(excluded.rating, rating), "
+            "feedback_text = COALESCE(excluded.feedback_text, feedback_text)",
+            (session_id, member_name, logged_at, rating, feedback_text),
+        )
+        conn.execute("DELETE FROM turns WHERE session_id = ?", (session_id,))
+        conn.executemany(
+            "INSERT INTO turns (session_id, turn, role, content, time) VALUES (?, ?, ?, ?, ?)",
+            _turn_rows(session_id, conversation_history, logged_at),
+        )
+
+
+def set_feedback(session_id, rating, text, path=None):
+    """Record the rating of an indexed chat (or of one that isn't indexed yet)."""
+    conn = connect(path)
+    with conn:
+        conn.execute(
+            "INSERT INTO chats (session_id, rating, feedback_text) VALUES (?, ?, ?) "
+            "ON CONFLICT (session_id) DO UPDATE SET rating = excluded.rating, feedback_text = excluded.feedback_text",
+            (session_id, int(rating), text),
+        )
+
+
+def to_match(text):
+    """FTS5 MATCH expression for a search box query (no FTS syntax errors from user input)."""
+    terms = []
+    for term in QUERY_TERM.findall(text or ""):
+        if term.startswith('"'):
+            phrase = term.strip('"').strip()
+            if phrase:
+                terms.append('"' + phrase.replace('"', "") + '"')
+        elif term.endswith("*") and term.rstrip("*"):
+            terms.append('"' + term.rstrip("*").replace('"', "") + '"*')
+        else:
+            terms.append('"' + term.replace('"', "") + '"')
+    return " ".join(terms)
+
+
+def _chat_filters(name=None, session=None, since=None, until=None, min_rating=None, max_rating=None):
+    where, params = [], []
+    if name:
+        where.append("c.member_name LIKE ? ESCAPE '\\'")
+        params.append(re.sub(r"([%_\\])", r"\\\1", name) + "%")
+    if session:
+        where.append("c.session_id GLOB ?")  # Prefix match on the primary key index
+        params.append(re.sub(r"[^0-9A-Za-z-]", "", session) + "*")
+    if since:
+        where.append("c.logged_at >= ?")
+        params.append(since)
+    if until:
+        where.append("c.logged_at < date(?, '+1 day')")
+        params.append(until)
+    if min_rating is not None:
+        where.append("c.rating >= ?")
+        params.append(min_rating)
+    if max_rating is not None:
+        where.append("c.rating <= ?")
+        params.append(max_rating)
+    return where, params
+
+
+def search(query=None, name=None, session=None, since=None, until=None, min_rating=None, max_rating=None,
+           rank=False, limit=DEFAULT_LIMIT, path=None):
+    """Matching turns (with a snippet) for a phrase query, or matching chats without one."""
+    where, params = _chat_filters(name, session, since, until, min_rating, max_rating)
+    conn = connect(path)
+    match = to_match(query)
+    if not match:
+        sql = ("SELECT c.session_id, c.member_name, c.logged_at, c.rating, "
+               "(SELECT content FROM turns t WHERE t.session_id = c.session_id AND t.role = 'user' "
+               "ORDER BY t.turn LIMIT 1) FROM chats c"
+               + (" WHERE " + " AND ".join(where) if where else "")
+               + " ORDER BY c.logged_at DESC LIMIT ?")
+        keys = ("session_id", "member_name", "logged_at", "rating", "first_message")
+    else:
+        columns = ("SELECT t.session_id, c.member_name, c.logged_at, c.rating, t.turn, t.role, "
+                   f"snippet(turns_fts, 0, '[', ']', '...', {SNIPPET_TOKENS}) ")
+        if (name or session or until) and not rank:
+            # Selective chat filter: walk the matching chats newest first and look each one's
+            # turn ids up in the FTS index (one range probe per chat), rather than walking
+            # every newer match in the index. A chat's turns are inserted together, so their
+            # ids are contiguous. "+logged_at" makes SQLite use the name / session index.
+            order = "+c.logged_at" if name or session else "c.logged_at"
+            sql = (columns + "FROM chats c CROSS JOIN turns_fts CROSS JOIN turns t ON t.id = turns_fts.rowid "
+                   "WHERE turns_fts MATCH ? AND turns_fts.rowid BETWEEN "
+                   "(SELECT min(id) FROM turns WHERE session_id = c.session_id) AND "
+                   "(SELECT max(id) FROM turns WHERE session_id = c.session_id)"
+                   + "".join(" AND " + clause for clause in where) + f" ORDER BY {order} DESC, t.turn LIMIT ?")
+        else:
+            sql = (columns + "FROM turns_fts JOIN turns t ON t.id = turns_fts.rowid "
+                   "JOIN chats c ON c.session_id = t.session_id WHERE turns_fts MATCH ?"
+                   + "".join(" AND " + clause for clause in where)
+                   + (" ORDER BY turns_fts.rank" if rank else " ORDER BY turns_fts.rowid DESC") + " LIMIT ?")
+        keys = ("session_id", "member_name", "logged_at", "rating", "turn", "role", "snippet")
+        params = [match] + params
+    try:
+        rows = conn.execute(sql, params + [limit]).fetchall()
+    except sqlite3.OperationalError as e:
+        print(f"DEBUG: Transcript search failed ({match!r}): {e}", flush=True)
+        return []
+    return [dict(zip(keys, row)) for row in rows]
+
+
+def transcript(session_id, path=None):
+    """(chat row, [turns]) for one session id (or unique prefix)."""
+    conn = connect(path)
+    chat = conn.execute(
+        "SELECT session_id, member_name, logged_at, rating, feedback_text FROM chats WHERE session_id GLOB ? LIMIT 2",
+        (re.sub(r"[^0-9A-Za-z-]", "", session_id) + "*",),
+    ).fetchall()
+    if len(chat) != 1:
+        return None, []
+    turns = conn.execute(
+        "SELECT turn, role, content, time FROM turns WHERE session_id = ? ORDER BY turn", (chat[0][0],)
+    ).fetchall()
+    return chat[0], turns
+
+
+def import_csv(csv_path=None, path=None):
+    """Index chats from the CSV log that aren't indexed yet."""
+    if csv_path is None:
+        from feedback_manager import FEEDBACK_FILE
+        csv_path = FEEDBACK_FILE
+    conn = connect(path)
+    known = {row[0] for row in conn.execute("SELECT session_id FROM chats WHERE logged_at IS NOT NULL")}
+    added = 0
+    with open(csv_path, "r", newline="", encoding="utf-8") as f, conn:
+        reader = csv.reader(f)
+        next(reader, None)
+        for row in reader:
+            if len(row) < 7 or row[2] in known:
+                continue
+            parts = TRANSCRIPT_LINE.split(row[4])
+            messages = [{"role": parts[i].lower(), "content": parts[i + 1].strip()} for i in range(1, len(parts) - 1, 2)]
+            rating = int(row[5]) if row[5].strip().isdigit() else None
+            conn.execute(
+                "INSERT OR REPLACE INTO chats (session_id, member_name, logged_at, rating, feedback_text) "
+                "VALUES (?, ?, ?, ?, ?)", (row[2], row[3], row[1], rating, row[6] or None),
+            )
+            conn.execute("DELETE FROM turns WHERE session_id = ?", (row[2],))
+            conn.executemany("INSERT INTO turns (session_id, turn, role, content, time) VALUES (?, ?, ?, ?, ?)",
+                             _turn_rows(row[2], messages, row[1]))
+            known.add(row[2])
+            added += 1
+    print(f"Indexed {added} chats from {csv_path}")
+    return added
+
+
+# -----------------------------------------------------------------------------
+# Benchmark
+# -----------------------------------------------------------------------------
+
+def _synthetic_chats(rng, start, count, questions, articles):
+    """Chats of 2-10 turns from the real questions and article text."""
+    names = ["Alex", "Sam", "Priya", "Niraj", "Chloe", "Tom", "Fatima", "Oliver", "Mei", "Jack"]
+    for n in range(start, start + count):
+        session_id = f"{n:08x}-0000-4000-8000-{rng.getrandbits(48):012x}"
+        logged_at = (datetime(2026, 1, 1) + timedelta(seconds=30 * n)).strftime("%Y-%m-%d %H:%M:%S")
+        messages = []
+        for _ in range(rng.randint(1, 5)):
+            messages.append({"role": "user", "content": rng.choice(questions)})
+            article = rng.choice(articles)
+            offset = rng.randrange(len(article) - 300)
+            messages.append({"role": "assistant", "content": article[offset:offset + 300]})
+        rating = rng.randint(1, 10) if rng.random() < 0.4 else None
+        yield session_id, f"{rng.choice(names)} {n % 997}", logged_at, rating, messages
+
+
+def bench(max_turns=2_000_000, repeats=20):
+    """Query latency at growing log sizes, next to a linear LIKE scan of the same turns."""
+    rng = random.Random(7)
+    with open("data/benchmark_queries.json", "r", encoding="utf-8") as f:
+        questions = [q["query"] for q in json.load(f)]
+    with open("data/scraped_content.json", "r", encoding="utf-8") as f:
+        articles = [item["content"] for item in json.load(f) if len(item["content"]) > 400]
+    path = os.path.join(tempfile.mkdtemp(prefix="transcript_search_"), "bench.db")
+    conn = connect(path)
+    queries = {
+        "phrase":             dict(query='"opt out"'),
+        "rare word":          dict(query="beneficiary"),
+        "prefix":             dict(query="refund*"),
+        "phrase + rating":    dict(query='"tax relief"', max_rating=4),
+        "word + date range":  dict(query="password", since="2026-01-02", until="2026-01-03"),
+        "member name":        dict(name="Priya 12"),
+        "session id prefix":  dict(session="0000abc"),
+        "ranked (bm25)":      dict(query="annual allowance", rank=True),
+    }
+    checkpoints = [n for n in (10_000, 100_000, 1_000_000, 2_000_000, 5_000_000) if n <= max_turns] or [max_turns]
+    chats = turns = 0
+    print(f"{'turns':>10} {'MB':>7} " + " ".join(f"{name:>18}" for name in queries) + f" {'LIKE scan':>12}")
+    for target in checkpoints:
+        start = time.perf_counter()
+        with conn:
+            while turns < target:
+                batch = list(_synthetic_chats(rng, chats, 1000, questions, articles))
+                conn.executemany("INSERT INTO chats VALUES (?, ?, ?, ?, NULL)",
+                                 [(s, name, at, rating) for s, name, at, rating, _ in batch])
+                rows = [row for s, _, at, _, messages in batch for row in _turn_rows(s, messages, at)]
+                conn.executemany("INSERT INTO turns (session_id, turn, role, content, time) VALUES (?, ?, ?, ?, ?)",
+                                 rows)
+                chats += len(batch)
+                turns += len(rows)
+        insert_rate = (turns - (checkpoints[checkpoints.index(target) - 1] if target != checkpoints[0] else 0)) \
+            / (time.perf_counter() - start)
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        timings = []
+        for params in queries.values():
+            samples = []
+            for _ in range(repeats):
+                begin = time.perf_counter()
+                search(path=path, **params)
+                samples.append((time.perf_counter() - begin) * 1000)
+            timings.append(statistics.median(samples))
+        begin = time.perf_counter()
+        conn.execute("SELECT count(*) FROM turns WHERE content LIKE '%opt out%'").fetchone()  # Reads every turn, like the CSV
+        scan = (time.perf_counter() - begin) * 1000
+        size = os.path.getsize(path) / 1e6
+        print(f"{turns:>10} {size:>7.0f} " + " ".join(f"{ms:>15.2f} ms" for ms in timings)
+              + f" {scan:>9.0f} ms   ({insert_rate:,.0f} turns/s indexed)", flush=True)
+    conn.close()
+    _db_local.conns.pop(path, None)
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    os.rmdir(os.path.dirname(path))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Search chat transcripts.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    find = sub.add_parser("search", help="Find turns by phrase, or chats by name / session / date / rating")
+    find.add_argument("query", nargs="*", help='Words, "a phrase" or prefix*')
+    find.add_argument("--name", help="Member name (prefix, case-insensitive)")
+    find.add_argument("--session", help="Session id prefix")
+    find.add_argument("--since", help="YYYY-MM-DD")
+    find.add_argument("--until", help="YYYY-MM-DD (inclusive)")
+    find.add_argument("--min-rating", type=int)
+    find.add_argument("--max-rating", type=int)
+    find.add_argument("--rank", action="store_true", help="Best matches first (BM25) instead of newest first")
+    find.add_argument("-n", "--limit", type=int, default=DEFAULT_LIMIT)
+    show = sub.add_parser("show", help="Print one transcript")
+    show.add_argument("session_id")
+    backfill = sub.add_parser("import", help="Index chats from the CSV log")
+    backfill.add_argument("csv_path", nargs="?")
+    timing = sub.add_parser("bench", help="Query latency as the log grows (synthetic chats)")
+    timing.add_argument("--turns", type=int, default=2_000_000)
+    args = parser.parse_args(argv)
+
+    if args.command == "search":
+        start = time.perf_counter()
+        results = search(" ".join(args.query), args.name, args.session, args.since, args.until,
+                         args.min_rating, args.max_rating, args.rank, args.limit)
+        elapsed = (time.perf_counter() - start) * 1000
+        for r in results:
+            rating = f"rated {r['rating']}" if r["rating"] is not None else "unrated"
+            line = r["snippet"] if "snippet" in r else (r["first_message"] or "")
+            where = f"turn {r['turn']} ({r['role']})" if "turn" in r else ""
+            print(f"{r['logged_at'] or '':<19}  {r['session_id']}  {r['member_name'] or '':<16} {rating:<9} {where}")
+            print(f"    {' '.join(line.split())[:160]}")
+        print(f"{len(results)} result(s) in {elapsed:.1f} ms")
+    elif args.command == "show":
+        chat, turns = transcript(args.session_id)
+        if chat is None:
+            print("No single chat matches that session id")
+            return
+        session_id, member_name, logged_at, rating, feedback_text = chat
+        print(f"{session_id}  {member_name}  {logged_at}  rating: {rating if rating is not None else '-'}"
+              f"{'  ' + repr(feedback_text) if feedback_text else ''}\n")
+        for turn, role, content, at in turns:
+            print(f"[{turn}] {role.capitalize()} ({at}): {content}\n")
+    elif args.command == "import":
+        import_csv(args.csv_path)
+    elif args.command == "bench":
+        bench(args.turns)
+
+
+if __name__ == "__main__":
+    main()